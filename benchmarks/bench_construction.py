@@ -0,0 +1,32 @@
+"""
+Time the construction of synthetic XDSM models of increasing size.
+
+Construction should scale linearly with the number of systems and connections,
+so the time per element reported below should stay roughly constant.
+The models are built once with add_system/connect and once with the bulk add_systems/connect_many.
+
+    python benchmarks/bench_construction.py
+"""
+
+import time
+
+from synthetic import synthetic_xdsm
+
+
+def main(sizes=(100, 200, 400, 800), n_targets=25):
+    print("{:>8} {:>6} {:>12} {:>10} {:>16}".format("systems", "bulk", "connections", "time [s]", "time/element [us]"))
+    for n_systems in sizes:
+        for bulk in (False, True):
+            t0 = time.perf_counter()
+            x = synthetic_xdsm(n_systems, n_targets=n_targets, bulk=bulk, auto_fade={"connections": "connected"})
+            elapsed = time.perf_counter() - t0
+            n_elements = len(x.systems) + len(x.connections)
+            print(
+                "{:>8} {:>6} {:>12} {:>10.3f} {:>16.2f}".format(
+                    n_systems, str(bulk), len(x.connections), elapsed, 1e6 * elapsed / n_elements
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Compare the pdflatex compile time and TeX memory usage of a synthetic 500-system XDSM model
+written in full quality, in draft quality, and in draft quality without process chains.
+
+This benchmark requires pdflatex.
+
+    python benchmarks/bench_draft.py
+"""
+
+import shutil
+import tempfile
+
+from synthetic import synthetic_xdsm
+
+
+def main(n_systems=500, n_targets=3, repeat=3):
+    if shutil.which("pdflatex") is None:
+        print("pdflatex is required for this benchmark")
+        return
+
+    x = synthetic_xdsm(n_systems, n_targets=n_targets, bulk=True)
+    print("{} systems, {} connections".format(len(x.systems), len(x.connections)))
+
+    modes = [
+        ("full", dict(quality="full")),
+        ("draft", dict(quality="draft")),
+        ("draft, no processes", dict(quality="draft", processes=False)),
+    ]
+    outdir = tempfile.mkdtemp(prefix="bench-draft-")
+    try:
+        print("{:>22} {:>10} {:>16} {:>9}".format("", "time [s]", "memory [words]", "speed-up"))
+        full_time = None
+        for name, options in modes:
+            reports = []
+            for _ in range(repeat):
+                x.write("bench", outdir=outdir, quiet=True, profile=reports.append, **options)
+            elapsed = min(report.stages["compile"] for report in reports)
+            full_time = full_time or elapsed
+            # the main memory used by pdflatex, as reported in its log
+            memory = reports[-1].compile.memory["main_memory"][0]
+            print("{:>22} {:>10.2f} {:>16} {:>8.1f}x".format(name, elapsed, memory, full_time / elapsed))
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compare the memory held by the systems and connections of a synthetic XDSM model
+stored as lists of namedtuples with the column store (RecordTable) that XDSM uses.
+
+The labels are shared by both representations, so they are not counted.
+
+    python benchmarks/bench_memory.py
+"""
+
+import tracemalloc
+
+from synthetic import synthetic_xdsm
+
+from pyxdsm.XDSM import _CONNECTION_KINDS, _SYSTEM_KINDS, Connection, System
+from pyxdsm.table import RecordTable
+
+
+def _traced(build):
+    """Return the result of ``build()`` and the memory it allocated, in bytes."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main(sizes=(250, 500, 1000, 2000), n_targets=10):
+    print("{:>8} {:>12} {:>14} {:>14} {:>8}".format("systems", "connections", "tuples [MiB]", "table [MiB]", "ratio"))
+    for n_systems in sizes:
+        x = synthetic_xdsm(n_systems, n_targets=n_targets)
+        # plain copies of the fields, so that both representations are built from the same objects
+        sys_fields = [tuple(s) for s in x.systems]
+        conn_fields = [tuple(c) for c in x.connections]
+
+        _, tuples = _traced(
+            lambda sys_fields=sys_fields, conn_fields=conn_fields: (
+                [System(*f) for f in sys_fields],
+                [Connection(*f) for f in conn_fields],
+            )
+        )
+        _, table = _traced(
+            lambda sys_fields=sys_fields, conn_fields=conn_fields: (
+                RecordTable(System, _SYSTEM_KINDS, sys_fields),
+                RecordTable(Connection, _CONNECTION_KINDS, conn_fields),
+            )
+        )
+        print(
+            "{:>8} {:>12} {:>14.2f} {:>14.2f} {:>8.1f}".format(
+                n_systems, len(conn_fields), tuples / 2**20, table / 2**20, tuples / table
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Time the first render of a synthetic 1,000-system XDSM model against re-rendering it after a single edit.
+
+The first render formats every node, data line and process chain.
+After a change made through ``update_system`` or ``update_connection``, only the changed node is formatted again
+and the rest of the diagram is reused, so the re-render should be faster.
+The re-render still visits every row, comparing its stamp with the one of the cached node, so it stays linear in the
+size of the diagram, but that comparison is much cheaper than formatting the node.
+
+    python benchmarks/bench_rerender.py
+"""
+
+import time
+
+from synthetic import synthetic_xdsm
+
+
+def _time_render(x, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        x.to_tikz()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main(n_systems=1000, n_targets=10, repeat=5):
+    x = synthetic_xdsm(n_systems, n_targets=n_targets)
+    print("{} systems, {} connections".format(len(x.systems), len(x.connections)))
+
+    first = []
+    for _ in range(repeat):
+        x.invalidate()
+        t0 = time.perf_counter()
+        x.to_tikz()
+        first.append(time.perf_counter() - t0)
+    first = min(first)
+
+    edits = []
+    for i in range(repeat):
+        x.update_system("D{}".format(i), label=r"\text{{Edited {}}}".format(i))
+        edits.append(_time_render(x, 1))
+    conn = x.connections[0]
+    for i in range(repeat):
+        x.update_connection(conn.src, conn.target, label="y_{}".format(i))
+        edits.append(_time_render(x, 1))
+    edit = min(edits)
+
+    print("{:>28} {:>10}".format("", "time [ms]"))
+    print("{:>28} {:>10.2f}".format("first render", 1e3 * first))
+    print("{:>28} {:>10.2f}".format("re-render after one edit", 1e3 * edit))
+    print("{:>28} {:>10.1f}x".format("speed-up", first / edit))
+
+
+if __name__ == "__main__":
+    main()
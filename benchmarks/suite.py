@@ -0,0 +1,194 @@
+"""
+Benchmark suite for the scaling of XDSM and MatrixEquation with synthetic models.
+
+Every case builds a model, then times its construction and each stage of writing it, see the ``profile`` argument
+of ``XDSM.write``, and optionally its compilation. The peak memory of building and rendering the model is
+measured separately with tracemalloc, which slows Python down.
+
+The results are written as JSON, and can be compared to the results of a previous run to flag regressions:
+
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --output results.json --compare baseline.json
+
+The comparison exits with status 1 if any time or peak memory grew by more than the threshold.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from synthetic import kitchen_sink_xdsm, synthetic_matrix_equation, synthetic_xdsm
+
+from pyxdsm import __version__ as pyxdsm_version
+
+# version of the format of the results
+RESULTS_VERSION = 1
+
+# name, kind and parameters of the generator of each case
+CASES = [
+    ("kitchen_sink", "xdsm", {}),
+    ("xdsm_n100", "xdsm", dict(n_systems=100, n_targets=10)),
+    ("xdsm_n500", "xdsm", dict(n_systems=500, n_targets=10)),
+    ("xdsm_n2000", "xdsm", dict(n_systems=2000, n_targets=10)),
+    ("xdsm_n500_bulk", "xdsm", dict(n_systems=500, n_targets=10, bulk=True)),
+    ("xdsm_n200_dense", "xdsm", dict(n_systems=200, density=0.5)),
+    ("xdsm_n500_short_process", "xdsm", dict(n_systems=500, n_targets=10, process_length=10)),
+    ("xdsm_n500_long_labels", "xdsm", dict(n_systems=500, n_targets=10, label_size=8)),
+    ("matrix_n50", "matrix", dict(n_vars=50, density=0.2)),
+    ("matrix_n200", "matrix", dict(n_vars=200, density=0.2)),
+    ("matrix_n100_blocks", "matrix", dict(n_vars=100, density=0.2, size=3)),
+]
+
+
+def _build(kind, params):
+    if kind == "matrix":
+        return synthetic_matrix_equation(**params)
+    if params:
+        return synthetic_xdsm(**params)
+    return kitchen_sink_xdsm()
+
+
+def _write(model, kind, outdir, compile):
+    """Write the model to ``outdir``, and return the time of each stage."""
+    if kind == "xdsm":
+        reports = []
+        model.write("bench", build=compile, outdir=outdir, quiet=True, profile=reports.append)
+        return reports[0].stages
+
+    times = {}
+    t0 = time.perf_counter()
+    model.to_tikz()
+    times["render"] = time.perf_counter() - t0
+    if compile:
+        # the matrix equation is written to the current directory
+        cwd = os.getcwd()
+        os.chdir(outdir)
+        try:
+            t0 = time.perf_counter()
+            model.write("bench")
+            times["compile"] = time.perf_counter() - t0
+        finally:
+            os.chdir(cwd)
+    return times
+
+
+def run_case(kind, params, repeat=3, compile=False):
+    """
+    Benchmark one case.
+
+    Returns
+    -------
+    dict
+        The ``"times"`` of the construction and of each stage in seconds, the best of ``repeat`` runs,
+        and the ``"peak_memory"`` in bytes of building and rendering the model.
+    """
+    times = {}
+    outdir = tempfile.mkdtemp(prefix="bench-suite-")
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            model = _build(kind, params)
+            run_times = {"construction": time.perf_counter() - t0}
+            run_times.update(_write(model, kind, outdir, compile))
+            for stage, elapsed in run_times.items():
+                times[stage] = min(elapsed, times.get(stage, elapsed))
+
+        tracemalloc.start()
+        try:
+            model = _build(kind, params)
+            _write(model, kind, outdir, compile=False)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+    return {"times": times, "peak_memory": peak_memory}
+
+
+def run(pattern="*", repeat=3, compile=False):
+    """Run the cases whose name matches ``pattern``, and return the results."""
+    cases = {}
+    for name, kind, params in CASES:
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        result = run_case(kind, params, repeat=repeat, compile=compile)
+        cases[name] = dict(kind=kind, params=params, **result)
+        total = sum(result["times"].values())
+        print("{:<26} {:>10.1f} ms {:>10.1f} MiB".format(name, 1e3 * total, result["peak_memory"] / 2**20))
+
+    return {
+        "version": RESULTS_VERSION,
+        "pyxdsm": pyxdsm_version,
+        "python": platform.python_version(),
+        "compile": compile,
+        "cases": cases,
+    }
+
+
+def compare(results, baseline, threshold=1.25, min_time=1e-3):
+    """
+    Return the regressions of ``results`` with respect to ``baseline``.
+
+    A time or peak memory regressed if it is more than ``threshold`` times its baseline value.
+    Times under ``min_time`` seconds in both runs are ignored, as they are dominated by noise.
+
+    Returns
+    -------
+    list of tuple
+        The case, the metric, its baseline value and its new value for every regression.
+    """
+    if baseline.get("version") != RESULTS_VERSION:
+        raise ValueError("The baseline has version {}, expected {}".format(baseline.get("version"), RESULTS_VERSION))
+
+    regressions = []
+    for name, case in results["cases"].items():
+        base_case = baseline["cases"].get(name)
+        if base_case is None:
+            continue
+        metrics = [(stage, base_case["times"].get(stage), new) for stage, new in case["times"].items()]
+        metrics.append(("peak_memory", base_case["peak_memory"], case["peak_memory"]))
+        for metric, old, new in metrics:
+            if old is None or (metric != "peak_memory" and max(old, new) < min_time):
+                continue
+            if new > threshold * old:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag the regressions against these results")
+    parser.add_argument("--threshold", type=float, default=1.25, help="ratio to the baseline considered a regression")
+    parser.add_argument("--compile", action="store_true", help="also time the compilation, requires pdflatex")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each case, the best is kept")
+    parser.add_argument("--cases", default="*", help="only run the cases matching this pattern")
+    args = parser.parse_args(argv)
+
+    results = run(args.cases, repeat=args.repeat, compile=args.compile)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, threshold=args.threshold)
+        for name, metric, old, new in regressions:
+            print("REGRESSION {} {}: {:.4g} -> {:.4g} ({:.2f}x)".format(name, metric, old, new, new / old))
+        if regressions:
+            return 1
+        print("No regression against {}".format(args.compare))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Generators for synthetic XDSM models used by the benchmarks.
+"""
+
+import os
+import random
+import runpy
+import tempfile
+from unittest import mock
+
+from pyxdsm.XDSM import XDSM, OPT, SOLVER, FUNC, LEFT
+from pyxdsm.matrix_eqn import MatrixEquation
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "examples")
+
+
+def synthetic_xdsm(
+    n_systems, n_targets=10, seed=0, bulk=False, density=None, process_length=None, label_size=2, **kwargs
+):
+    """
+    Build an XDSM with an optimizer, a solver and ``n_systems - 2`` functions.
+
+    Every system is connected to ``n_targets`` randomly chosen other systems,
+    so the number of connections grows linearly with ``n_systems``.
+    If ``density`` is given, every system is connected to this fraction of the other systems instead,
+    so the number of connections grows quadratically.
+    If ``bulk`` is true, the systems and connections are added with ``add_systems`` and ``connect_many``,
+    which gives the same model.
+    The process chain goes through the first ``process_length`` systems, by default all of them,
+    and each connection is labelled with ``label_size`` variables, one per line.
+    Additional keyword arguments are passed to the XDSM constructor.
+    """
+    rng = random.Random(seed)
+    x = XDSM(**kwargs)
+    if density is not None:
+        n_targets = round(density * (n_systems - 1))
+
+    names = ["opt", "solver"] + ["D{}".format(i) for i in range(n_systems - 2)]
+    faded = [False, False] + [rng.random() < 0.1 for _ in names[2:]]
+    if bulk:
+        styles = [OPT, SOLVER] + [FUNC] * (n_systems - 2)
+        x.add_systems(names, styles, [r"\text{Optimizer}", r"\text{Newton}"] + names[2:], faded=faded)
+    else:
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("solver", SOLVER, r"\text{Newton}")
+        for name, faded_i in zip(names[2:], faded[2:]):
+            x.add_system(name, FUNC, name, faded=faded_i)
+
+    rows, cols, labels = [], [], []
+    for i_src in range(n_systems):
+        for i_target in rng.sample(range(n_systems), min(n_targets, n_systems - 1) + 1):
+            if i_target != i_src:
+                rows.append(i_src)
+                cols.append(i_target)
+                labels.append(tuple("x_{%d,%d}" % (i_src, k) for k in range(label_size)))
+    if bulk:
+        x.connect_many((rows, cols, labels))
+    else:
+        for i_src, i_target, label in zip(rows, cols, labels):
+            x.connect(names[i_src], names[i_target], label)
+
+    for name in names:
+        x.add_input(name, "{}_0".format(name))
+        x.add_output(name, "{}^*".format(name), side=LEFT)
+
+    x.add_process(names[:process_length] + ["opt"])
+
+    return x
+
+
+def synthetic_matrix_equation(n_vars, density=0.2, size=1, seed=0):
+    """
+    Build the linear system of a model with ``n_vars`` variables of ``size`` rows each,
+    as the Jacobian, the vector of unknowns and the right-hand side.
+
+    Every variable depends on the given ``density`` fraction of the other variables.
+    """
+    rng = random.Random(seed)
+    eqn = MatrixEquation()
+    names = ["x{}".format(i) for i in range(n_vars)]
+    for name in names:
+        eqn.add_variable(name, size=size, text=r"$%s$" % name)
+
+    n_targets = round(density * (n_vars - 1))
+    for i_src, src in enumerate(names):
+        targets = [names[i] for i in rng.sample(range(n_vars), min(n_targets + 1, n_vars)) if i != i_src]
+        eqn.connect(src, targets[:n_targets])
+
+    eqn.jacobian()
+    eqn.spacer()
+    eqn.vector(base_color="red")
+    eqn.operator("=")
+    eqn.vector(base_color="green")
+    return eqn
+
+
+def kitchen_sink_xdsm():
+    """
+    Return the XDSM of ``examples/kitchen_sink.py``, a small diagram that uses every feature.
+
+    The example is run in a temporary directory without writing or compiling the diagram.
+    """
+    cwd = os.getcwd()
+    path = os.path.abspath(os.path.join(EXAMPLES_DIR, "kitchen_sink.py"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            with mock.patch.object(XDSM, "write"), mock.patch.object(XDSM, "write_sys_specs"):
+                namespace = runpy.run_path(path)
+        finally:
+            os.chdir(cwd)
+    return namespace["x"]
@@ -1,11 +1,20 @@
 from __future__ import print_function
+import asyncio
+import io
 import os
-import numpy as np
+import re
 import json
-import subprocess
+import itertools
+import functools
+import string
+import time
+import numpy as np
 from collections import namedtuple
+from sys import intern
 
 from pyxdsm import __version__ as pyxdsm_version
+from pyxdsm import latex, svg, viewer
+from pyxdsm.table import FLAG, OBJECT, RecordTable
 
 OPT = "Optimization"
 SUBOPT = "SubOptimization"
@@ -75,7 +84,7 @@ tex_template = r"""
 
 \begin{{document}}
 
-\input{{"{tikzpicture_path}"}}
+{tikzpicture}
 
 \end{{document}}
 """
@@ -88,6 +97,16 @@ def chunk_label(label, n_chunks):
 
 
 def _parse_label(label, label_width=None):
+    if isinstance(label, list):
+        label = tuple(label)
+    try:
+        return _cached_label(label, label_width)
+    except TypeError:
+        # labels with unhashable items are not cached
+        return _format_label(label, label_width)
+
+
+def _format_label(label, label_width=None):
     if isinstance(label, (tuple, list)):
         if label_width is None:
             return r"$\begin{array}{c}" + r" \\ ".join(label) + r"\end{array}$"
@@ -100,6 +119,168 @@ def _parse_label(label, label_width=None):
         return r"${}$".format(label)
 
 
+# the same labels tend to appear many times in a diagram, e.g. the variables passed along the connections
+_cached_label = functools.lru_cache(maxsize=4096)(_format_label)
+
+
+def label_cache_info():
+    """
+    Return the statistics of the cache of formatted labels, which is shared by all diagrams.
+
+    Returns
+    -------
+    namedtuple
+        The ``hits``, ``misses``, ``maxsize`` and ``currsize`` of the cache,
+        as returned by ``functools.lru_cache``.
+    """
+    return _cached_label.cache_info()
+
+
+def _intern_label(label):
+    """Return ``label`` with its strings interned, so that repeated labels share a single string."""
+    if isinstance(label, str):
+        return intern(label)
+    elif isinstance(label, tuple) and all(isinstance(item, str) for item in label):
+        return tuple(intern(item) for item in label)
+    # lists are kept as they are, since they may still be changed in place
+    return label
+
+
+def _iter_joined(sep, items, chunk_size=1024):
+    """
+    Yield ``items`` with ``sep`` in between, which is a lazy version of ``sep.join(items)``.
+
+    The items are joined ``chunk_size`` at a time, so that long sequences are not yielded item by item.
+    """
+    items = iter(items)
+    chunk = list(itertools.islice(items, chunk_size))
+    while chunk:
+        yield sep.join(chunk)
+        chunk = list(itertools.islice(items, chunk_size))
+        if chunk:
+            yield sep
+
+
+def _iter_template(template, **fields):
+    """
+    Yield the fragments of ``template.format(**fields)`` in order.
+
+    Each field value can either be a string or an iterable of strings, which is streamed in place.
+    """
+    for literal, field_name, _, _ in string.Formatter().parse(template):
+        if literal:
+            yield literal
+        if field_name is not None:
+            value = fields[field_name]
+            if isinstance(value, str):
+                yield value
+            else:
+                yield from value
+
+
+# the JSON snapshot of a diagram, see XDSM.write_json
+JSON_FORMAT = "pyxdsm"
+JSON_VERSION = 1
+# the sections of records, in the order they are written and read
+JSON_SECTIONS = ("systems", "connections", "inputs", "outputs", "processes")
+_JSON_SECTION_RE = re.compile(r'"(\w+)":\[')
+
+
+def _json_default(value):
+    # numpy scalars, e.g. the label widths or flags given as numpy values
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+
+# json.dumps would create an encoder per call, for every record
+_json_dumps = json.JSONEncoder(separators=(",", ":"), sort_keys=True, default=_json_default).encode
+
+
+def _json_label(label):
+    """Return a label read from JSON, with the lists of strings as (hashable) tuples."""
+    if isinstance(label, str):
+        return intern(label)
+    if isinstance(label, list) and all(isinstance(item, str) for item in label):
+        return tuple(map(intern, label))
+    return label
+
+
+def _iter_chunks(items, chunk_size=4096):
+    """Yield the items as lists of up to ``chunk_size`` items."""
+    items = iter(items)
+    chunk = list(itertools.islice(items, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(items, chunk_size))
+
+
+def _iter_json_rows(lines):
+    """Yield the records of a section written by XDSM.write_json, one per line, up to the end of the section."""
+    for line in lines:
+        line = line.strip()
+        if line in ("],", "]}"):
+            return
+        yield json.loads(line[:-1] if line.endswith(",") else line)
+    raise ValueError("Invalid XDSM JSON: unexpected end of the file")
+
+
+def _iter_json_sections(lines):
+    """Yield the name and the records of each section written by XDSM.write_json, which are read lazily."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        match = _JSON_SECTION_RE.fullmatch(line)
+        if match is None:
+            raise ValueError("Invalid XDSM JSON: expected a section, got {!r}".format(line[:80]))
+        yield match.group(1), _iter_json_rows(lines)
+
+
+def _unknown_system_message(name):
+    return 'The diagram refers to a system named "{}" but no system with that name exists.'.format(name)
+
+
+def _build_system_index(systems):
+    """Return the map of each node_name of a table of systems to its position, which must be unique."""
+    index = {}
+    for i_sys, name in enumerate(systems.column("node_name")):
+        if name in index:
+            raise ValueError('A system named "{}" already exists.'.format(name))
+        index[name] = i_sys
+    return index
+
+
+# the file of the styles used for each quality of diagram
+STYLE_FILES = {"full": "diagram_styles", "draft": "diagram_styles_draft"}
+
+
+def _diagram_styles_path(quality="full"):
+    if quality not in STYLE_FILES:
+        raise ValueError('Unknown quality "{}", expected one of: {}'.format(quality, ", ".join(STYLE_FILES)))
+    module_path = os.path.dirname(__file__)
+    diagram_styles_path = os.path.join(module_path, STYLE_FILES[quality])
+    # Hack for Windows. MiKTeX needs Linux style paths.
+    return diagram_styles_path.replace("\\", "/")
+
+
+def _diagram_styles(quality="full"):
+    with open(_diagram_styles_path(quality) + ".tex") as f:
+        return f.read()
+
+
+def _per_item(value, n, name):
+    """Return ``value`` as a list of ``n`` items, repeating it if it is a single value."""
+    if value is None or isinstance(value, (str, bool, int, np.bool_, np.integer)):
+        return [value] * n
+    value = list(value)
+    if len(value) != n:
+        raise ValueError(
+            "{} must be a single value or have one item per element, got {} for {}".format(name, len(value), n)
+        )
+    return value
+
+
 def _label_to_spec(label, spec):
     if isinstance(label, str):
         label = [
@@ -115,6 +296,94 @@ Input = namedtuple("Input", "node_name label label_width style stack faded")
 Output = namedtuple("Output", "node_name label label_width style stack faded side")
 Connection = namedtuple("Connection", "src target label label_width style stack faded src_faded target_faded")
 Process = namedtuple("Process", "systems arrow faded")
+Edge = namedtuple("Edge", "start end faded")
+# the fading of every element once auto_fade is applied, see XDSM._fading
+Fading = namedtuple("Fading", "systems connections h_edges v_edges inputs left_outs right_outs processes")
+# the profile of a call to XDSM.write, see its profile argument
+BuildReport = namedtuple("BuildReport", "stages sizes cells edges processes compile")
+
+# how the fields of the systems and connections are stored, see RecordTable
+_SYSTEM_KINDS = dict(
+    node_name="node", style="style", label=OBJECT, stack=FLAG, faded=FLAG, label_width=OBJECT, spec_name="node"
+)
+_CONNECTION_KINDS = dict(
+    src="node",
+    target="node",
+    label=OBJECT,
+    label_width=OBJECT,
+    style="style",
+    stack=FLAG,
+    faded=FLAG,
+    src_faded=FLAG,
+    target_faded=FLAG,
+)
+
+
+def _node_content(record, faded):
+    """Return the TikZ style and the label of the node of a record, faded or not."""
+    style = record.style
+    if record.stack:
+        style += ",stack"
+    if faded:
+        style += ",faded"
+    return style, _parse_label(record.label, record.label_width)
+
+
+def _format_node(node_name, record, faded, boxes=None):
+    """
+    Return the TikZ node of a system, input, output or connection record, faded or not.
+
+    If ``boxes`` is given, the node includes the pre-rendered picture that ``boxes`` maps its content to.
+    """
+    style, label = _node_content(record, faded)
+    if boxes is not None:
+        style, label = "CachedBox", boxes[style, label]
+    return r"\node [{style}] ({node_name}) {{{node_label}}};".format(style=style, node_name=node_name, node_label=label)
+
+
+def _table_node_name(record):
+    """Return the name of the TikZ node of a system or connection record."""
+    if isinstance(record, Connection):
+        return "{}-{}".format(record.src, record.target)
+    return record.node_name
+
+
+def _timed(timings, stage, fragments):
+    """Join ``fragments`` and record how long it took in ``timings[stage]``."""
+    t0 = time.perf_counter()
+    joined = "".join(fragments)
+    timings[stage] = time.perf_counter() - t0
+    return joined
+
+
+def _format_edge(edge):
+    style = "DataLine,faded" if edge.faded else "DataLine"
+    return "({}) edge [{}] ({})".format(edge.start, style, edge.end)
+
+
+def _format_process(proc, output_names, faded):
+    """Return the TikZ chain of a process, faded or not, given the node names of all inputs and outputs."""
+    if proc.arrow:
+        tip_style, hv_style = "ProcessTipA", "ProcessHVA"
+    else:
+        tip_style, hv_style = "ProcessTip", "ProcessHV"
+    if faded:
+        tip_style, hv_style = "Faded" + tip_style, "Faded" + hv_style
+
+    chain = ["{ [start chain=process]\n \\begin{pgfonlayer}{process} \n"]
+    start_tip = False
+    for i, sys in enumerate(proc.systems):
+        if i == 0:
+            start_tip = sys in output_names
+            chain.append("\\chainin ({});\n".format(sys))
+        else:
+            if sys in output_names or (i == 1 and start_tip):
+                style = tip_style
+            else:
+                style = hv_style
+            chain.append("\\chainin ({}) [join=by {}];\n".format(sys, style))
+    chain.append("\\end{pgfonlayer}\n}")
+    return "".join(chain)
 
 
 class XDSM:
@@ -135,6 +404,7 @@ class XDSM:
             For connections there are two additional options:
             - "incoming" : Fade all connections that are incoming to faded blocks.
             - "outgoing" : Fade all connections that are outgoing from faded blocks.
+            The fading is applied when the diagram is rendered, so it follows the systems as they are at that time.
         """
         self.systems = []
         self.connections = []
@@ -143,6 +413,11 @@ class XDSM:
         self.ins = {}
         self.processes = []
 
+        # rendered fragments, reused by the next render as long as the element is unchanged
+        self._node_cache = {}
+        self._process_cache = {}
+        self._process_output_names = frozenset()
+
         self.use_sfmath = use_sfmath
         if optional_latex_packages is None:
             self.optional_packages = []
@@ -174,6 +449,51 @@ class XDSM:
                     + "valid values are 'all', 'connected', 'none', 'incoming', 'outgoing'."
                 )
 
+    @property
+    def systems(self):
+        """The systems on the diagonal, as a :class:`~pyxdsm.table.RecordTable` of ``System`` records."""
+        return self._systems
+
+    @systems.setter
+    def systems(self, systems):
+        systems = RecordTable(System, _SYSTEM_KINDS, systems)
+        index = _build_system_index(systems)
+        self._systems = systems
+        self._system_index_cache = index
+        self._system_index_version = systems.version
+
+    @property
+    def _system_index(self):
+        """
+        Map each system node_name to its position in self.systems.
+
+        The index is rebuilt whenever the table was changed other than by add_system and add_systems,
+        e.g. by deleting or inserting a system directly.
+        """
+        if self._system_index_version != self._systems.version:
+            self._system_index_cache = _build_system_index(self._systems)
+            self._system_index_version = self._systems.version
+        return self._system_index_cache
+
+    def _extend_systems(self, node_names, **columns):
+        """Append systems with new, unique names, and add them to the index instead of rebuilding it."""
+        index = self._system_index
+        self.systems.extend_columns(node_name=node_names, **columns)
+        for i_sys, name in enumerate(node_names, start=len(index)):
+            index[name] = i_sys
+        self._system_index_version = self._systems.version
+
+    @property
+    def connections(self):
+        """The data connections, as a :class:`~pyxdsm.table.RecordTable` of ``Connection`` records."""
+        return self._connections
+
+    @connections.setter
+    def connections(self, connections):
+        self._connections = RecordTable(Connection, _CONNECTION_KINDS, connections)
+        # maps each (src, target) pair to the position of its last connection in self.connections
+        self._connection_index = {}
+
     def add_system(
         self,
         node_name,
@@ -219,11 +539,72 @@ class XDSM:
             The spec name used for the spec file.
 
         """
+        if node_name in self._system_index:
+            raise ValueError('A system named "{}" already exists.'.format(node_name))
+
         if spec_name is None:
             spec_name = node_name
 
-        sys = System(node_name, style, label, stack, faded, label_width, spec_name)
-        self.systems.append(sys)
+        label = _intern_label(label)
+        index = self._system_index
+        self.systems.append(System(node_name, style, label, stack, faded, label_width, spec_name))
+        index[node_name] = len(index)
+        self._system_index_version = self._systems.version
+
+    def add_systems(self, node_names, styles, labels, stack=False, faded=False, label_width=None, spec_names=None):
+        """
+        Add several systems at once, in order, as if :meth:`add_system` was called for each of them.
+
+        All names are validated before any system is added.
+
+        Parameters
+        ----------
+        node_names : list of str
+            The unique names of the new systems
+
+        styles : str or list of str
+            The type of all the systems, or one type per system
+
+        labels : list
+            One label per system, see :meth:`add_system`
+
+        stack : bool or list of bool
+            Whether the systems are displayed as stacked rectangles, for all of them or per system
+
+        faded : bool or list of bool
+            Whether the systems are faded, for all of them or per system
+
+        label_width : int, None or list
+            The label width of all the systems, or one per system
+
+        spec_names : list of str or None
+            The spec names of the systems. If None, the node names are used.
+        """
+        node_names = list(node_names)
+        n = len(node_names)
+        columns = dict(
+            style=_per_item(styles, n, "styles"),
+            label=[_intern_label(label) for label in _per_item(labels, n, "labels")],
+            stack=_per_item(stack, n, "stack"),
+            faded=_per_item(faded, n, "faded"),
+            label_width=_per_item(label_width, n, "label_width"),
+            spec_name=node_names if spec_names is None else _per_item(spec_names, n, "spec_names"),
+        )
+
+        seen = set(self._system_index)
+        duplicates = {}
+        for name in node_names:
+            if name in seen:
+                duplicates[name] = None
+            seen.add(name)
+        if len(duplicates) == 1:
+            raise ValueError('A system named "{}" already exists.'.format(*duplicates))
+        elif duplicates:
+            raise ValueError(
+                "Systems named {} already exist.".format(", ".join('"{}"'.format(name) for name in duplicates))
+            )
+
+        self._extend_systems(node_names, **columns)
 
     def add_input(self, name, label, label_width=None, style="DataIO", stack=False, faded=False):
         r"""
@@ -257,13 +638,7 @@ class XDSM:
         faded : bool
             If true, the component will be faded, in order to highlight some other system.
         """
-        sys_faded = {}
-        for s in self.systems:
-            sys_faded[s.node_name] = s.faded
-        if (self.auto_fade["inputs"] == "all") or (
-            self.auto_fade["inputs"] == "connected" and name in sys_faded and sys_faded[name]
-        ):
-            faded = True
+        label = _intern_label(label)
         self.ins[name] = Input("output_" + name, label, label_width, style, stack, faded)
 
     def add_output(self, name, label, label_width=None, style="DataIO", stack=False, faded=False, side="left"):
@@ -302,13 +677,7 @@ class XDSM:
             Must be one of ``['left', 'right']``. This parameter controls whether the output
             is placed on the left-most column or the right-most column of the diagram.
         """
-        sys_faded = {}
-        for s in self.systems:
-            sys_faded[s.node_name] = s.faded
-        if (self.auto_fade["outputs"] == "all") or (
-            self.auto_fade["outputs"] == "connected" and name in sys_faded and sys_faded[name]
-        ):
-            faded = True
+        label = _intern_label(label)
         if side == "left":
             self.left_outs[name] = Output("left_output_" + name, label, label_width, style, stack, faded, side)
         elif side == "right":
@@ -367,22 +736,124 @@ class XDSM:
         if (not isinstance(label_width, int)) and (label_width is not None):
             raise ValueError("label_width argument must be an integer")
 
-        sys_faded = {}
-        for s in self.systems:
-            sys_faded[s.node_name] = s.faded
+        # auto_fade is applied when the diagram is rendered, see _fading
+        label = _intern_label(label)
+        self._connection_index[src, target] = len(self.connections)
+        self.connections.append(Connection(src, target, label, label_width, style, stack, faded, False, False))
 
-        allFaded = self.auto_fade["connections"] == "all"
-        srcFaded = src in sys_faded and sys_faded[src]
-        targetFaded = target in sys_faded and sys_faded[target]
-        if (
-            allFaded
-            or (self.auto_fade["connections"] == "connected" and (srcFaded and targetFaded))
-            or (self.auto_fade["connections"] == "incoming" and targetFaded)
-            or (self.auto_fade["connections"] == "outgoing" and srcFaded)
-        ):
-            faded = True
+    def connect_many(
+        self, src, targets=None, labels=None, label_width=None, style="DataInter", stack=False, faded=False
+    ):
+        r"""
+        Add many connections between systems at once.
+
+        The connections can be given in one of three forms:
+
+            - ``connect_many(src, targets, labels)``
+                Parallel sequences with one item per connection. ``src`` and ``targets`` hold either the
+                names of the systems or their positions on the diagonal.
+            - ``connect_many(matrix, labels=labels)``
+                A dense boolean numpy array of shape ``(n_systems, n_systems)``, with a connection from system
+                ``i`` to system ``j`` wherever ``matrix[i, j]`` is true. ``labels[i][j]`` is its label.
+            - ``connect_many((rows, cols, labels))``
+                A sparse matrix in coordinate (COO) format: the positions of the source and target systems
+                and the labels, as three parallel sequences.
+
+        Connections from the matrix forms are added row by row. The connections are all validated
+        before any of them is added.
+
+        Parameters
+        ----------
+        src : list, numpy.ndarray or tuple
+            The sources, the connection matrix or the COO triplet, see above
+
+        targets : list or None
+            The targets, if ``src`` is a list of sources
+
+        labels : list or None
+            The labels, if ``src`` is a list of sources or a dense matrix
 
-        self.connections.append(Connection(src, target, label, label_width, style, stack, faded, srcFaded, targetFaded))
+        label_width : int or None
+            The label width of all the connections
+
+        style : str or list of str
+            The style of all the connections, or one style per connection
+
+        stack : bool or list of bool
+            Whether the connections are displayed as stacked rectangles, for all of them or per connection
+
+        faded : bool or list of bool
+            Whether the connections are faded, for all of them or per connection
+        """
+        if (not isinstance(label_width, int)) and (label_width is not None):
+            raise ValueError("label_width argument must be an integer")
+
+        n_sys = len(self.systems)
+        if targets is None and isinstance(src, np.ndarray):
+            if src.shape != (n_sys, n_sys):
+                raise ValueError("The connection matrix must have shape ({0}, {0}), got {1}".format(n_sys, src.shape))
+            if labels is None:
+                raise ValueError("labels must be given with a connection matrix")
+            src_idx, target_idx = np.nonzero(src)
+            labels = [labels[i][j] for i, j in zip(src_idx.tolist(), target_idx.tolist())]
+        else:
+            if targets is None:
+                if not isinstance(src, tuple) or len(src) != 3:
+                    raise ValueError(
+                        "targets must be given, unless src is a numpy matrix or a (rows, cols, labels) triplet"
+                    )
+                src, targets, labels = src
+            if labels is None:
+                raise ValueError("labels must be given for all connections")
+            src_idx = self._system_positions(src)
+            target_idx = self._system_positions(targets)
+            labels = list(labels)
+            if not len(src_idx) == len(target_idx) == len(labels):
+                raise ValueError(
+                    "src, targets and labels must have the same length, got {}, {} and {}".format(
+                        len(src_idx), len(target_idx), len(labels)
+                    )
+                )
+
+        n = len(labels)
+        if np.any(src_idx == target_idx):
+            raise ValueError("Can not connect component to itself")
+
+        names = list(self.systems.column("node_name"))
+        src_names = [names[i] for i in src_idx.tolist()]
+        target_names = [names[i] for i in target_idx.tolist()]
+        for i_conn, pair in enumerate(zip(src_names, target_names), start=len(self.connections)):
+            self._connection_index[pair] = i_conn
+        self.connections.extend_columns(
+            src=src_names,
+            target=target_names,
+            label=[_intern_label(label) for label in labels],
+            label_width=[label_width] * n,
+            style=_per_item(style, n, "style"),
+            stack=_per_item(stack, n, "stack"),
+            faded=_per_item(faded, n, "faded"),
+            src_faded=[False] * n,
+            target_faded=[False] * n,
+        )
+
+    def _system_positions(self, names):
+        """Return the positions of systems, given by name or by position, as an array of ints."""
+        names = np.asarray(names)
+        if names.dtype.kind in "iu":
+            if np.any((names < 0) | (names >= len(self.systems))):
+                raise ValueError("System positions must be between 0 and {}".format(len(self.systems) - 1))
+            return names.astype(np.intp).ravel()
+
+        index = self._system_index
+        positions = [index.get(name, -1) for name in names.tolist()]
+        unknown = {name: None for name, i_sys in zip(names.tolist(), positions) if i_sys < 0}
+        if unknown:
+            raise ValueError(
+                "connections include components named {} but no systems with these names exist.".format(
+                    ", ".join('"{}"'.format(name) for name in unknown)
+                )
+            )
+        return np.array(positions, dtype=np.intp)
 
     def add_process(self, systems, arrow=True, faded=False):
         """
@@ -398,237 +869,888 @@ class XDSM:
             If true, arrows will be added to the process lines to indicate the direction
             of the process flow.
         """
-        sys_faded = {}
-        for s in self.systems:
-            sys_faded[s.node_name] = s.faded
-        if (self.auto_fade["processes"] == "all") or (
-            self.auto_fade["processes"] == "connected"
-            and any(
-                [sys_faded[s] for s in systems if s in sys_faded.keys()]
-            )  # sometimes a process may contain off-diagonal blocks
-        ):
-            faded = True
         self.processes.append(Process(systems, arrow, faded))
 
+    def update_system(self, node_name, /, **fields):
+        """
+        Change some of the fields of an existing system, e.g. its label, style or fading.
+
+        Only the node of this system is rendered again by the next call to :meth:`write` or :meth:`to_tikz`,
+        the rest of the diagram is reused from the previous render.
+        Since ``auto_fade`` is applied at render time, a change of ``faded`` also fades or unfades
+        the inputs, outputs, connections and processes of this system accordingly.
+
+        Parameters
+        ----------
+        node_name : str
+            The name of the system to update
+
+        **fields
+            The new values of any of the arguments of :meth:`add_system`, except ``node_name``.
+        """
+        if "node_name" in fields:
+            # the connections, inputs, outputs and processes refer to the system by its name
+            raise ValueError("The node_name of a system cannot be changed, add a new system instead.")
+        i_sys = self._system_index.get(node_name)
+        if i_sys is None:
+            raise ValueError('No system named "{}" exists.'.format(node_name))
+
+        if "label" in fields:
+            fields["label"] = _intern_label(fields["label"])
+        self.systems[i_sys] = self.systems[i_sys]._replace(**fields)
+
+    def update_connection(self, src, target, **fields):
+        """
+        Change some of the fields of an existing connection, e.g. its label, style or fading.
+
+        Only the node of this connection is rendered again by the next call to :meth:`write` or :meth:`to_tikz`,
+        the rest of the diagram is reused from the previous render.
+        If several connections were added between ``src`` and ``target``, the last one is updated.
+
+        Parameters
+        ----------
+        src : str
+            The name of the source component.
+
+        target : str
+            The name of the target component.
+
+        **fields
+            The new values of any of the arguments of :meth:`connect`, except ``src`` and ``target``.
+        """
+        i_conn = self._connection_index.get((src, target))
+        conns = self.connections
+        if (
+            i_conn is None
+            or i_conn >= len(conns)
+            or (conns.get(i_conn, "src"), conns.get(i_conn, "target")) != (src, target)
+        ):
+            # self.connections was modified directly, look the connection up again
+            pairs = zip(conns.column("src"), conns.column("target"))
+            matches = [i for i, pair in enumerate(pairs) if pair == (src, target)]
+            if not matches:
+                raise ValueError('No connection from "{}" to "{}" exists.'.format(src, target))
+            i_conn = self._connection_index[src, target] = matches[-1]
+
+        if "label" in fields:
+            fields["label"] = _intern_label(fields["label"])
+        self.connections[i_conn] = self.connections[i_conn]._replace(**fields)
+
+    def invalidate(self):
+        """
+        Discard the fragments kept from the previous render, so that the next one starts from scratch.
+
+        Replacing a system, connection, input, output or process is detected automatically.
+        This is only needed after changing a label list or a process system list in place.
+        """
+        self._node_cache.clear()
+        self._process_cache.clear()
+
+    def _fading(self, faded_systems=None):
+        """
+        Apply ``auto_fade`` to the fading given for each element, based on the current fading of the systems.
+
+        The connections are resolved in a single vectorized pass over their source and target systems.
+
+        Parameters
+        ----------
+        faded_systems : set of str or None
+            The names of the systems to fade instead of the ones faded in ``self.systems``
+
+        Returns
+        -------
+        Fading
+            Boolean arrays with the fading of the systems, of the connection nodes and of their horizontal
+            and vertical data lines, dicts with the fading of the inputs and outputs by system name,
+            and a list with the fading of each process.
+        """
+        auto_fade = self.auto_fade
+        n_sys = len(self.systems)
+        # the faded systems, and False at position -1 for the names that are not systems
+        sys_faded = np.zeros(n_sys + 1, dtype=bool)
+        if faded_systems is None:
+            sys_faded[:n_sys] = np.fromiter(self.systems.column("faded"), dtype=bool, count=n_sys)
+        else:
+            unknown = [name for name in faded_systems if name not in self._system_index]
+            if unknown:
+                raise ValueError(
+                    "Cannot fade {} since there are no systems with these names.".format(
+                        ", ".join('"{}"'.format(name) for name in sorted(unknown))
+                    )
+                )
+            sys_faded[[self._system_index[name] for name in faded_systems]] = True
+
+        conns = self.connections
+        n_conn = len(conns)
+        src_positions, target_positions = self._connection_positions()
+        src_faded = sys_faded[src_positions]
+        target_faded = sys_faded[target_positions]
+
+        faded = np.fromiter(conns.column("faded"), dtype=bool, count=n_conn)
+        mode = auto_fade["connections"]
+        if mode == "all":
+            faded[:] = True
+        elif mode == "connected":
+            faded |= src_faded & target_faded
+        elif mode == "incoming":
+            faded |= target_faded
+        elif mode == "outgoing":
+            faded |= src_faded
+        h_faded = faded | src_faded | np.fromiter(conns.column("src_faded"), dtype=bool, count=n_conn)
+        v_faded = faded | target_faded | np.fromiter(conns.column("target_faded"), dtype=bool, count=n_conn)
+
+        def system_faded(name):
+            return bool(sys_faded[self._system_index.get(name, -1)])
+
+        def fade_outputs(outs, mode):
+            return {
+                name: bool(out.faded or mode == "all" or (mode == "connected" and system_faded(name)))
+                for name, out in outs.items()
+            }
+
+        processes = [
+            bool(
+                proc.faded
+                or auto_fade["processes"] == "all"
+                # sometimes a process may contain off-diagonal blocks
+                or (auto_fade["processes"] == "connected" and any(system_faded(sys) for sys in proc.systems))
+            )
+            for proc in self.processes
+        ]
+
+        return Fading(
+            sys_faded[:n_sys],
+            faded,
+            h_faded,
+            v_faded,
+            fade_outputs(self.ins, auto_fade["inputs"]),
+            fade_outputs(self.left_outs, auto_fade["outputs"]),
+            fade_outputs(self.right_outs, auto_fade["outputs"]),
+            processes,
+        )
+
+    def _connection_positions(self):
+        """Return the positions of the source and of the target system of every connection, -1 if unknown."""
+        conns = self.connections
+        src_codes, names = conns.codes("src")
+        target_codes, _ = conns.codes("target")
+        # the source and target names of the connections share their ids
+        positions = np.array([self._system_index.get(name, -1) for name in names], dtype=np.intp)
+        return positions[np.asarray(src_codes, dtype=np.intp)], positions[np.asarray(target_codes, dtype=np.intp)]
+
+    def _check_system_names(self):
+        """
+        Raise a ValueError if a connection, input or output refers to a system that does not exist.
+
+        Returns the positions of the source and of the target system of every connection.
+        """
+        conns = self.connections
+        src_positions, target_positions = self._connection_positions()
+        unknown = np.flatnonzero((src_positions < 0) | (target_positions < 0))
+        if len(unknown):
+            i_conn = unknown[0]
+            name = conns.get(i_conn, "src") if src_positions[i_conn] < 0 else conns.get(i_conn, "target")
+            raise ValueError(_unknown_system_message(name))
+        for outs in (self.left_outs, self.right_outs, self.ins):
+            for comp_name in outs:
+                if comp_name not in self._system_index:
+                    raise ValueError(_unknown_system_message(comp_name))
+        return src_positions, target_positions
+
     def _build_node_grid(self):
+        return "".join(self._iter_node_grid())
+
+    def _iter_node_grid(self, fading=None, boxes=None):
+        """
+        Yield the rows of the node matrix, one ``%Row`` block at a time.
+
+        Each row is placed and formatted only when it is reached, so that the grid is never held as a whole.
+        The connections are visited row by row through an index sorted by their source system.
+        Unless ``boxes`` are given, the nodes themselves are kept in the cache of rendered nodes between renders.
+        """
+        if fading is None:
+            fading = self._fading()
+
+        size, row_offset, col_offset = self._grid_offsets()
+        # the row and column of a component follow from its position on the diagonal
+        index = self._system_index
+        systems = self.systems
+        conns = self.connections
+
+        rows, cols = self._check_system_names()
+
+        sys_node = self._table_node_getter("sys", systems, fading.systems.tolist(), boxes)
+        conn_node = self._table_node_getter("conn", conns, fading.connections.tolist(), boxes)
+        # the connections sorted by row, stable so that the last of several nodes in the same cell is kept
+        order = np.argsort(rows, kind="stable")
+        row_starts = np.searchsorted(rows[order], np.arange(len(systems) + 1)).tolist()
+
+        def grid_rows():
+            # add the inputs to the top of the grid
+            if row_offset:
+                yield {
+                    index[comp_name] + col_offset: self._node(("in", comp_name), inp, fading.inputs[comp_name], boxes)
+                    for comp_name, inp in self.ins.items()
+                }
+
+            for i_sys, comp_name in enumerate(systems.column("node_name")):
+                # the component on the diagonal, then the off diagonal nodes of its connections
+                row = {i_sys + col_offset: sys_node(i_sys)}
+                for i_conn in order[row_starts[i_sys] : row_starts[i_sys + 1]].tolist():
+                    row[int(cols[i_conn]) + col_offset] = conn_node(i_conn)
+
+                # add the nodes for left and right outputs
+                out = self.left_outs.get(comp_name)
+                if out is not None:
+                    row[0] = self._node(("left", comp_name), out, fading.left_outs[comp_name], boxes)
+                out = self.right_outs.get(comp_name)
+                if out is not None:
+                    row[size - 1] = self._node(("right", comp_name), out, fading.right_outs[comp_name], boxes)
+                yield row
+
+            # the extra rows of the outputs are empty
+            for _ in range(size - row_offset - len(systems)):
+                yield {}
+
+        for i, row in enumerate(grid_rows()):
+            # the rows are dicts, which would silently accept any column
+            if row and (min(row) < 0 or max(row) >= size):
+                raise ValueError("A node is placed outside of the {0}x{0} grid of the diagram.".format(size))
+
+            row_str = ["%Row {}\n".format(i)]
+            # the empty cells are only written out as their "&" separators
+            j_prev = 0
+            for j_col in sorted(row):
+                row_str.append("&\n" * (j_col - j_prev))
+                row_str.append(row[j_col])
+                j_prev = j_col
+            row_str.append("&\n" * (size - 1 - j_prev))
+            row_str.append(r"\\" + "\n")
+            yield "".join(row_str)
+
+    def _node(self, key, record, faded, boxes=None):
+        """
+        Return the TikZ node of ``record``.
+
+        The node is rendered once and reused until the record at ``key`` is replaced, its fading changes,
+        or the cache is invalidated. Nodes with pre-rendered ``boxes`` are not cached.
+        """
+        if boxes is not None:
+            return _format_node(record.node_name, record, faded, boxes)
+        entry = self._node_cache.get(key)
+        if entry is None or entry[0] is not record or entry[1] != faded:
+            entry = (record, faded, _format_node(record.node_name, record, faded))
+            self._node_cache[key] = entry
+        return entry[2]
+
+    def _table_node_getter(self, kind, table, faded, boxes=None):
+        """
+        Return a function of the position of a row of ``table`` that returns its TikZ node.
+
+        Nodes with pre-rendered ``boxes`` are not cached, so they are only formatted when they are requested.
+        The others are taken from :meth:`_table_nodes`.
+        """
+        if boxes is None:
+            return self._table_nodes(kind, table, faded).__getitem__
+
+        def node(i):
+            record = table[i]
+            return _format_node(_table_node_name(record), record, faded[i], boxes)
+
+        return node
+
+    def _table_nodes(self, kind, table, faded):
+        """
+        Return the TikZ nodes of all rows of ``table``, cached under the keys ``(kind, i)``.
+
+        A node is rendered once and reused until its row is written again, its fading changes,
+        or the cache is invalidated.
+        """
+        cache = self._node_cache
+        entries = [cache.get((kind, i)) for i in range(len(table))]
+        stale = [
+            i
+            for i, (entry, stamp, faded_i) in enumerate(zip(entries, table.stamps, faded))
+            if entry is None or entry[0] != stamp or entry[1] != faded_i
+        ]
+        if stale:
+            # decoding all the records at once is faster than one by one, e.g. for the first render
+            records = list(table) if len(stale) > len(table) // 8 else None
+            for i in stale:
+                record = table[i] if records is None else records[i]
+                node = _format_node(_table_node_name(record), record, faded[i])
+                entries[i] = cache[kind, i] = (table.stamps[i], faded[i], node)
+        return [entry[2] for entry in entries]
+
+    def _grid_offsets(self):
+        """Return the size of the (square) grid, and the row and column offsets of the components on its diagonal."""
         size = len(self.systems)
 
-        comps_rows = np.arange(size)
-        comps_cols = np.arange(size)
+        # offsets of the components on the diagonal
+        row_offset = 0
+        col_offset = 0
 
         if self.ins:
             size += 1
             # move all comps down one row
-            comps_rows += 1
+            row_offset = 1
 
         if self.left_outs:
             size += 1
             # shift all comps to the right by one, to make room for inputs
-            comps_cols += 1
+            col_offset = 1
 
         if self.right_outs:
             size += 1
             # don't need to shift anything in this case
 
-        # build a map between comp node_names and row idx for ordering calculations
-        row_idx_map = {}
-        col_idx_map = {}
+        return size, row_offset, col_offset
 
-        node_str = r"\node [{style}] ({node_name}) {{{node_label}}};"
+    def _node_contents(self, fading):
+        """Return the distinct ``(style, label)`` of the nodes of the grid, in order."""
+        contents = dict.fromkeys(map(_node_content, self.systems, fading.systems.tolist()))
+        contents.update(dict.fromkeys(map(_node_content, self.connections, fading.connections.tolist())))
+        for records, faded in (
+            (self.left_outs, fading.left_outs),
+            (self.right_outs, fading.right_outs),
+            (self.ins, fading.inputs),
+        ):
+            contents.update(dict.fromkeys(_node_content(record, faded[name]) for name, record in records.items()))
+        return list(contents)
 
-        grid = np.empty((size, size), dtype=object)
-        grid[:] = ""
+    def _boxes(self, fading, box_cache, quiet=False, quality="full"):
+        """
+        Return the ``\\includegraphics`` of the pre-rendered picture of every node, by ``(style, label)``.
 
-        # add all the components on the diagonal
-        for i_row, j_col, comp in zip(comps_rows, comps_cols, self.systems):
-            style = comp.style
-            if comp.stack:
-                style += ",stack"
-            if comp.faded:
-                style += ",faded"
+        The pictures that are not in ``box_cache`` yet are compiled first.
+        """
+        tex_str = tex_template.format(
+            tikzpicture="",
+            optional_packages=self._compose_optional_package_list(),
+            version=pyxdsm_version,
+        )
+        preamble = tex_str[: tex_str.index(r"\begin{document}")]
+        # crop each picture to its node, so that the picture can stand in for the node
+        preamble = preamble.replace(r"\setlength{\PreviewBorder}{5pt}", r"\setlength{\PreviewBorder}{0pt}")
+        preamble += '\\input{{"{}"}}\n\\begin{{document}}\n'.format(_diagram_styles_path(quality))
+
+        keys = {}
+        pages = {}
+        for style, label in self._node_contents(fading):
+            key = keys[style, label] = latex.build_key(preamble, _diagram_styles(quality), style, label)
+            pages[key] = "\\begin{{tikzpicture}}\n\\node [{}] {{{}}};\n\\end{{tikzpicture}}\n".format(style, label)
+
+        pictures = box_cache.render(pages, preamble, quiet=quiet)
+        boxes = {}
+        for content, key in keys.items():
+            pdf_path, page = pictures[key]
+            boxes[content] = r"\includegraphics[page={}]{{{}}}".format(page, pdf_path.replace("\\", "/"))
+        return boxes
 
-            label = _parse_label(comp.label, comp.label_width)
-            node = node_str.format(style=style, node_name=comp.node_name, node_label=label)
-            grid[i_row, j_col] = node
+    def _build_edges(self):
+        return "".join(self._iter_edges())
 
-            row_idx_map[comp.node_name] = i_row
-            col_idx_map[comp.node_name] = j_col
+    def _edges(self, fading=None):
+        """Return the horizontal and vertical data lines as two lists of Edge records, see _iter_edge_records."""
+        if fading is None:
+            fading = self._fading()
+        return list(self._iter_edge_records(fading, True)), list(self._iter_edge_records(fading, False))
 
-        # add all the off diagonal nodes from components
-        for conn in self.connections:
-            # src, target, style, label, stack, faded, label_width
-            src_row = row_idx_map[conn.src]
-            target_col = col_idx_map[conn.target]
+    def _iter_edge_records(self, fading, horizontal):
+        """
+        Yield the horizontal or the vertical data lines as Edge records.
 
-            loc = (src_row, target_col)
+        The faded edges come after the others, so that they are drawn below them.
+        The relative order of the edges is preserved otherwise.
+        """
+        conns = self.connections
+        if horizontal:
+            conns_faded = fading.h_edges
+            outputs = ((self.left_outs, fading.left_outs), (self.right_outs, fading.right_outs))
+        else:
+            conns_faded = fading.v_edges
+            outputs = ((self.ins, fading.inputs),)
+
+        for faded in (False, True):
+            selected = (conns_faded if faded else ~conns_faded).tolist()
+            for src, target in itertools.compress(zip(conns.column("src"), conns.column("target")), selected):
+                od_node_name = "{}-{}".format(src, target)
+                yield Edge(src, od_node_name, faded) if horizontal else Edge(od_node_name, target, faded)
+
+            for outs, outs_faded in outputs:
+                for comp_name, out in outs.items():
+                    if outs_faded[comp_name] == faded:
+                        yield Edge(comp_name, out.node_name, faded)
+
+    def _iter_edges(self, fading=None):
+        """Yield the data line paths, horizontal edges first, then vertical edges, without holding them all."""
+        if fading is None:
+            fading = self._fading()
+
+        yield "% Horizontal edges\n"
+        yield from _iter_joined("\n", map(_format_edge, self._iter_edge_records(fading, True)))
+        yield "\n% Vertical edges\n"
+        yield from _iter_joined("\n", map(_format_edge, self._iter_edge_records(fading, False)))
+        yield ";"
 
-            style = conn.style
-            if conn.stack:
-                style += ",stack"
-            if conn.faded:
-                style += ",faded"
+    def _build_process_chain(self):
+        return "".join(self._iter_process_chain())
+
+    def _output_node_names(self):
+        """Return the set of node names of all inputs and outputs."""
+        names = set()
+        for outs in (self.ins, self.left_outs, self.right_outs):
+            names.update(out.node_name for out in outs.values())
+        return names
+
+    def _check_processes(self):
+        """Raise a ValueError listing every name used in a process that is not a system, input or output."""
+        output_names = self._output_node_names()
+        unknown = {}
+        for proc in self.processes:
+            for sys in proc.systems:
+                if sys not in self._system_index and sys not in output_names:
+                    # dict to report each name once, in order of appearance
+                    unknown[sys] = None
+
+        if len(unknown) == 1:
+            raise ValueError(
+                'process includes a system named "{}" but no system with that name exists.'.format(*unknown)
+            )
+        elif unknown:
+            raise ValueError(
+                "processes include systems named {} but no systems with these names exist.".format(
+                    ", ".join('"{}"'.format(sys) for sys in unknown)
+                )
+            )
 
-            label = _parse_label(conn.label, conn.label_width)
+    def _iter_process_chain(self, fading=None):
+        """Yield the TikZ chain of each process. Call _check_processes first to validate the names."""
+        if fading is None:
+            fading = self._fading()
 
-            node_name = "{}-{}".format(conn.src, conn.target)
+        output_names = frozenset(self._output_node_names())
+        if output_names != self._process_output_names:
+            # the tips of the chains depend on which nodes are inputs and outputs
+            self._process_cache.clear()
+            self._process_output_names = output_names
 
-            node = node_str.format(style=style, node_name=node_name, node_label=label)
+        for i_proc, (proc, faded) in enumerate(zip(self.processes, fading.processes)):
+            entry = self._process_cache.get(i_proc)
+            if entry is None or entry[0] is not proc or entry[1] != faded:
+                entry = (proc, faded, _format_process(proc, output_names, faded))
+                self._process_cache[i_proc] = entry
+            yield entry[2]
 
-            grid[loc] = node
+    def _compose_optional_package_list(self):
+        # Check for optional LaTeX packages
+        optional_packages_list = list(self.optional_packages)
+        if self.use_sfmath:
+            optional_packages_list.append("sfmath")
 
-        # add the nodes for left outputs
-        for comp_name, out in self.left_outs.items():
-            style = out.style
-            if out.stack:
-                style += ",stack"
-            if out.faded:
-                style += ",faded"
+        # Join all packages into one string separated by comma
+        optional_packages_str = ",".join(optional_packages_list)
+
+        return optional_packages_str
 
-            i_row = row_idx_map[comp_name]
-            loc = (i_row, 0)
+    def _iter_tikz(self, faded_systems=None, box_cache=None, quiet=False, quality="full", processes=True, timings=None):
+        """
+        Yield the TikZ definition of the diagram in order, one fragment at a time.
 
-            label = _parse_label(out.label, out.label_width)
-            node = node_str.format(style=style, node_name=out.node_name, node_label=label)
+        If ``faded_systems`` is given, these systems are faded instead of the ones faded in ``self.systems``.
+        If a :class:`~pyxdsm.latex.BoxCache` is given, the nodes include their pictures from this cache.
+        The ``quality`` selects the styles, and the process chains are left out if ``processes`` is False.
+        If ``timings`` is a dict, each part of the diagram is rendered up front, and the time it took
+        is stored in ``timings``.
+        """
+        # validate up front so that nothing is written for an invalid diagram
+        diagram_styles_path = _diagram_styles_path(quality)
+        self._check_processes()
+        fading = self._fading(faded_systems)
+        boxes = None
+        if box_cache is not None:
+            t0 = time.perf_counter()
+            boxes = self._boxes(fading, box_cache, quiet, quality)
+            if timings is not None:
+                timings["boxes"] = time.perf_counter() - t0
+
+        nodes = self._iter_node_grid(fading, boxes)
+        edges = self._iter_edges(fading)
+        process = self._iter_process_chain(fading) if processes else ""
+        if timings is not None:
+            nodes = _timed(timings, "node_grid", nodes)
+            edges = _timed(timings, "edges", edges)
+            process = _timed(timings, "process", process)
+
+        return _iter_template(
+            tikzpicture_template,
+            nodes=nodes,
+            edges=edges,
+            process=process,
+            diagram_styles_path=diagram_styles_path,
+            optional_packages=self._compose_optional_package_list(),
+        )
+
+    def to_tikz(self):
+        """
+        Return the TikZ definition of the XDSM diagram, i.e. the content of the ``.tikz`` file.
+
+        Returns
+        -------
+        str
+            The TikZ picture, which can be included in another LaTeX document.
+        """
+        return "".join(self._iter_tikz())
+
+    def to_tex(self, tikzpicture_path=None):
+        """
+        Return the standalone LaTeX document of the XDSM diagram, i.e. the content of the ``.tex`` file.
+
+        Parameters
+        ----------
+        tikzpicture_path : str or None
+            Path of the ``.tikz`` file to ``\\input`` in the document.
+            If None, the TikZ picture is embedded in the document, which can then be compiled
+            without any other generated file.
+
+        Returns
+        -------
+        str
+            The LaTeX document.
+        """
+        if tikzpicture_path is None:
+            tikzpicture = self.to_tikz()
+        else:
+            tikzpicture = r'\input{{"{}"}}'.format(tikzpicture_path)
 
-            grid[loc] = node
+        return tex_template.format(
+            tikzpicture=tikzpicture,
+            optional_packages=self._compose_optional_package_list(),
+            version=pyxdsm_version,
+        )
 
-        # add the nodes for right outputs
-        for comp_name, out in self.right_outs.items():
-            style = out.style
-            if out.stack:
-                style += ",stack"
-            if out.faded:
-                style += ",faded"
+    def to_svg(self):
+        """
+        Return the diagram as an SVG image, which is rendered in Python without LaTeX.
 
-            i_row = row_idx_map[comp_name]
-            loc = (i_row, -1)
-            label = _parse_label(out.label, out.label_width)
-            node = node_str.format(style=style, node_name=out.node_name, node_label=label)
+        The SVG has the same layout, shapes and colors as the PDF, but the labels are converted
+        to plain text and their size is estimated, see :mod:`pyxdsm.svg`.
 
-            grid[loc] = node
+        Returns
+        -------
+        str
+            The SVG document.
+        """
+        return svg.to_svg(self)
 
-        # add the inputs to the top of the grid
-        for comp_name, inp in self.ins.items():
-            # node_name, style, label, stack = in_data
-            style = inp.style
-            if inp.stack:
-                style += ",stack"
-            if inp.faded:
-                style += ",faded"
+    def write_svg(self, file_name, outdir="."):
+        """
+        Write the diagram to ``{file_name}.svg`` without LaTeX, see :meth:`to_svg`.
 
-            j_col = col_idx_map[comp_name]
-            loc = (0, j_col)
-            label = _parse_label(inp.label, label_width=inp.label_width)
-            node = node_str.format(style=style, node_name=inp.node_name, node_label=label)
+        Parameters
+        ----------
+        file_name : str
+            The prefix to be used for the output file
+        outdir : str
+            Path to an existing directory in which to place the output file.
+        """
+        svg_str = self.to_svg()
+        with open(os.path.join(outdir, file_name + ".svg"), "w", encoding="utf-8") as f:
+            f.write(svg_str)
 
-            grid[loc] = node
+    def to_html(self, title="XDSM"):
+        """
+        Return the diagram as a self-contained HTML page, to explore large diagrams in a browser.
 
-        # mash the grid data into a string
-        rows_str = ""
-        for i, row in enumerate(grid):
-            rows_str += "%Row {}\n".format(i) + "&\n".join(row) + r"\\" + "\n"
+        The page embeds the diagram as compact JSON, and a small script that only draws the part in view.
+        It can search the systems and variables, and highlights the upstream and downstream connections
+        of the node under the mouse. The layout and labels are the ones of :meth:`to_svg`.
 
-        return rows_str
+        Parameters
+        ----------
+        title : str
+            The title of the page
 
-    def _build_edges(self):
-        h_edges = []
-        v_edges = []
+        Returns
+        -------
+        str
+            The HTML document.
+        """
+        return viewer.to_html(self, title=title)
 
-        edge_format_string = "({start}) edge [{style}] ({end})"
-        for conn in self.connections:
-            h_edge_style = "DataLine"
-            v_edge_style = "DataLine"
-            if conn.src_faded or conn.faded:
-                h_edge_style += ",faded"
-            if conn.target_faded or conn.faded:
-                v_edge_style += ",faded"
-            od_node_name = "{}-{}".format(conn.src, conn.target)
-
-            h_edges.append(edge_format_string.format(start=conn.src, end=od_node_name, style=h_edge_style))
-            v_edges.append(edge_format_string.format(start=od_node_name, end=conn.target, style=v_edge_style))
-
-        for comp_name, out in self.left_outs.items():
-            style = "DataLine"
-            if out.faded:
-                style += ",faded"
-            node_name = out.node_name
-            h_edges.append(edge_format_string.format(start=comp_name, end=node_name, style=style))
-
-        for comp_name, out in self.right_outs.items():
-            style = "DataLine"
-            if out.faded:
-                style += ",faded"
-            node_name = out.node_name
-            h_edges.append(edge_format_string.format(start=comp_name, end=node_name, style=style))
-
-        for comp_name, inp in self.ins.items():
-            style = "DataLine"
-            if inp.faded:
-                style += ",faded"
-            node_name = inp.node_name
-            v_edges.append(edge_format_string.format(start=comp_name, end=node_name, style=style))
-
-        h_edges = sorted(h_edges, key=lambda s: "faded" in s)
-        v_edges = sorted(v_edges, key=lambda s: "faded" in s)
-
-        paths_str = "% Horizontal edges\n" + "\n".join(h_edges) + "\n"
-        paths_str += "% Vertical edges\n" + "\n".join(v_edges) + ";"
-
-        return paths_str
+    def write_html(self, file_name, outdir="."):
+        """
+        Write the diagram to ``{file_name}.html``, which works offline, see :meth:`to_html`.
 
-    def _build_process_chain(self):
-        sys_names = [s.node_name for s in self.systems]
-        output_names = (
-            [data[0] for _, data in self.ins.items()]
-            + [data[0] for _, data in self.left_outs.items()]
-            + [data[0] for _, data in self.right_outs.items()]
+        Parameters
+        ----------
+        file_name : str
+            The prefix to be used for the output file
+        outdir : str
+            Path to an existing directory in which to place the output file.
+        """
+        html_str = self.to_html(title=file_name)
+        with open(os.path.join(outdir, file_name + ".html"), "w", encoding="utf-8") as f:
+            f.write(html_str)
+
+    def _iter_json(self):
+        """Yield the JSON snapshot of the diagram in order, one fragment at a time, see :meth:`write_json`."""
+        header = {
+            "format": JSON_FORMAT,
+            "version": JSON_VERSION,
+            "options": {
+                "auto_fade": self.auto_fade,
+                "optional_latex_packages": list(self.optional_packages),
+                "use_sfmath": bool(self.use_sfmath),
+            },
+        }
+        # the header is left open, so that it is the first line and the sections follow
+        yield _json_dumps(header)[:-1] + ",\n"
+
+        outs = itertools.chain(self.left_outs.items(), self.right_outs.items())
+        sections = {
+            "systems": (
+                [sys.node_name, sys.style, sys.label, int(sys.stack), int(sys.faded), sys.label_width, sys.spec_name]
+                for sys in self.systems
+            ),
+            "connections": (
+                [
+                    conn.src,
+                    conn.target,
+                    conn.label,
+                    conn.label_width,
+                    conn.style,
+                    int(conn.stack),
+                    int(conn.faded),
+                    int(conn.src_faded),
+                    int(conn.target_faded),
+                ]
+                for conn in self.connections
+            ),
+            "inputs": (
+                [name, inp.label, inp.label_width, inp.style, int(bool(inp.stack)), int(bool(inp.faded))]
+                for name, inp in self.ins.items()
+            ),
+            "outputs": (
+                [name, out.label, out.label_width, out.style, int(bool(out.stack)), int(bool(out.faded)), out.side]
+                for name, out in outs
+            ),
+            "processes": (
+                [list(proc.systems), int(bool(proc.arrow)), int(bool(proc.faded))] for proc in self.processes
+            ),
+        }
+        for i_section, name in enumerate(JSON_SECTIONS):
+            # one record per line, so that the file can be read record by record
+            rows = iter(sections[name])
+            first = next(rows, None)
+            yield '"{}":['.format(name)
+            if first is not None:
+                yield "\n"
+                yield from _iter_joined(",\n", map(_json_dumps, itertools.chain([first], rows)))
+            yield "\n]}\n" if i_section == len(JSON_SECTIONS) - 1 else "\n],\n"
+
+    def to_json(self):
+        """
+        Return a JSON snapshot of the diagram, which :meth:`from_json` turns back into an identical diagram.
+
+        Returns
+        -------
+        str
+            The JSON document, see :meth:`write_json`.
+        """
+        buf = io.StringIO()
+        self.write_json(buf)
+        return buf.getvalue()
+
+    def write_json(self, fileobj):
+        """
+        Write a JSON snapshot of the diagram to a writable text stream.
+
+        The snapshot holds the systems, connections, inputs, outputs and processes, the ``auto_fade``
+        settings and the LaTeX options, so that a diagram built once can be rendered many times with
+        :meth:`read_json`. It is deterministic, so two identical diagrams give the same JSON, which can
+        serve as a cache key.
+
+        The document is a JSON object with the ``"format"``, ``"version"`` and ``"options"`` of the diagram
+        on its first line, followed by one list per section of :data:`JSON_SECTIONS`, with one record per line.
+        Each record is a list of the fields of the element, with its flags as 0 or 1. Since the
+        records are streamed, the complete JSON string is never held in memory.
+
+        Parameters
+        ----------
+        fileobj : file-like
+            Any object with a ``write(str)`` method, e.g. a file opened in text mode,
+            ``gzip.open(path, "wt")`` or ``io.StringIO``.
+        """
+        for fragment in self._iter_json():
+            fileobj.write(fragment)
+
+    @classmethod
+    def from_json(cls, json_str):
+        """
+        Create a diagram from the JSON snapshot returned by :meth:`to_json`.
+
+        Labels given as lists are read as tuples, which render the same.
+
+        Parameters
+        ----------
+        json_str : str
+            The JSON document
+
+        Returns
+        -------
+        XDSM
+            The diagram
+        """
+        data = json.loads(json_str)
+        if not isinstance(data, dict):
+            raise ValueError("Invalid XDSM JSON: expected an object")
+        return cls._from_json_sections(data, ((name, data[name]) for name in JSON_SECTIONS if name in data))
+
+    @classmethod
+    def read_json(cls, fileobj):
+        """
+        Create a diagram from a JSON snapshot written by :meth:`write_json`.
+
+        The records are read one line at a time, so that the JSON of very large diagrams is never
+        held in memory at once. A JSON document with another layout, e.g. reformatted by another tool,
+        is read as a whole instead.
+
+        Parameters
+        ----------
+        fileobj : file-like
+            A readable text stream, e.g. a file opened in text mode or ``gzip.open(path, "rt")``.
+
+        Returns
+        -------
+        XDSM
+            The diagram
+        """
+        lines = iter(fileobj)
+        first = next(lines, "")
+        header = None
+        if first.rstrip().endswith(","):
+            try:
+                header = json.loads(first.rstrip()[:-1] + "}")
+            except ValueError:
+                pass
+        if not isinstance(header, dict) or any(name in header for name in JSON_SECTIONS):
+            return cls.from_json(first + "".join(lines))
+        return cls._from_json_sections(header, _iter_json_sections(lines))
+
+    @classmethod
+    def _from_json_sections(cls, header, sections):
+        """Create a diagram from the header of its JSON snapshot and the (name, records) of its sections."""
+        if header.get("format") != JSON_FORMAT or header.get("version") != JSON_VERSION:
+            raise ValueError(
+                "Unsupported XDSM JSON: expected format {} version {}, got {} version {}".format(
+                    JSON_FORMAT, JSON_VERSION, header.get("format"), header.get("version")
+                )
+            )
+        options = header["options"]
+        xdsm = cls(
+            use_sfmath=options["use_sfmath"],
+            optional_latex_packages=options["optional_latex_packages"],
+            auto_fade=options["auto_fade"],
         )
-        # comp_name, in_data in self.ins.items():
-        #     node_name, style, label, stack = in_data
-        chain_str = ""
+        loaders = {
+            "systems": xdsm._load_json_systems,
+            "connections": xdsm._load_json_connections,
+            "inputs": xdsm._load_json_inputs,
+            "outputs": xdsm._load_json_outputs,
+            "processes": xdsm._load_json_processes,
+        }
+        for name, rows in sections:
+            if name not in loaders:
+                raise ValueError('Invalid XDSM JSON: unknown section "{}"'.format(name))
+            loaders[name](rows)
+        return xdsm
+
+    def _load_json_systems(self, rows):
+        for chunk in _iter_chunks(rows):
+            names, styles, labels, stacks, fadeds, label_widths, spec_names = zip(*chunk)
+            index = self._system_index
+            seen = set()
+            for name in names:
+                if name in index or name in seen:
+                    raise ValueError('A system named "{}" already exists.'.format(name))
+                seen.add(name)
+            self._extend_systems(
+                names,
+                style=styles,
+                label=[_json_label(label) for label in labels],
+                stack=stacks,
+                faded=fadeds,
+                label_width=label_widths,
+                spec_name=spec_names,
+            )
 
-        for proc in self.processes:
-            chain_str += "{ [start chain=process]\n \\begin{pgfonlayer}{process} \n"
-            start_tip = False
-            for i, sys in enumerate(proc.systems):
-                if sys not in sys_names and sys not in output_names:
-                    raise ValueError(
-                        'process includes a system named "{}" but no system with that name exists.'.format(sys)
-                    )
-                if sys in output_names and i == 0:
-                    start_tip = True
-                if i == 0:
-                    chain_str += "\\chainin ({});\n".format(sys)
-                else:
-                    if sys in output_names or (i == 1 and start_tip):
-                        if proc.arrow:
-                            style = "ProcessTipA"
-                        else:
-                            style = "ProcessTip"
-                    else:
-                        if proc.arrow:
-                            style = "ProcessHVA"
-                        else:
-                            style = "ProcessHV"
-                    if proc.faded:
-                        style = "Faded" + style
-                    chain_str += "\\chainin ({}) [join=by {}];\n".format(sys, style)
-            chain_str += "\\end{pgfonlayer}\n}"
-
-        return chain_str
+    def _load_json_connections(self, rows):
+        for chunk in _iter_chunks(rows):
+            srcs, targets, labels, label_widths, styles, stacks, fadeds, src_fadeds, target_fadeds = zip(*chunk)
+            for i_conn, pair in enumerate(zip(srcs, targets), start=len(self.connections)):
+                for name in pair:
+                    if name not in self._system_index:
+                        raise ValueError('connection refers to a system named "{}" that does not exist.'.format(name))
+                self._connection_index[pair] = i_conn
+            self.connections.extend_columns(
+                src=srcs,
+                target=targets,
+                label=[_json_label(label) for label in labels],
+                label_width=label_widths,
+                style=styles,
+                stack=stacks,
+                faded=fadeds,
+                src_faded=src_fadeds,
+                target_faded=target_fadeds,
+            )
 
-    def _compose_optional_package_list(self):
-        # Check for optional LaTeX packages
-        optional_packages_list = self.optional_packages
-        if self.use_sfmath:
-            optional_packages_list.append("sfmath")
+    def _load_json_inputs(self, rows):
+        for name, label, label_width, style, stack, faded in rows:
+            self.add_input(name, _json_label(label), label_width, style, bool(stack), bool(faded))
 
-        # Join all packages into one string separated by comma
-        optional_packages_str = ",".join(optional_packages_list)
+    def _load_json_outputs(self, rows):
+        for name, label, label_width, style, stack, faded, side in rows:
+            self.add_output(name, _json_label(label), label_width, style, bool(stack), bool(faded), side)
 
-        return optional_packages_str
+    def _load_json_processes(self, rows):
+        for systems, arrow, faded in rows:
+            self.add_process(systems, bool(arrow), bool(faded))
+
+    def write_tikz(self, fileobj):
+        """
+        Write the TikZ definition of the XDSM diagram to a writable text stream.
+
+        The diagram is streamed fragment by fragment, so the complete TikZ string is never held in memory.
+        The grid is placed one row at a time and the data lines are formatted as they are written.
+        Apart from the nodes kept for the next render, see :meth:`invalidate`, the memory used while writing
+        is a few integers per connection, plus one row of the grid.
+        This is also what :meth:`write` uses to produce the ``.tikz`` file.
 
-    def write(self, file_name, build=True, cleanup=True, quiet=False, outdir="."):
+        Parameters
+        ----------
+        fileobj : file-like
+            Any object with a ``write(str)`` method, e.g. a file opened in text mode,
+            ``gzip.open(path, "wt")`` or ``io.StringIO``.
+        """
+        for fragment in self._iter_tikz():
+            fileobj.write(fragment)
+
+    def write(
+        self,
+        file_name,
+        build=True,
+        cleanup=True,
+        quiet=False,
+        outdir=".",
+        cache=None,
+        precompile_preamble=False,
+        box_cache=None,
+        quality="full",
+        processes=True,
+        engine="pdflatex",
+        profile=None,
+    ):
         """
         Write output files for the XDSM diagram.  This produces the following:
 
@@ -654,58 +1776,287 @@ class XDSM:
         outdir : str
             Path to an existing directory in which to place output files. If a relative
             path is given, it is interpreted relative to the current working directory.
+        cache : None, bool, str or :class:`~pyxdsm.latex.BuildCache`
+            Skip pdflatex when the diagram has not changed since the PDF was built.
+            The build is identified by a hash of the TikZ, the LaTeX document, the diagram styles,
+            the optional packages and the pyXDSM version, which is stored in ``{file_name}.buildkey``.
+            If True, an existing ``{file_name}.pdf`` with the same hash is reused.
+            If a :class:`~pyxdsm.latex.BuildCache` or the path of its directory is given, PDFs are also
+            copied from and to this shared cache.
+            By default, the PDF is always rebuilt.
+        precompile_preamble : bool
+            If True, the preamble of the document and the diagram styles are compiled once into a LaTeX
+            format, which is cached and reused by every diagram with the same optional packages.
+            This makes pdflatex start much faster. It requires the mylatexformat package, without it
+            the document is compiled as usual.
+        box_cache : None, bool, str or :class:`~pyxdsm.latex.BoxCache`
+            If set, every node is included as a picture that is compiled once and cached, keyed by its
+            label and style, instead of being typeset by every build. Only the nodes that are new or changed
+            are compiled, all together by a short pdflatex run, which is then much faster to rebuild large
+            diagrams after small edits. The pictures are compiled even if ``build`` is False.
+            If True, the pictures are cached in the user cache directory, a path or a
+            :class:`~pyxdsm.latex.BoxCache` selects another cache.
+            Data lines and process arrows end at the bounding box of each picture rather than at the outline
+            of the node, which only shows for rounded and stacked nodes.
+        quality : str
+            ``"full"`` for the final diagram, or ``"draft"`` for a quick preview: with the draft styles,
+            every node is a plain rectangle without shadows, which is much faster to compile for large diagrams.
+        processes : bool
+            Set to False to leave the process chains out of the diagram, e.g. to compile previews even faster.
+        engine : str
+            The TeX engine that compiles the PDF: ``"pdflatex"``, ``"lualatex"`` or ``"xelatex"``.
+            If pdflatex fails with "TeX capacity exceeded", the PDF is compiled again with lualatex,
+            which allocates its memory dynamically.
+        profile : callable or None
+            Function called with a ``BuildReport`` once the files are written, to find out where the time goes.
+            Its fields are:
+
+                - ``stages``: the wall time in seconds of each stage of the build: ``"node_grid"``,
+                  ``"edges"``, ``"process"``, ``"io"`` for writing the files, ``"compile"`` and
+                  ``"boxes"`` with a ``box_cache``
+                - ``sizes``: the size in bytes of the ``".tikz"``, ``".tex"`` and ``".pdf"`` files
+                - ``cells``, ``edges`` and ``processes``: the number of nodes, data lines and process chains
+                - ``compile``: the returned :class:`~pyxdsm.latex.CompileResult`, whose ``memory``
+                  tells how close the document is to the TeX capacity limits
+
+            When profiling, each stage is rendered in memory before it is written, instead of streaming
+            the diagram to the ``.tikz`` file.
+
+        Returns
+        -------
+        :class:`~pyxdsm.latex.CompileResult` or None
+            The engine that compiled the PDF, and whether it was the lualatex fallback,
+            or None if no PDF was compiled because ``build`` is False or the PDF was cached.
         """
-        nodes = self._build_node_grid()
-        edges = self._build_edges()
-        process = self._build_process_chain()
+        latex._check_engine(engine)
+        timings = None if profile is None else {}
+        base_output_fp = os.path.join(outdir, file_name)
+        if box_cache is True:
+            box_cache = latex.BoxCache()
+        elif isinstance(box_cache, str):
+            box_cache = latex.BoxCache(box_cache)
+        elif not box_cache:
+            box_cache = None
+        tex_str = self._write_sources(file_name, outdir, box_cache, quiet, quality, processes, timings)
+
+        result = None
+        t0 = time.perf_counter()
+        if build:
 
-        module_path = os.path.dirname(__file__)
-        diagram_styles_path = os.path.join(module_path, "diagram_styles")
-        # Hack for Windows. MiKTeX needs Linux style paths.
-        diagram_styles_path = diagram_styles_path.replace("\\", "/")
+            def _build():
+                nonlocal result
+                # formats are specific to pdflatex
+                fmt = self._preamble_format(quality) if precompile_preamble and engine == "pdflatex" else None
+                result = latex.compile_tex(
+                    file_name, outdir=outdir, quiet=quiet, cleanup=cleanup, fmt=fmt, engine=engine
+                )
 
-        optional_packages_str = self._compose_optional_package_list()
+            if cache:
+                key = latex.build_key(
+                    latex.file_digest(base_output_fp + ".tikz"),
+                    tex_str,
+                    _diagram_styles(quality),
+                    self._compose_optional_package_list(),
+                    engine,
+                )
+                latex.cached_build(key, base_output_fp, _build, cache=cache)
+            else:
+                _build()
+
+        if profile is not None:
+            exts = [".tikz", ".tex"]
+            if build:
+                timings["compile"] = time.perf_counter() - t0
+                exts.append(".pdf")
+            records = (self.systems, self.connections, self.ins, self.left_outs, self.right_outs)
+            report = BuildReport(
+                stages=timings,
+                sizes={ext: os.path.getsize(base_output_fp + ext) for ext in exts},
+                cells=sum(map(len, records)),
+                # a horizontal and a vertical data line per connection, and one per input and output
+                edges=2 * len(self.connections) + len(self.ins) + len(self.left_outs) + len(self.right_outs),
+                processes=len(self.processes) if processes else 0,
+                compile=result,
+            )
+            profile(report)
 
-        tikzpicture_str = tikzpicture_template.format(
-            nodes=nodes,
-            edges=edges,
-            process=process,
-            diagram_styles_path=diagram_styles_path,
-            optional_packages=optional_packages_str,
+        return result
+
+    async def write_async(
+        self,
+        file_name,
+        build=True,
+        cleanup=True,
+        quiet=False,
+        outdir=".",
+        precompile_preamble=False,
+        timeout=None,
+        semaphore=None,
+        engine="pdflatex",
+    ):
+        """
+        Coroutine version of :meth:`write`, which awaits pdflatex instead of blocking the event loop.
+
+        If the coroutine is cancelled, the pdflatex process is killed.
+
+        Parameters
+        ----------
+        file_name : str
+            The prefix to be used for the output files
+        build : bool
+            Flag that determines whether the standalone PDF of the XDSM will be compiled.
+            Default is True.
+        cleanup : bool
+            Flag that determines if pdflatex build files will be deleted after build is complete
+        quiet : bool
+            Set to True to suppress output from pdflatex.
+        outdir : str
+            Path to an existing directory in which to place output files. If a relative
+            path is given, it is interpreted relative to the current working directory.
+        precompile_preamble : bool
+            Compile against a cached format of the preamble, see :meth:`write`.
+        timeout : float or None
+            Time in seconds after which pdflatex is killed and ``subprocess.TimeoutExpired`` is raised.
+        semaphore : asyncio.Semaphore or None
+            Limits the number of concurrent pdflatex processes. By default, all builds in the event loop
+            share a semaphore allowing ``pyxdsm.latex.MAX_CONCURRENT_BUILDS`` processes.
+        engine : str
+            The TeX engine that compiles the PDF, with the same fallback as in :meth:`write`.
+
+        Returns
+        -------
+        :class:`~pyxdsm.latex.CompileResult` or None
+            The engine that compiled the PDF, or None if ``build`` is False.
+        """
+        latex._check_engine(engine)
+        # the files are written in a thread, so that a slow disk does not block the event loop
+        await asyncio.to_thread(self._write_sources, file_name, outdir)
+
+        if build:
+            fmt = self._preamble_format() if precompile_preamble and engine == "pdflatex" else None
+            return await latex.compile_tex_async(
+                file_name,
+                outdir=outdir,
+                quiet=quiet,
+                cleanup=cleanup,
+                fmt=fmt,
+                timeout=timeout,
+                semaphore=semaphore,
+                engine=engine,
+            )
+
+    def render_variants(
+        self, variants, file_name, build=True, cleanup=True, quiet=False, outdir=".", engine="pdflatex"
+    ):
+        """
+        Write several variants of the diagram, which only differ by the systems that are faded.
+
+        This is typically used to highlight the steps of a process one at a time.
+        The variants share the layout, labels and data lines of the diagram, only the nodes, lines
+        and processes whose fading changes are rendered again for each variant.
+        All the variants are compiled by a single run of the TeX engine, as the pages of one document,
+        which is then split into one PDF per variant. This produces the following:
+
+            - {file_name}_{variant}.tikz
+                The TikZ definition of each variant.
+            - {file_name}.tex
+                A document with all the variants, one per page.
+            - {file_name}.pdf and {file_name}_{variant}.pdf
+                Optionally, the compiled document and one PDF per variant.
+
+        Parameters
+        ----------
+        variants : dict
+            Maps the name of each variant to the set of names of the systems faded in this variant.
+            ``auto_fade`` applies to each variant as it does to the diagram.
+        file_name : str
+            The prefix to be used for the output files
+        build : bool
+            Flag that determines whether the PDFs are compiled.
+        cleanup : bool
+            Flag that determines if pdflatex build files will be deleted after build is complete
+        quiet : bool
+            Set to True to suppress output from pdflatex.
+        outdir : str
+            Path to an existing directory in which to place output files.
+        engine : str
+            The TeX engine that compiles the PDF, with the same fallback as in :meth:`write`.
+            The pages are split with the engine that compiled the document.
+
+        Returns
+        -------
+        dict
+            Maps the name of each variant to the path of its PDF, or of its TikZ file if ``build`` is False.
+        :class:`~pyxdsm.latex.CompileResult` or None
+            The engine that compiled the document, or None if ``build`` is False.
+        """
+        latex._check_engine(engine)
+        # validate all the variants before writing anything
+        self._check_processes()
+        for faded_systems in variants.values():
+            self._fading(faded_systems)
+
+        tikz_names = {}
+        for name, faded_systems in variants.items():
+            tikz_names[name] = "{}_{}.tikz".format(file_name, name)
+            with open(os.path.join(outdir, tikz_names[name]), "w") as f:
+                for fragment in self._iter_tikz(faded_systems):
+                    f.write(fragment)
+
+        tex_str = tex_template.format(
+            tikzpicture="\n\n".join(r'\input{{"{}"}}'.format(tikz_name) for tikz_name in tikz_names.values()),
+            optional_packages=self._compose_optional_package_list(),
+            version=pyxdsm_version,
         )
+        with open(os.path.join(outdir, file_name + ".tex"), "w") as f:
+            f.write(tex_str)
 
-        base_output_fp = os.path.join(outdir, file_name)
-        with open(base_output_fp + ".tikz", "w") as f:
-            f.write(tikzpicture_str)
+        if not build:
+            return {name: os.path.join(outdir, tikz_name) for name, tikz_name in tikz_names.items()}, None
+
+        result = latex.compile_tex(file_name, outdir=outdir, quiet=quiet, cleanup=cleanup, engine=engine)
+        pdf_paths = {name: os.path.join(outdir, "{}_{}.pdf".format(file_name, name)) for name in variants}
+        latex.split_pdf(
+            os.path.join(outdir, file_name + ".pdf"), list(pdf_paths.values()), quiet=quiet, engine=result.engine
+        )
+        return pdf_paths, result
 
+    def _preamble_format(self, quality="full"):
+        """Return the cached LaTeX format of the preamble and styles of the .tex file, or None if unavailable."""
         tex_str = tex_template.format(
-            nodes=nodes,
-            edges=edges,
-            tikzpicture_path=file_name + ".tikz",
-            diagram_styles_path=diagram_styles_path,
-            optional_packages=optional_packages_str,
+            tikzpicture="",
+            optional_packages=self._compose_optional_package_list(),
             version=pyxdsm_version,
         )
+        preamble = tex_str[: tex_str.index(r"\begin{document}")]
+        preamble += '\\input{{"{}"}}\n'.format(_diagram_styles_path(quality))
+        return latex.preamble_format(preamble, depends=[_diagram_styles(quality)])
+
+    def _write_sources(
+        self, file_name, outdir, box_cache=None, quiet=False, quality="full", processes=True, timings=None
+    ):
+        """
+        Write the .tikz and .tex files, and return the content of the .tex file.
+
+        If ``timings`` is a dict, the time spent in each stage is stored in it, see :meth:`write`.
+        """
+        base_output_fp = os.path.join(outdir, file_name)
+        # validated before the file is opened
+        fragments = self._iter_tikz(
+            box_cache=box_cache, quiet=quiet, quality=quality, processes=processes, timings=timings
+        )
+        t0 = time.perf_counter()
+        with open(base_output_fp + ".tikz", "w") as f:
+            for fragment in fragments:
+                f.write(fragment)
 
+        tex_str = self.to_tex(tikzpicture_path=file_name + ".tikz")
         with open(base_output_fp + ".tex", "w") as f:
             f.write(tex_str)
+        if timings is not None:
+            timings["io"] = time.perf_counter() - t0
 
-        if build:
-            command = [
-                "pdflatex",
-                "-halt-on-error",
-                "-interaction=nonstopmode",
-                "-output-directory={}".format(outdir),
-            ]
-            if quiet:
-                command += ["-interaction=batchmode", "-halt-on-error"]
-            command += [f"{file_name}.tex"]
-            subprocess.run(command, check=True)
-            if cleanup:
-                for ext in ["aux", "fdb_latexmk", "fls", "log"]:
-                    f_name = "{}.{}".format(base_output_fp, ext)
-                    if os.path.exists(f_name):
-                        os.remove(f_name)
+        return tex_str
 
     def write_sys_specs(self, folder_name):
         """
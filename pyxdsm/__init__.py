@@ -1 +1,4 @@
 __version__ = "2.3.1"
+
+from pyxdsm.latex import build_many  # noqa: E402,F401
+from pyxdsm.collection import DiagramCollection  # noqa: E402,F401
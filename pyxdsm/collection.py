@@ -0,0 +1,141 @@
+"""
+Build many diagrams with one pdflatex run per kind of document.
+"""
+
+import os
+
+from pyxdsm import latex
+from pyxdsm.XDSM import XDSM
+from pyxdsm.matrix_eqn import MatrixEquation, TotalJacobian
+
+BEGIN_DOCUMENT = "\\begin{document}\n"
+END_DOCUMENT = "\\end{document}"
+
+
+def _tex_page(diagram):
+    """
+    Return the preamble of the standalone document of ``diagram``, and its body as a single page.
+
+    Diagrams with the same preamble can share a document, with one page per diagram.
+    """
+    if isinstance(diagram, XDSM):
+        # each tikzpicture is a page of its own, thanks to the preview package
+        tex = diagram.to_tex()
+    elif isinstance(diagram, (MatrixEquation, TotalJacobian)):
+        # each varwidth environment is a page of its own
+        tex = diagram.to_tex().replace(
+            r"\documentclass[border=0pt]{standalone}", r"\documentclass[border=0pt,multi=varwidth]{standalone}", 1
+        )
+    else:
+        raise TypeError("Cannot collect a {}".format(type(diagram).__name__))
+
+    i_begin = tex.index(BEGIN_DOCUMENT)
+    i_end = tex.rindex(END_DOCUMENT)
+    return tex[: i_begin + len(BEGIN_DOCUMENT)], tex[i_begin + len(BEGIN_DOCUMENT) : i_end]
+
+
+class DiagramCollection(object):
+    """
+    A set of named diagrams, which are compiled together into one PDF per diagram.
+
+    Instead of starting pdflatex for every diagram, the diagrams are written as consecutive pages of
+    a single document, which is compiled once and then split into the PDFs of the diagrams.
+    Diagrams that need a different preamble, e.g. XDSM diagrams and matrix equations, or XDSM diagrams
+    with different optional packages, are put in separate documents.
+
+    Examples
+    --------
+    >>> diagrams = DiagramCollection()
+    >>> diagrams.add("mdf", mdf)
+    >>> diagrams.add("jacobian", jacobian)
+    >>> diagrams.write("all_diagrams")
+    {'mdf': './mdf.pdf', 'jacobian': './jacobian.pdf'}
+    """
+
+    def __init__(self):
+        self.diagrams = {}
+
+    def add(self, name, diagram):
+        """
+        Add a diagram to the collection.
+
+        Parameters
+        ----------
+        name : str
+            The name of the diagram, which is also the name of its PDF.
+        diagram : XDSM, MatrixEquation or TotalJacobian
+            The diagram
+        """
+        if name in self.diagrams:
+            raise ValueError('A diagram named "{}" already exists.'.format(name))
+        if not isinstance(diagram, (XDSM, MatrixEquation, TotalJacobian)):
+            raise TypeError("Cannot collect a {}".format(type(diagram).__name__))
+        self.diagrams[name] = diagram
+
+    def _documents(self):
+        """Return the documents to compile, as a list of (preamble, [(name, page), ...])."""
+        documents = {}
+        for name, diagram in self.diagrams.items():
+            preamble, page = _tex_page(diagram)
+            documents.setdefault(preamble, []).append((name, page))
+        return list(documents.items())
+
+    def write(self, file_name, build=True, cleanup=True, quiet=False, outdir="."):
+        """
+        Write the documents of the collection, and optionally build one PDF per diagram.
+
+        This produces the following:
+
+            - {file_name}.tex, or {file_name}_{i}.tex if several documents are needed
+                The documents with one page per diagram.
+            - {file_name}.pdf and {name}.pdf
+                Optionally, the compiled documents and the PDF of each diagram.
+
+        Parameters
+        ----------
+        file_name : str
+            The prefix of the documents
+        build : bool
+            Flag that determines whether the PDFs are compiled.
+        cleanup : bool
+            Flag that determines if pdflatex build files will be deleted after build is complete
+        quiet : bool
+            Set to True to suppress output from pdflatex.
+        outdir : str
+            Path to an existing directory in which to place output files.
+
+        Returns
+        -------
+        dict
+            Maps the name of each diagram to the path of its PDF, or of the document that contains it
+            if ``build`` is False.
+        """
+        documents = self._documents()
+        doc_names = (
+            [file_name] if len(documents) == 1 else ["{}_{}".format(file_name, i) for i in range(len(documents))]
+        )
+        clashes = set(doc_names).intersection(self.diagrams)
+        if clashes:
+            raise ValueError(
+                'The diagram named "{}" would be overwritten by the document of the collection.'.format(clashes.pop())
+            )
+
+        paths = {}
+        for doc_name, (preamble, pages) in zip(doc_names, documents):
+            with open(os.path.join(outdir, doc_name + ".tex"), "w") as f:
+                f.write(preamble)
+                for _, page in pages:
+                    f.write(page)
+                f.write(END_DOCUMENT + "\n")
+
+            if not build:
+                paths.update((name, os.path.join(outdir, doc_name + ".tex")) for name, _ in pages)
+                continue
+
+            latex.compile_tex(doc_name, outdir=outdir, quiet=quiet, cleanup=cleanup)
+            pdf_paths = [os.path.join(outdir, name + ".pdf") for name, _ in pages]
+            latex.split_pdf(os.path.join(outdir, doc_name + ".pdf"), pdf_paths, quiet=quiet)
+            paths.update(zip([name for name, _ in pages], pdf_paths))
+
+        # in the order the diagrams were added
+        return {name: paths[name] for name in self.diagrams}
@@ -0,0 +1,754 @@
+"""
+Helpers to compile the LaTeX documents generated by pyXDSM.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from pyxdsm import __version__ as pyxdsm_version
+
+# files left behind by pdflatex that are deleted when cleaning up
+BUILD_EXTS = ["aux", "fdb_latexmk", "fls", "log"]
+
+BuildResult = namedtuple("BuildResult", "name pdf_path elapsed error")
+
+# the TeX engines that can compile the documents
+ENGINES = ("pdflatex", "lualatex", "xelatex")
+# pdflatex has a fixed amount of memory, lualatex allocates it as needed
+FALLBACK_ENGINE = "lualatex"
+CAPACITY_EXCEEDED = "TeX capacity exceeded"
+
+CompileResult = namedtuple("CompileResult", "engine fallback memory")
+
+# the statistics at the end of a TeX log, as the amount used and the amount available
+TEX_MEMORY_STATS = [
+    ("strings", re.compile(r"(\d+) strings out of (\d+)")),
+    ("string_characters", re.compile(r"(\d+) string characters out of (\d+)")),
+    ("main_memory", re.compile(r"(\d+) words of memory out of (\d+)")),
+    ("control_sequences", re.compile(r"(\d+) multiletter control sequences out of (\d+(?:\+\d+)?)")),
+    ("font_info", re.compile(r"(\d+) words of font info for \d+ fonts?, out of (\d+)")),
+]
+TEX_STACKS_RE = re.compile(
+    r"(\d+)i,(\d+)n,(\d+)p,(\d+)b,(\d+)s stack positions out of (\d+)i,(\d+)n,(\d+)p,(\d+)b,(\d+)s"
+)
+TEX_STACKS = ["input_stack", "nest_stack", "param_stack", "buffer", "save_stack"]
+
+# extension of the file storing the build key next to a compiled PDF
+KEY_EXT = "buildkey"
+
+
+def compile_tex(file_name, outdir=".", quiet=False, cleanup=True, isolated=False, fmt=None, engine="pdflatex"):
+    """
+    Compile ``{outdir}/{file_name}.tex`` to a PDF with a TeX engine.
+
+    Parameters
+    ----------
+    file_name : str
+        The prefix of the tex file, which is also used for the output files.
+    outdir : str
+        The directory containing the tex file, where the output files are placed.
+    quiet : bool
+        Set to True to suppress output from the engine.
+    cleanup : bool
+        Flag that determines if pdflatex build files will be deleted after build is complete
+    isolated : bool
+        If True, pdflatex writes its files to a private temporary directory inside ``outdir``,
+        and only the results are moved to ``outdir``. This allows several builds to run
+        concurrently in the same ``outdir``. The log is kept when the build fails.
+    fmt : str or None
+        Path of a format with the precompiled preamble of the document, see :func:`preamble_format`.
+        If the compilation with the format fails, the format is discarded and the document is compiled
+        again without it. Formats are only used by pdflatex.
+    engine : str
+        One of ``ENGINES``. If pdflatex fails with "TeX capacity exceeded", the document is compiled
+        again with lualatex, which allocates its memory dynamically.
+
+    Returns
+    -------
+    CompileResult
+        The engine that compiled the PDF, whether it was the lualatex fallback, and the TeX memory usage
+        read from the log before it is cleaned up, see :func:`parse_tex_memory`.
+    """
+    _check_engine(engine)
+    with _build_dir(file_name, outdir, cleanup, isolated) as (output_directory, cwd):
+        if fmt is not None and engine == "pdflatex":
+            try:
+                command = _pdflatex_command(file_name, output_directory, quiet, fmt)
+                subprocess.run(command, check=True, cwd=cwd)
+                return _compile_result(engine, False, output_directory, file_name)
+            except subprocess.CalledProcessError:
+                _discard_format(fmt)
+        try:
+            subprocess.run(_pdflatex_command(file_name, output_directory, quiet, engine=engine), check=True, cwd=cwd)
+            return _compile_result(engine, False, output_directory, file_name)
+        except subprocess.CalledProcessError:
+            if not _falls_back(engine, output_directory, file_name):
+                raise
+        command = _pdflatex_command(file_name, output_directory, quiet, engine=FALLBACK_ENGINE)
+        subprocess.run(command, check=True, cwd=cwd)
+        return _compile_result(FALLBACK_ENGINE, True, output_directory, file_name)
+
+
+async def compile_tex_async(
+    file_name,
+    outdir=".",
+    quiet=False,
+    cleanup=True,
+    isolated=False,
+    fmt=None,
+    timeout=None,
+    semaphore=None,
+    engine="pdflatex",
+):
+    """
+    Coroutine version of :func:`compile_tex`, which runs the engine without blocking the event loop.
+
+    The additional ``timeout`` and ``semaphore`` parameters are described in :func:`run_async`.
+    """
+    _check_engine(engine)
+    with _build_dir(file_name, outdir, cleanup, isolated) as (output_directory, cwd):
+        if fmt is not None and engine == "pdflatex":
+            try:
+                command = _pdflatex_command(file_name, output_directory, quiet, fmt)
+                await run_async(command, timeout, semaphore, cwd=cwd)
+                return _compile_result(engine, False, output_directory, file_name)
+            except subprocess.CalledProcessError:
+                _discard_format(fmt)
+        try:
+            command = _pdflatex_command(file_name, output_directory, quiet, engine=engine)
+            await run_async(command, timeout, semaphore, cwd=cwd)
+            return _compile_result(engine, False, output_directory, file_name)
+        except subprocess.CalledProcessError:
+            if not _falls_back(engine, output_directory, file_name):
+                raise
+        command = _pdflatex_command(file_name, output_directory, quiet, engine=FALLBACK_ENGINE)
+        await run_async(command, timeout, semaphore, cwd=cwd)
+        return _compile_result(FALLBACK_ENGINE, True, output_directory, file_name)
+
+
+def _compile_result(engine, fallback, output_directory, file_name):
+    """Return the result of a successful run, with the memory usage from its log."""
+    return CompileResult(engine, fallback, parse_tex_memory(os.path.join(output_directory, file_name + ".log")))
+
+
+def parse_tex_memory(log_path):
+    """
+    Return the memory usage reported at the end of a TeX log, to see how close a document is to the TeX limits.
+
+    Parameters
+    ----------
+    log_path : str
+        The path of the log
+
+    Returns
+    -------
+    dict or None
+        Maps each statistic to the amount used and the amount available, e.g. ``"main_memory"``,
+        ``"strings"`` and ``"save_stack"``. The statistics depend on the engine.
+        None if the log does not exist or does not report any statistic.
+    """
+    try:
+        with open(log_path, errors="replace") as f:
+            log = f.read()
+    except FileNotFoundError:
+        return None
+
+    memory = {}
+    for name, stat_re in TEX_MEMORY_STATS:
+        match = stat_re.search(log)
+        if match:
+            # the control sequences are available as the hash size plus its extra size
+            memory[name] = (int(match.group(1)), sum(map(int, match.group(2).split("+"))))
+    match = TEX_STACKS_RE.search(log)
+    if match:
+        values = list(map(int, match.groups()))
+        memory.update(zip(TEX_STACKS, zip(values[:5], values[5:])))
+    return memory or None
+
+
+def _check_engine(engine):
+    if engine not in ENGINES:
+        raise ValueError('Unknown engine "{}", expected one of: {}'.format(engine, ", ".join(ENGINES)))
+
+
+def _falls_back(engine, output_directory, file_name):
+    """Return True if the failed run of ``engine`` should be retried with the fallback engine."""
+    if engine != "pdflatex":
+        return False
+    try:
+        with open(os.path.join(output_directory, file_name + ".log"), errors="replace") as f:
+            return CAPACITY_EXCEEDED in f.read()
+    except FileNotFoundError:
+        return False
+
+
+@contextlib.contextmanager
+def _build_dir(file_name, outdir, cleanup, isolated):
+    """
+    Context for a pdflatex run, which yields the output directory and working directory to use.
+    """
+    if not isolated:
+        yield outdir, None
+        if cleanup:
+            remove_build_files(os.path.join(outdir, file_name))
+        return
+
+    build_dir = os.path.abspath(tempfile.mkdtemp(prefix=".{}-".format(file_name), dir=outdir))
+    keep_exts = ["pdf"] if cleanup else ["pdf"] + BUILD_EXTS
+    try:
+        # run from outdir, so that the tex file finds the files it includes
+        yield build_dir, outdir
+    except BaseException:
+        keep_exts.append("log")
+        raise
+    finally:
+        for ext in keep_exts:
+            f_name = "{}.{}".format(file_name, ext)
+            if os.path.exists(os.path.join(build_dir, f_name)):
+                os.replace(os.path.join(build_dir, f_name), os.path.join(outdir, f_name))
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+# default limit of the number of LaTeX processes started by run_async at the same time
+MAX_CONCURRENT_BUILDS = os.cpu_count() or 1
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+async def run_async(command, timeout=None, semaphore=None, cwd=None):
+    """
+    Run ``command`` in a subprocess like ``subprocess.run(command, check=True)``, but as a coroutine.
+
+    If the coroutine is cancelled or times out, the subprocess is killed.
+
+    Parameters
+    ----------
+    command : list of str
+        The command to run.
+    timeout : float or None
+        Time in seconds after which the subprocess is killed and ``subprocess.TimeoutExpired`` is raised.
+    semaphore : asyncio.Semaphore or None
+        Limits the number of subprocesses running at the same time, the subprocess is only started once
+        it has been acquired. By default, all runs in an event loop share a semaphore allowing
+        ``MAX_CONCURRENT_BUILDS`` subprocesses.
+    cwd : str or None
+        The working directory of the subprocess.
+    """
+    if semaphore is None:
+        loop = asyncio.get_running_loop()
+        if loop not in _semaphores:
+            _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_BUILDS)
+        semaphore = _semaphores[loop]
+
+    async with semaphore:
+        proc = await asyncio.create_subprocess_exec(*command, cwd=cwd)
+        try:
+            returncode = await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(command, timeout) from None
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+def _pdflatex_command(file_name, output_directory, quiet, fmt=None, engine="pdflatex"):
+    command = [
+        engine,
+        "-halt-on-error",
+        "-interaction=nonstopmode",
+        "-output-directory={}".format(output_directory),
+    ]
+    if quiet:
+        command += ["-interaction=batchmode", "-halt-on-error"]
+    if fmt is not None:
+        command += ["-fmt={}".format(fmt)]
+    command += [f"{file_name}.tex"]
+    return command
+
+
+def user_cache_dir():
+    """Return the directory in which pyXDSM caches files for the current user."""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pyxdsm")
+
+
+def preamble_format(preamble, depends=()):
+    """
+    Return a LaTeX format in which ``preamble`` is precompiled, to pass to pdflatex with ``-fmt``.
+
+    Loading the format is much faster than processing the preamble, which loads TikZ and its libraries.
+    The format is dumped with the mylatexformat package the first time a preamble is used,
+    and cached in the user cache directory.
+    A document compiled with the format skips its own preamble, up to ``\\begin{document}``.
+
+    Parameters
+    ----------
+    preamble : str
+        Everything that goes before ``\\begin{document}``, starting with ``\\documentclass``.
+    depends : sequence of str
+        The content of the files included by the preamble, so that the format is recreated when they change.
+
+    Returns
+    -------
+    str or None
+        The path of the format without the ``.fmt`` extension,
+        or None if it could not be created, e.g. because mylatexformat is not installed.
+    """
+    fmt_dir = os.path.join(user_cache_dir(), "formats")
+    name = "pyxdsm-" + build_key(preamble, *depends)[:16]
+    fmt = os.path.join(os.path.abspath(fmt_dir), name)
+    if os.path.isfile(fmt + ".fmt"):
+        return fmt
+
+    os.makedirs(fmt_dir, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=fmt_dir)
+    try:
+        with open(os.path.join(build_dir, "preamble.tex"), "w") as f:
+            f.write(preamble)
+            f.write("\n\\begin{document}\n\\end{document}\n")
+        command = [
+            "pdflatex",
+            "-ini",
+            "-interaction=batchmode",
+            "-halt-on-error",
+            "-jobname={}".format(name),
+            "&pdflatex",
+            "mylatexformat.ltx",
+            "preamble.tex",
+        ]
+        subprocess.run(command, check=True, cwd=build_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # atomic, so that concurrent builds never load a partially written format
+        os.replace(os.path.join(build_dir, name + ".fmt"), fmt + ".fmt")
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    return fmt
+
+
+def _discard_format(fmt):
+    try:
+        os.remove(fmt + ".fmt")
+    except FileNotFoundError:
+        pass
+
+
+def remove_build_files(base_fp, exts=BUILD_EXTS):
+    for ext in exts:
+        f_name = "{}.{}".format(base_fp, ext)
+        if os.path.exists(f_name):
+            os.remove(f_name)
+
+
+# document with a single page of another PDF, with the size of that page
+# the PDF is included by its absolute path, since TeX looks for it in the working directory, not in the output directory
+page_template = r"""\documentclass{{article}}
+\usepackage{{graphicx}}
+\usepackage[active,tightpage]{{preview}}
+\setlength{{\PreviewBorder}}{{0pt}}
+\begin{{document}}
+\begin{{preview}}\includegraphics[page={page}]{{{pdf_path}}}\end{{preview}}
+\end{{document}}
+"""
+
+
+def split_pdf(pdf_path, page_paths, quiet=False, engine="pdflatex"):
+    """
+    Write each page of a PDF to its own file.
+
+    The pages are copied with pypdf if it is installed. Otherwise, each page is extracted by a short
+    run of the TeX engine, which includes it in a document of its own size.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The PDF to split
+    page_paths : list of str
+        The path of the PDF of each page, in order. They must be in the same directory as ``pdf_path``.
+    quiet : bool
+        Set to True to suppress output from the engine.
+    engine : str
+        One of ``ENGINES``, the engine that extracts the pages if pypdf is not installed.
+    """
+    _check_engine(engine)
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        PdfReader = None
+
+    if PdfReader is not None:
+        reader = PdfReader(pdf_path)
+        for page, page_path in zip(reader.pages, page_paths):
+            writer = PdfWriter()
+            writer.add_page(page)
+            with open(page_path, "wb") as f:
+                writer.write(f)
+        return
+
+    outdir = os.path.dirname(pdf_path)
+    abs_pdf_path = os.path.abspath(pdf_path).replace("\\", "/")
+    for i_page, page_path in enumerate(page_paths, start=1):
+        if os.path.dirname(page_path) != outdir:
+            raise ValueError("The pages must be written to the directory of {}".format(pdf_path))
+        page_name = os.path.splitext(os.path.basename(page_path))[0]
+        base_fp = os.path.join(outdir, page_name)
+        with open(base_fp + ".tex", "w") as f:
+            f.write(page_template.format(page=i_page, pdf_path=abs_pdf_path))
+        compile_tex(page_name, outdir=outdir or ".", quiet=quiet, engine=engine)
+        remove_build_files(base_fp, exts=["tex"])
+
+
+def build_key(*sources):
+    """
+    Return a hash identifying a build from all of its inputs.
+
+    The pyXDSM version is always part of the key, so upgrading pyXDSM invalidates all cached builds.
+
+    Parameters
+    ----------
+    *sources : str or bytes
+        The content of everything the build depends on, e.g. the generated TeX and the styles.
+
+    Returns
+    -------
+    str
+        The hex digest of the build inputs.
+    """
+    digest = hashlib.sha256(pyxdsm_version.encode())
+    for src in sources:
+        if isinstance(src, str):
+            src = src.encode()
+        # length prefix so that moving text from one source to the next changes the key
+        digest.update(b"%d:" % len(src))
+        digest.update(src)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """Return the sha256 hex digest of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildCache(object):
+    """
+    A directory of compiled PDFs, keyed by :func:`build_key`, that can be shared between builds.
+
+    Once the total size of the cached PDFs exceeds ``max_size``, the least recently used ones are evicted.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The cache directory, which is created if it doesn't exist.
+    max_size : int
+        The maximum size of the cache in bytes.
+    """
+
+    def __init__(self, cache_dir, max_size=256 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pdf")
+
+    def get(self, key, pdf_path):
+        """
+        Copy the PDF cached for ``key`` to ``pdf_path``.
+
+        Returns
+        -------
+        bool
+            True on a cache hit, False if nothing is cached for ``key``.
+        """
+        cached = self._path(key)
+        try:
+            shutil.copyfile(cached, pdf_path)
+        except FileNotFoundError:
+            return False
+        # the modification time records when an entry was last used
+        os.utime(cached)
+        return True
+
+    def put(self, key, pdf_path):
+        """Store a copy of ``pdf_path`` for ``key``, then evict old entries if the cache is too big."""
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        os.close(fd)
+        shutil.copyfile(pdf_path, tmp_path)
+        # atomic, so that concurrent builds never see a partially written PDF
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used PDFs until the cache fits in ``max_size``."""
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # already evicted by another process
+                pass
+            total_size -= size
+
+
+def cached_build(key, base_fp, build, cache=True):
+    """
+    Produce ``{base_fp}.pdf`` by calling ``build()``, unless a PDF for ``key`` is already available.
+
+    The key of the last build is stored in ``{base_fp}.buildkey``, so an existing PDF is reused when its key
+    matches. Otherwise, the PDF is copied from the shared cache if ``cache`` is a :class:`BuildCache`.
+
+    Parameters
+    ----------
+    key : str
+        The build key of the document, see :func:`build_key`.
+    base_fp : str
+        The path of the output files, without extension.
+    build : callable
+        Function without arguments that compiles the document to ``{base_fp}.pdf``.
+    cache : bool, str or BuildCache
+        True to only reuse the existing PDF, or a shared cache (or the path of its directory).
+
+    Returns
+    -------
+    bool
+        True if the PDF was taken from a cache, False if ``build`` was called.
+    """
+    if isinstance(cache, str):
+        cache = BuildCache(cache)
+    shared = cache if isinstance(cache, BuildCache) else None
+
+    pdf_path = base_fp + ".pdf"
+    key_path = "{}.{}".format(base_fp, KEY_EXT)
+
+    hit = False
+    if os.path.isfile(pdf_path) and os.path.isfile(key_path):
+        with open(key_path) as f:
+            hit = f.read().strip() == key
+    if not hit and shared is not None:
+        hit = shared.get(key, pdf_path)
+
+    if not hit:
+        # a failed build must not leave a stale key behind
+        if os.path.exists(key_path):
+            os.remove(key_path)
+        build()
+        if shared is not None:
+            shared.put(key, pdf_path)
+
+    with open(key_path, "w") as f:
+        f.write(key)
+
+    return hit
+
+
+class BoxCache(object):
+    """
+    A directory of small pictures, e.g. the boxes of a diagram, each compiled once and then shared
+    by every document that includes it.
+
+    Each picture is identified by a key, see :func:`build_key`. The pictures that are not cached yet are
+    compiled together, by one pdflatex run, as the pages of a single PDF. The index maps the key of each
+    picture to its PDF and page, so that a document can ``\\includegraphics`` it.
+
+    Once the total size of the cached PDFs exceeds ``max_size``, the least recently used ones are evicted,
+    as in :class:`BuildCache`.
+
+    Parameters
+    ----------
+    cache_dir : str or None
+        The cache directory, which is created if it doesn't exist.
+        By default, the ``boxes`` directory of :func:`user_cache_dir`.
+    max_size : int
+        The maximum size of the cache in bytes.
+    """
+
+    INDEX = "index.json"
+
+    def __init__(self, cache_dir=None, max_size=256 * 2**20):
+        if cache_dir is None:
+            cache_dir = os.path.join(user_cache_dir(), "boxes")
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX)) as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        # entries whose PDF was deleted are compiled again
+        return {key: entry for key, entry in index.items() if os.path.isfile(self._path(entry[0]))}
+
+    def _path(self, pdf_name):
+        return os.path.join(self.cache_dir, pdf_name)
+
+    def render(self, pages, preamble, quiet=False):
+        """
+        Return the PDF and page of each picture, compiling the ones that are not cached yet.
+
+        Parameters
+        ----------
+        pages : dict
+            Maps the key of each picture to the LaTeX body of its page.
+        preamble : str
+            Everything up to and including ``\\begin{document}``, which makes each picture a page of its own,
+            e.g. with the preview package. It must be part of the keys.
+        quiet : bool
+            Set to True to suppress output from pdflatex.
+
+        Returns
+        -------
+        dict
+            Maps the key of each picture to ``(pdf_path, page)``, with pages numbered from 1.
+        """
+        index = self._read_index()
+        missing = [key for key in pages if key not in index]
+        if missing:
+            pdf_name = "boxes-{}".format(build_key(*missing)[:16])
+            build_dir = tempfile.mkdtemp(dir=self.cache_dir)
+            try:
+                with open(os.path.join(build_dir, pdf_name + ".tex"), "w") as f:
+                    f.write(preamble)
+                    for key in missing:
+                        f.write(pages[key])
+                    f.write("\\end{document}\n")
+                compile_tex(pdf_name, outdir=build_dir, quiet=quiet)
+                # atomic, so that concurrent builds never include a partially written PDF
+                os.replace(os.path.join(build_dir, pdf_name + ".pdf"), self._path(pdf_name + ".pdf"))
+            finally:
+                shutil.rmtree(build_dir, ignore_errors=True)
+
+            # merge with the entries added by concurrent builds since the index was read
+            index = self._read_index()
+            index.update((key, [pdf_name + ".pdf", i]) for i, key in enumerate(missing, start=1))
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f, sort_keys=True)
+            os.replace(tmp_path, os.path.join(self.cache_dir, self.INDEX))
+
+        used = {index[key][0] for key in pages}
+        for pdf_name in used:
+            # the modification time records when a PDF was last used
+            os.utime(self._path(pdf_name))
+        if missing:
+            self.evict(keep=used)
+
+        return {key: (self._path(index[key][0]), index[key][1]) for key in pages}
+
+    def evict(self, keep=()):
+        """
+        Remove the least recently used PDFs until the cache fits in ``max_size``.
+
+        The PDFs named in ``keep`` are never removed, e.g. the ones included by the document being built.
+        The index entries of the removed PDFs are dropped the next time the index is read.
+        """
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                total_size += stat.st_size
+                if entry.name not in keep:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # already evicted by another process
+                pass
+            total_size -= size
+
+    def clear(self):
+        """Remove all the cached pictures."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.name == self.INDEX or entry.name.endswith(".pdf"):
+                os.remove(entry.path)
+
+
+def build_many(diagrams, jobs=None, outdir=".", quiet=True, cleanup=True, precompile_preamble=False):
+    """
+    Write and compile many XDSM diagrams, running several pdflatex jobs concurrently.
+
+    The TikZ and tex files of all diagrams are written first, then the PDFs are compiled in parallel.
+    Each job compiles in its own temporary directory, so the build files of jobs sharing ``outdir`` never collide.
+    A failing job does not stop the others, its error is reported in the returned results instead.
+
+    Parameters
+    ----------
+    diagrams : iterable of (XDSM, str)
+        The diagrams to build, with the file name prefix of each one.
+    jobs : int or None
+        The maximum number of concurrent pdflatex processes. Defaults to the number of CPUs.
+    outdir : str
+        Path to an existing directory in which to place output files.
+    quiet : bool
+        Set to False to show the (interleaved) output of pdflatex.
+    cleanup : bool
+        Flag that determines if pdflatex build files will be deleted after build is complete
+    precompile_preamble : bool
+        Compile against cached formats of the preambles, see :meth:`pyxdsm.XDSM.XDSM.write`.
+
+    Returns
+    -------
+    list of BuildResult
+        For each diagram, in order: its name, the path of the PDF (None if the build failed),
+        the wall time of the build in seconds and the exception raised by the build (None on success).
+    """
+    diagrams = list(diagrams)
+    names = [name for _, name in diagrams]
+    if len(set(names)) != len(names):
+        raise ValueError("The names of the diagrams must be unique.")
+
+    fmts = {}
+    for diagram, name in diagrams:
+        diagram.write(name, build=False, outdir=outdir)
+        # diagrams with the same preamble share a format, which is created before the parallel builds
+        fmts[name] = diagram._preamble_format() if precompile_preamble else None
+
+    def _build(name):
+        t0 = time.perf_counter()
+        try:
+            compile_tex(name, outdir=outdir, quiet=quiet, cleanup=cleanup, isolated=True, fmt=fmts[name])
+        except (subprocess.CalledProcessError, OSError) as err:
+            return BuildResult(name, None, time.perf_counter() - t0, err)
+        return BuildResult(name, os.path.join(outdir, name + ".pdf"), time.perf_counter() - t0, None)
+
+    # the jobs themselves are pdflatex processes, the threads only wait for them
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        return list(pool.map(_build, names))
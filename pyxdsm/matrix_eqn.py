@@ -1,8 +1,10 @@
+import asyncio
 import os
-import subprocess
 from collections import namedtuple
 import numpy as np
 
+from pyxdsm import latex
+
 
 # color pallette link: http://paletton.com/#uid=72Q1j0kllllkS5tKC9H96KClOKC
 
@@ -231,20 +233,46 @@ def _color(base_color, h_light):
     return color
 
 
-def _write_tikz(tikz, out_file, build=True, cleanup=True):
+def _tex_str(tikz):
+    return base_file_start + tikz + base_file_end
+
+
+def _write_tex(tikz, out_file):
     with open("{}.tex".format(out_file), "w") as f:
-        f.write(base_file_start)
-        f.write(tikz)
-        f.write(base_file_end)
+        f.write(_tex_str(tikz))
+
+
+def _write_tikz(tikz, out_file, build=True, cleanup=True, engine="pdflatex"):
+    latex._check_engine(engine)
+    _write_tex(tikz, out_file)
+
+    if build:
+        outdir, file_name = os.path.split(out_file)
+        result = latex.compile_tex(file_name, outdir=outdir or ".", cleanup=False, engine=engine)
+
+        if cleanup:
+            _cleanup(out_file)
+        return result
+
+
+async def _write_tikz_async(tikz, out_file, build=True, cleanup=True, timeout=None, semaphore=None, engine="pdflatex"):
+    latex._check_engine(engine)
+    # the file is written in a thread, so that a slow disk does not block the event loop
+    await asyncio.to_thread(_write_tex, tikz, out_file)
 
     if build:
-        subprocess.run(["pdflatex", f"{out_file}.tex"], check=True)
+        outdir, file_name = os.path.split(out_file)
+        result = await latex.compile_tex_async(
+            file_name, outdir=outdir or ".", cleanup=False, timeout=timeout, semaphore=semaphore, engine=engine
+        )
 
         if cleanup:
-            for ext in ["aux", "fdb_latexmk", "fls", "log", "tex"]:
-                f_name = "{}.{}".format(out_file, ext)
-                if os.path.exists(f_name):
-                    os.remove(f_name)
+            await asyncio.to_thread(_cleanup, out_file)
+        return result
+
+
+def _cleanup(out_file):
+    latex.remove_build_files(out_file, exts=latex.BUILD_EXTS + ["tex"])
 
 
 class TotalJacobian(object):
@@ -291,27 +319,9 @@ class TotalJacobian(object):
 
         self._setup = True
 
-    def write(self, out_file=None, build=True, cleanup=True):
+    def to_tikz(self):
         """
-        Write output files for the matrix equation diagram.  This produces the following:
-
-            - {file_name}.tikz
-                A file containing the TIKZ definition of the tikz diagram.
-            - {file_name}.tex
-                A standalone document wrapped around an include of the TIKZ file which can
-                be compiled to a pdf.
-            - {file_name}.pdf
-                An optional compiled version of the standalone tex file.
-
-        Parameters
-        ----------
-        file_name : str
-            The prefix to be used for the output files
-        build : bool
-            Flag that determines whether the standalone PDF of the XDSM will be compiled.
-            Default is True.
-        cleanup: bool
-            Flag that determines if padlatex build files will be deleted after build is complete
+        Return the TikZ blocks of the Jacobian as a string, without writing any file.
         """
         self._process_vars()
 
@@ -361,9 +371,58 @@ class TotalJacobian(object):
 
             tikz.append(r"}")
 
-        jac_tikz = "\n".join(tikz)
+        return "\n".join(tikz)
+
+    def to_tex(self):
+        """
+        Return the standalone LaTeX document of the Jacobian as a string, without writing any file.
+        """
+        return _tex_str(self.to_tikz())
+
+    def write(self, out_file=None, build=True, cleanup=True, engine="pdflatex"):
+        """
+        Write output files for the matrix equation diagram.  This produces the following:
+
+            - {file_name}.tikz
+                A file containing the TIKZ definition of the tikz diagram.
+            - {file_name}.tex
+                A standalone document wrapped around an include of the TIKZ file which can
+                be compiled to a pdf.
+            - {file_name}.pdf
+                An optional compiled version of the standalone tex file.
+
+        Parameters
+        ----------
+        file_name : str
+            The prefix to be used for the output files
+        build : bool
+            Flag that determines whether the standalone PDF of the XDSM will be compiled.
+            Default is True.
+        cleanup: bool
+            Flag that determines if padlatex build files will be deleted after build is complete
+        engine : str
+            The TeX engine that compiles the PDF: ``"pdflatex"``, ``"lualatex"`` or ``"xelatex"``.
+            If pdflatex fails with "TeX capacity exceeded", the PDF is compiled again with lualatex.
+
+        Returns
+        -------
+        :class:`~pyxdsm.latex.CompileResult` or None
+            The engine that compiled the PDF, and whether it was the lualatex fallback,
+            or None if ``build`` is False.
+        """
+        return _write_tikz(self.to_tikz(), out_file, build, cleanup, engine)
+
+    async def write_async(
+        self, out_file=None, build=True, cleanup=True, timeout=None, semaphore=None, engine="pdflatex"
+    ):
+        """
+        Coroutine version of :meth:`write`, which awaits pdflatex instead of blocking the event loop.
 
-        _write_tikz(jac_tikz, out_file, build, cleanup)
+        If the coroutine is cancelled, the pdflatex process is killed. ``timeout`` and ``semaphore``
+        limit the run time and the number of concurrent processes, see :func:`pyxdsm.latex.run_async`.
+        The ``engine`` is the same as in :meth:`write`.
+        """
+        return await _write_tikz_async(self.to_tikz(), out_file, build, cleanup, timeout, semaphore, engine)
 
 
 class MatrixEquation(object):
@@ -538,7 +597,28 @@ class MatrixEquation(object):
         self._terms.append(spacer_tikz)
         return spacer_tikz
 
-    def write(self, out_file=None, build=True, cleanup=True):
+    def to_tikz(self):
+        """
+        Return the TikZ blocks of all the terms added to the equation as a string, without writing any file.
+        """
+        tikz = []
+        tikz.append(r"\blockrow{")
+
+        for term in self._terms:
+            tikz.append(r"\blockcol{")
+            tikz.append(term)
+            tikz.append(r"}")
+        tikz.append(r"}")
+
+        return "\n".join(tikz)
+
+    def to_tex(self):
+        """
+        Return the standalone LaTeX document of the equation as a string, without writing any file.
+        """
+        return _tex_str(self.to_tikz())
+
+    def write(self, out_file=None, build=True, cleanup=True, engine="pdflatex"):
         """
         Write output files for the matrix equation diagram.  This produces the following:
 
@@ -559,20 +639,31 @@ class MatrixEquation(object):
             Default is True.
         cleanup: bool
             Flag that determines if padlatex build files will be deleted after build is complete
+        engine : str
+            The TeX engine that compiles the PDF: ``"pdflatex"``, ``"lualatex"`` or ``"xelatex"``.
+            If pdflatex fails with "TeX capacity exceeded", the PDF is compiled again with lualatex.
+
+        Returns
+        -------
+        :class:`~pyxdsm.latex.CompileResult` or None
+            The engine that compiled the PDF, and whether it was the lualatex fallback,
+            or None if ``build`` is False.
         """
-        tikz = []
-        tikz.append(r"\blockrow{")
-
-        for term in self._terms:
-            tikz.append(r"\blockcol{")
-            tikz.append(term)
-            tikz.append(r"}")
-        tikz.append(r"}")
+        if out_file:
+            return _write_tikz(self.to_tikz(), out_file, build, cleanup, engine)
 
-        eqn_tikz = "\n".join(tikz)
+    async def write_async(
+        self, out_file=None, build=True, cleanup=True, timeout=None, semaphore=None, engine="pdflatex"
+    ):
+        """
+        Coroutine version of :meth:`write`, which awaits pdflatex instead of blocking the event loop.
 
+        If the coroutine is cancelled, the pdflatex process is killed. ``timeout`` and ``semaphore``
+        limit the run time and the number of concurrent processes, see :func:`pyxdsm.latex.run_async`.
+        The ``engine`` is the same as in :meth:`write`.
+        """
         if out_file:
-            _write_tikz(eqn_tikz, out_file, build, cleanup)
+            return await _write_tikz_async(self.to_tikz(), out_file, build, cleanup, timeout, semaphore, engine)
 
 
 if __name__ == "__main__":
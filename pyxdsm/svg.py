@@ -0,0 +1,509 @@
+"""
+Render XDSM diagrams to SVG in pure Python, without LaTeX.
+
+The SVG has the layout of the TikZ picture: the same grid of nodes, data lines and process chains,
+drawn with the shapes and colors of ``diagram_styles.tex``. Since there is no TeX to typeset the labels,
+their math is converted to plain text with subscripts and superscripts, see :func:`label_segments`,
+and their size is estimated from the number of characters.
+"""
+
+import functools
+import math
+import re
+from collections import namedtuple
+from html import escape
+
+# size of a TeX point in SVG user units
+PT = 4 / 3
+CM = 72.27 / 2.54 * PT
+FONT_SIZE = 10 * PT
+LINE_HEIGHT = 1.3 * FONT_SIZE
+# average width of a character relative to the font size, to estimate the width of the labels
+CHAR_WIDTH = 0.55
+# relative size and vertical shift of subscripts and superscripts
+SCRIPT_SIZE = 0.7
+SCRIPT_SHIFT = {"sub": 0.3 * FONT_SIZE, "super": -0.4 * FONT_SIZE}
+
+# the MatrixSetup style
+ROW_SEP = 0.3 * CM
+COL_SEP = 0.2 * CM
+MARGIN = 5 * PT
+
+# the Tableau 20 colors of diagram_styles.tex
+COLORS = {
+    "red": "#A0CBE8",
+    "orange": "#FFBE7D",
+    "cyan": "#86BCB6",
+    "green": "#8CD17D",
+    "yellow": "#F1CE63",
+    "salmon": "#FF9D9A",
+}
+
+NodeStyle = namedtuple("NodeStyle", "shape fill fill_opacity inner_sep min_height")
+
+
+def _component(shape, color):
+    return NodeStyle(shape, COLORS[color], 0.8, 6 * PT, 1 * CM)
+
+
+# the node styles of diagram_styles.tex
+STYLES = {
+    "Optimization": _component("rounded", "red"),
+    "MDA": _component("rounded", "orange"),
+    "DOE": _component("rounded", "red"),
+    "SubOptimization": _component("chamfered", "red"),
+    "Group": _component("chamfered", "green"),
+    "ImplicitGroup": _component("chamfered", "salmon"),
+    "Function": _component("rectangle", "green"),
+    "ImplicitFunction": _component("rectangle", "salmon"),
+    "Metamodel": _component("rectangle", "yellow"),
+    "DataInter": NodeStyle("trapezium", "#E6E6E6", 1.0, FONT_SIZE / 3, 0.0),
+    "DataIO": NodeStyle("trapezium", "#FFFFFF", 1.0, FONT_SIZE / 3, 0.0),
+}
+# for styles defined outside of pyXDSM
+DEFAULT_STYLE = NodeStyle("rectangle", "#FFFFFF", 1.0, 6 * PT, 0.0)
+
+# the trapezium left and right angles of the data nodes
+TRAPEZIUM_SLANT = 1 / math.tan(math.radians(75))
+CHAMFER = 3 * PT
+# the offset of the copies behind stacked nodes
+STACK_SHIFT = 0.75 * 0.43 * FONT_SIZE
+
+LINE_WIDTH = 0.4 * PT
+DATA_LINE = ("#999999", 5 * PT)
+FADED_DATA_LINE = ("#E6E6E6", 5 * PT)
+PROCESS_LINE = ("#000000", 1 * PT)
+FADED_PROCESS_LINE = ("#B3B3B3", 1 * PT)
+FADED_STROKE = "#E6E6E6"
+FADED_TEXT_OPACITY = 0.2
+
+# TeX commands converted to text
+SYMBOLS = {
+    "alpha": "α",
+    "beta": "β",
+    "gamma": "γ",
+    "delta": "δ",
+    "epsilon": "ε",
+    "varepsilon": "ε",
+    "zeta": "ζ",
+    "eta": "η",
+    "theta": "θ",
+    "kappa": "κ",
+    "lambda": "λ",
+    "mu": "μ",
+    "nu": "ν",
+    "xi": "ξ",
+    "pi": "π",
+    "rho": "ρ",
+    "sigma": "σ",
+    "tau": "τ",
+    "phi": "φ",
+    "varphi": "φ",
+    "chi": "χ",
+    "psi": "ψ",
+    "omega": "ω",
+    "Gamma": "Γ",
+    "Delta": "Δ",
+    "Theta": "Θ",
+    "Lambda": "Λ",
+    "Pi": "Π",
+    "Sigma": "Σ",
+    "Phi": "Φ",
+    "Psi": "Ψ",
+    "Omega": "Ω",
+    "partial": "∂",
+    "nabla": "∇",
+    "infty": "∞",
+    "cdot": "·",
+    "times": "×",
+    "ldots": "…",
+    "dots": "…",
+    "cdots": "⋯",
+    "star": "*",
+    "ast": "*",
+    "prime": "′",
+    "leq": "≤",
+    "geq": "≥",
+    "neq": "≠",
+    "approx": "≈",
+    "rightarrow": "→",
+    "to": "→",
+    ",": " ",
+    ";": " ",
+    ":": " ",
+    "quad": " ",
+    "qquad": " ",
+    " ": " ",
+    "{": "{",
+    "}": "}",
+    "_": "_",
+    "%": "%",
+    "&": "&",
+    "$": "$",
+}
+# TeX commands whose argument is kept as it is
+FONT_COMMANDS = {
+    "text",
+    "textrm",
+    "textit",
+    "textbf",
+    "mathrm",
+    "mathit",
+    "mathbf",
+    "mathcal",
+    "mathsf",
+    "operatorname",
+}
+
+_TOKEN_RE = re.compile(r"\\([A-Za-z]+|.)|([_^{}])|(\s+)|([^\\_^{}\s]+)")
+
+
+def _tokens(tex):
+    for command, special, space, text in _TOKEN_RE.findall(tex):
+        if command:
+            yield "\\", command
+        elif special:
+            yield special, special
+        elif space:
+            yield " ", " "
+        else:
+            yield "text", text
+
+
+def _parse(tokens, position, segments, stop="}"):
+    """Append the segments of the reversed ``tokens`` up to ``stop`` to ``segments``, consuming the tokens."""
+    while tokens:
+        kind, value = tokens.pop()
+        if kind == stop:
+            break
+        if kind == "{":
+            _parse(tokens, position, segments)
+        elif kind == "}":
+            # unbalanced
+            continue
+        elif kind in "_^":
+            script = "sub" if kind == "_" else "super"
+            if not tokens:
+                continue
+            if tokens[-1][0] == "{":
+                tokens.pop()
+                _parse(tokens, script, segments)
+                continue
+            kind, value = tokens.pop()
+            if kind == "text" and len(value) > 1:
+                # only the first character is scripted, e.g. x_12 is x with the subscript 1, then 2
+                tokens.append((kind, value[1:]))
+                value = value[0]
+            segments.append((SYMBOLS.get(value, "") if kind == "\\" else value, script))
+        elif kind == "\\":
+            if value in FONT_COMMANDS and tokens and tokens[-1][0] == "{":
+                tokens.pop()
+                _parse(tokens, position, segments)
+            elif value == "frac" and len(tokens) > 1 and tokens[-1][0] == "{":
+                # numerator/denominator
+                tokens.pop()
+                _parse(tokens, position, segments)
+                segments.append(("/", position))
+            elif value in SYMBOLS:
+                segments.append((SYMBOLS[value], position))
+            # other commands, e.g. \left or \displaystyle, are dropped
+        else:
+            segments.append((value, position))
+
+
+def label_segments(tex):
+    """
+    Convert a LaTeX label to text, for renderers without TeX.
+
+    Math is converted with a few simple rules: ``$`` and braces are dropped, Greek letters and common symbols
+    are replaced by their Unicode characters, font commands such as ``\\text`` or ``\\mathcal`` keep their
+    argument, and other commands are dropped.
+
+    Parameters
+    ----------
+    tex : str
+        The label, e.g. ``r"\\mathcal{R}(y_1)"``
+
+    Returns
+    -------
+    list of tuple
+        The text of the label as ``(text, position)`` segments, where the position is ``""``,
+        ``"sub"`` for subscripts or ``"super"`` for superscripts.
+    """
+    tokens = list(_tokens(tex.replace("$", "")))
+    tokens.reverse()
+    segments = []
+    _parse(tokens, "", segments, stop=None)
+
+    # merge the consecutive segments with the same position
+    merged = []
+    for text, position in segments:
+        if merged and merged[-1][1] == position:
+            merged[-1] = (merged[-1][0] + text, position)
+        elif text:
+            merged.append((text, position))
+    return merged
+
+
+def label_lines(label, label_width=None):
+    """Return the segments of each line of a label, which is split like the labels of the TikZ nodes."""
+    if isinstance(label, (tuple, list)):
+        if label_width is None:
+            lines = list(label)
+        else:
+            lines = [", ".join(label[i : i + label_width]) for i in range(0, len(label), label_width)]
+    else:
+        lines = [label]
+    return [label_segments(line) for line in lines]
+
+
+def _text_width(segments):
+    n_chars = sum(len(text) * (SCRIPT_SIZE if position else 1) for text, position in segments)
+    return n_chars * CHAR_WIDTH * FONT_SIZE
+
+
+Box = namedtuple("Box", "row col width height markup")
+
+
+@functools.lru_cache(maxsize=4096)
+def node_size(style_name, label, label_width):
+    """
+    Return the estimated size of a node, and its label converted to text.
+
+    Parameters
+    ----------
+    style_name : str
+        The style of the node
+    label : str or tuple of str
+        The label of the node, a tuple instead of a list so that the size can be cached
+    label_width : int or None
+        The number of items of the label per line
+
+    Returns
+    -------
+    width, height : float
+        The size of the node in SVG user units
+    lines : list
+        The segments of each line of the label, see :func:`label_lines`
+    """
+    style = STYLES.get(style_name, DEFAULT_STYLE)
+    lines = label_lines(list(label) if isinstance(label, tuple) else label, label_width)
+    width = max(map(_text_width, lines)) + 2 * style.inner_sep
+    height = max(len(lines) * LINE_HEIGHT + 2 * style.inner_sep, style.min_height)
+    if style.shape == "trapezium":
+        width += height * TRAPEZIUM_SLANT
+    elif style.shape == "rounded":
+        width += height / 2
+    return width, height, lines
+
+
+@functools.lru_cache(maxsize=4096)
+def _node_markup(style_name, label, label_width, stack, faded):
+    """
+    Return the width, height and SVG elements of a node centered on the origin.
+
+    The nodes of large diagrams share few distinct labels, so their markup is cached.
+    """
+    style = STYLES.get(style_name, DEFAULT_STYLE)
+    width, height, lines = node_size(style_name, label, label_width)
+
+    if faded:
+        attrs = 'fill="#FFFFFF" stroke="{}" stroke-width="{}"'.format(FADED_STROKE, _fmt(LINE_WIDTH))
+    else:
+        opacity = ' fill-opacity="{}"'.format(style.fill_opacity) if style.fill_opacity != 1 else ""
+        attrs = 'fill="{}"{} stroke="#000000" stroke-width="{}"'.format(style.fill, opacity, _fmt(LINE_WIDTH))
+
+    x, y = -width / 2, -height / 2
+    parts = []
+    if stack:
+        for shift in (2 * STACK_SHIFT, STACK_SHIFT):
+            parts.append(_shape(style.shape, x + shift, y + shift, width, height, attrs))
+    parts.append(_shape(style.shape, x, y, width, height, attrs))
+    parts.append(_text(lines, 0.0, 0.0, FADED_TEXT_OPACITY if faded else 1))
+    return width, height, "".join(parts)
+
+
+def _box(row, col, record, faded):
+    label = tuple(record.label) if isinstance(record.label, list) else record.label
+    return Box(row, col, *_node_markup(record.style, label, record.label_width, bool(record.stack), bool(faded)))
+
+
+def _fmt(value):
+    return "{:.1f}".format(value)
+
+
+def _shape(shape, x, y, width, height, attrs):
+    """Return the SVG element of a node shape with the top left corner at (x, y)."""
+    if shape == "rounded":
+        r = _fmt(height / 2)
+        return '<rect x="{}" y="{}" width="{}" height="{}" rx="{}" ry="{}" {}/>'.format(
+            _fmt(x), _fmt(y), _fmt(width), _fmt(height), r, r, attrs
+        )
+    if shape == "chamfered":
+        c = CHAMFER
+        points = [
+            (x + c, y),
+            (x + width - c, y),
+            (x + width, y + c),
+            (x + width, y + height - c),
+            (x + width - c, y + height),
+            (x + c, y + height),
+            (x, y + height - c),
+            (x, y + c),
+        ]
+    elif shape == "trapezium":
+        slant = height * TRAPEZIUM_SLANT
+        points = [(x, y + height), (x + width - slant, y + height), (x + width, y), (x + slant, y)]
+    else:
+        return '<rect x="{}" y="{}" width="{}" height="{}" {}/>'.format(
+            _fmt(x), _fmt(y), _fmt(width), _fmt(height), attrs
+        )
+    return '<polygon points="{}" {}/>'.format(" ".join("{},{}".format(_fmt(px), _fmt(py)) for px, py in points), attrs)
+
+
+def _text(lines, cx, cy, opacity):
+    """Return the SVG text elements of the lines of a label, centered on (cx, cy)."""
+    texts = []
+    y = cy - (len(lines) - 1) * LINE_HEIGHT / 2 + 0.35 * FONT_SIZE
+    opacity_attr = ' opacity="{}"'.format(opacity) if opacity != 1 else ""
+    for segments in lines:
+        spans = []
+        shift = 0.0
+        for text, position in segments:
+            new_shift = SCRIPT_SHIFT.get(position, 0.0)
+            size_attr = ' font-size="{}"'.format(_fmt(SCRIPT_SIZE * FONT_SIZE)) if position else ""
+            spans.append('<tspan dy="{}"{}>{}</tspan>'.format(_fmt(new_shift - shift), size_attr, escape(text)))
+            shift = new_shift
+        texts.append('<text x="{}" y="{}"{}>{}</text>'.format(_fmt(cx), _fmt(y), opacity_attr, "".join(spans)))
+        y += LINE_HEIGHT
+    return "".join(texts)
+
+
+def _node(name, box, cx, cy):
+    return '<g data-node="{}" transform="translate({:.1f},{:.1f})">{}</g>'.format(escape(name), cx, cy, box.markup)
+
+
+def _process_path(start, end, end_box, tip):
+    """Return the SVG path of a process join, which ends at the border of the box of ``end``."""
+    (ax, ay), (bx, by) = start, end
+    hw, hh = end_box.width / 2, end_box.height / 2
+    if tip or ax == bx or ay == by:
+        # straight line, up to the border of the end box
+        dx, dy = bx - ax, by - ay
+        if dx == dy == 0:
+            return None
+        t = min(hw / abs(dx) if dx else math.inf, hh / abs(dy) if dy else math.inf)
+        return "M{},{} L{},{}".format(_fmt(ax), _fmt(ay), _fmt(bx - t * dx), _fmt(by - t * dy))
+    # horizontal, then vertical
+    end_y = by - math.copysign(hh, by - ay)
+    return "M{},{} L{},{} L{},{}".format(_fmt(ax), _fmt(ay), _fmt(bx), _fmt(ay), _fmt(bx), _fmt(end_y))
+
+
+def to_svg(xdsm, faded_systems=None):
+    """
+    Render an XDSM diagram to an SVG image, without LaTeX.
+
+    Parameters
+    ----------
+    xdsm : XDSM
+        The diagram
+    faded_systems : set of str or None
+        The names of the systems to fade instead of the ones faded in the diagram, as in
+        :meth:`~pyxdsm.XDSM.XDSM.render_variants`.
+
+    Returns
+    -------
+    str
+        The SVG document
+    """
+    xdsm._check_processes()
+    xdsm._check_system_names()
+    fading = xdsm._fading(faded_systems)
+    size, row_offset, col_offset = xdsm._grid_offsets()
+    index = xdsm._system_index
+
+    # the box of every node, by node name
+    boxes = {}
+    for i, (record, faded) in enumerate(zip(xdsm.systems, fading.systems.tolist())):
+        boxes[record.node_name] = _box(i + row_offset, i + col_offset, record, faded)
+    for record, faded in zip(xdsm.connections, fading.connections.tolist()):
+        boxes["{}-{}".format(record.src, record.target)] = _box(
+            index[record.src] + row_offset, index[record.target] + col_offset, record, faded
+        )
+    for comp_name, out in xdsm.left_outs.items():
+        boxes[out.node_name] = _box(index[comp_name] + row_offset, 0, out, fading.left_outs[comp_name])
+    for comp_name, out in xdsm.right_outs.items():
+        boxes[out.node_name] = _box(index[comp_name] + row_offset, size - 1, out, fading.right_outs[comp_name])
+    for comp_name, inp in xdsm.ins.items():
+        boxes[inp.node_name] = _box(0, index[comp_name] + col_offset, inp, fading.inputs[comp_name])
+
+    col_widths = [0.0] * size
+    row_heights = [0.0] * size
+    for box in boxes.values():
+        col_widths[box.col] = max(col_widths[box.col], box.width)
+        row_heights[box.row] = max(row_heights[box.row], box.height)
+
+    col_x = []
+    x = MARGIN
+    for width in col_widths:
+        col_x.append(x + width / 2)
+        x += width + COL_SEP
+    row_y = []
+    y = MARGIN
+    for height in row_heights:
+        row_y.append(y + height / 2)
+        y += height + ROW_SEP
+    total_width = x - COL_SEP + MARGIN + 2 * STACK_SHIFT
+    total_height = y - ROW_SEP + MARGIN + 2 * STACK_SHIFT
+    centers = {name: (col_x[box.col], row_y[box.row]) for name, box in boxes.items()}
+
+    svg = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}" '
+        'font-family="sans-serif" font-size="{f}" text-anchor="middle">'.format(
+            w=_fmt(total_width), h=_fmt(total_height), f=_fmt(FONT_SIZE)
+        ),
+        "<defs>",
+    ]
+    for marker_id, (color, _) in (("xdsm-arrow", PROCESS_LINE), ("xdsm-faded-arrow", FADED_PROCESS_LINE)):
+        svg.append(
+            '<marker id="{}" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="5" markerHeight="5" '
+            'orient="auto"><path d="M0,0 L10,5 L0,10 z" fill="{}"/></marker>'.format(marker_id, color)
+        )
+    svg.append("</defs>")
+
+    # data lines, below the process chains and the nodes, with the faded ones at the bottom
+    h_edges, v_edges = xdsm._edges(fading)
+    for faded, (color, width) in ((True, FADED_DATA_LINE), (False, DATA_LINE)):
+        path = [
+            "M{:.1f},{:.1f} L{:.1f},{:.1f}".format(*centers[edge.start], *centers[edge.end])
+            for edge in h_edges + v_edges
+            if edge.faded == faded
+        ]
+        if path:
+            svg.append(
+                '<path d="{}" fill="none" stroke="{}" stroke-width="{}" stroke-linecap="square"/>'.format(
+                    " ".join(path), color, _fmt(width)
+                )
+            )
+
+    # process chains
+    output_names = xdsm._output_node_names()
+    for proc, faded in zip(xdsm.processes, fading.processes):
+        color, width = FADED_PROCESS_LINE if faded else PROCESS_LINE
+        marker = ' marker-end="url(#{})"'.format("xdsm-faded-arrow" if faded else "xdsm-arrow") if proc.arrow else ""
+        start_tip = bool(proc.systems) and proc.systems[0] in output_names
+        for i, (prev, name) in enumerate(zip(proc.systems, proc.systems[1:]), start=1):
+            tip = name in output_names or (i == 1 and start_tip)
+            path = _process_path(centers[prev], centers[name], boxes[name], tip)
+            if path is not None:
+                svg.append(
+                    '<path d="{}" fill="none" stroke="{}" stroke-width="{}"{}/>'.format(
+                        path, color, _fmt(width), marker
+                    )
+                )
+
+    for name, box in boxes.items():
+        svg.append(_node(name, box, *centers[name]))
+
+    svg.append("</svg>\n")
+    return "\n".join(svg)
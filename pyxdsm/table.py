@@ -0,0 +1,324 @@
+"""
+Compact storage for the records of a diagram.
+
+A diagram with thousands of connections would otherwise hold one namedtuple per connection.
+:class:`RecordTable` stores the same records column by column instead and hands out namedtuple views on access.
+"""
+
+import itertools
+from array import array
+from collections.abc import MutableSequence
+
+FLAG = "flag"
+OBJECT = "object"
+
+# stamps are unique across all tables, so that a table replaced by another one never reuses a stamp
+_stamps = itertools.count(1)
+
+
+class RecordTable(MutableSequence):
+    """
+    A list of records of a single namedtuple type, stored as one column per field.
+
+    Each field is stored according to its kind:
+
+        - ``"flag"``
+            A bool, stored as one bit of a shared bit field.
+        - ``"object"``
+            Any value, stored as is in a list, e.g. the (interned) labels.
+        - any other string
+            A hashable value, e.g. a node name or a style, stored as an integer id in an array.
+            The fields with the same kind share their ids, so a node name is only stored once
+            whether it appears as the source or the target of a connection.
+
+    Indexing and iterating return records of ``record_type``, which are read-only views of the table:
+    to change a record, assign a new one, e.g. ``table[i] = table[i]._replace(label="x")``.
+
+    The table supports the operations of a list of records: indexing, slicing, ``append``, ``insert``, ``del``,
+    ``sort``, ``copy``, ``+`` and ``==``. It differs from a list in a few ways: the flag fields are stored as
+    bools, so a record read back has ``True`` or ``False`` for them, concatenating a table with ``+`` returns
+    a plain list of records, and the repr only shows the type and number of records.
+
+    Every row also carries a stamp, which is unique and changes whenever the row is written.
+    The renderer uses the stamps to tell which rows changed since the previous render.
+    The ``version`` of the table is incremented by every change to its rows, including insertions and deletions,
+    so that the owner of the table can tell when an index built from it is out of date.
+
+    Parameters
+    ----------
+    record_type : namedtuple type
+        The type of the records
+    kinds : dict
+        The kind of every field of ``record_type``
+    records : iterable, optional
+        The initial records
+    """
+
+    def __init__(self, record_type, kinds, records=()):
+        self.record_type = record_type
+        self._kinds = [kinds[field] for field in record_type._fields]
+
+        flags = [field for field, kind in zip(record_type._fields, self._kinds) if kind == FLAG]
+        if len(flags) > 8:
+            raise ValueError("A record can have at most 8 flags.")
+        self._bits = {field: 1 << i for i, field in enumerate(flags)}
+        self._flags = array("B")
+
+        # per kind of id: the list of values, and the map from value to id
+        values = {}
+        ids = {}
+        # how each field is stored: (FLAG, bit), (OBJECT, column) or (kind, column of ids, values, ids)
+        self._layout = {}
+        for field, kind in zip(record_type._fields, self._kinds):
+            if kind == FLAG:
+                self._layout[field] = (FLAG, self._bits[field])
+            elif kind == OBJECT:
+                self._layout[field] = (OBJECT, [])
+            else:
+                self._layout[field] = (kind, array("I"), values.setdefault(kind, []), ids.setdefault(kind, {}))
+        self._plan = [self._layout[field] for field in record_type._fields]
+        self._stored_columns = [layout[1] for layout in self._plan if layout[0] != FLAG]
+
+        self.stamps = array("Q")
+        self.version = 0
+
+        self.extend(records)
+
+    def __len__(self):
+        return len(self.stamps)
+
+    def _encode(self, record):
+        """Return the id or object stored for each field of ``record``, and the bit field of its flags."""
+        if not isinstance(record, tuple) or len(record) != len(self._plan):
+            raise TypeError("Expected a {} record, got {!r}".format(self.record_type.__name__, record))
+
+        cells = []
+        flags = 0
+        for layout, value in zip(self._plan, record):
+            kind = layout[0]
+            if kind == FLAG:
+                if value:
+                    flags |= layout[1]
+            elif kind == OBJECT:
+                cells.append(value)
+            else:
+                ids = layout[3]
+                i_value = ids.get(value)
+                if i_value is None:
+                    i_value = ids[value] = len(ids)
+                    layout[2].append(value)
+                cells.append(i_value)
+        return cells, flags
+
+    def _decode(self, i):
+        flags = self._flags[i]
+        values = []
+        for layout in self._plan:
+            kind = layout[0]
+            if kind == FLAG:
+                values.append(bool(flags & layout[1]))
+            elif kind == OBJECT:
+                values.append(layout[1][i])
+            else:
+                values.append(layout[2][layout[1][i]])
+        return self.record_type._make(values)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._decode(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("RecordTable index out of range")
+        return self._decode(i)
+
+    def __iter__(self):
+        return map(self.record_type._make, zip(*[self.column(field) for field in self.record_type._fields]))
+
+    def __setitem__(self, i, record):
+        if isinstance(i, slice):
+            self._set_slice(i, list(record))
+            return
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("RecordTable assignment index out of range")
+        cells, flags = self._encode(record)
+        for column, cell in zip(self._stored_columns, cells):
+            column[i] = cell
+        self._flags[i] = flags
+        self.stamps[i] = next(_stamps)
+        self.version += 1
+
+    def _set_slice(self, i, records):
+        start, stop, step = i.indices(len(self))
+        if step == 1:
+            # the slice is replaced by the records, which may change the length of the table
+            del self[start : max(start, stop)]
+            for offset, record in enumerate(records):
+                self.insert(start + offset, record)
+            return
+        positions = range(start, stop, step)
+        if len(positions) != len(records):
+            raise ValueError(
+                "attempt to assign sequence of size {} to extended slice of size {}".format(
+                    len(records), len(positions)
+                )
+            )
+        for j, record in zip(positions, records):
+            self[j] = record
+
+    def __delitem__(self, i):
+        columns = self._stored_columns + [self._flags, self.stamps]
+        if isinstance(i, slice):
+            for column in columns:
+                del column[i]
+            self.version += 1
+            return
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("RecordTable deletion index out of range")
+        for column in columns:
+            del column[i]
+        self.version += 1
+
+    def insert(self, i, record):
+        cells, flags = self._encode(record)
+        for column, cell in zip(self._stored_columns, cells):
+            column.insert(i, cell)
+        self._flags.insert(i, flags)
+        self.stamps.insert(i, next(_stamps))
+        self.version += 1
+
+    def append(self, record):
+        cells, flags = self._encode(record)
+        for column, cell in zip(self._stored_columns, cells):
+            column.append(cell)
+        self._flags.append(flags)
+        self.stamps.append(next(_stamps))
+        self.version += 1
+
+    def extend_columns(self, **columns):
+        """
+        Append many records at once, given column by column.
+
+        This is faster than appending the records one by one, since each column is encoded in a single pass.
+
+        Parameters
+        ----------
+        **columns
+            One sequence of values per field of ``record_type``, all with the same length
+        """
+        fields = self.record_type._fields
+        if set(columns) != set(fields):
+            raise TypeError("Expected one column per field: {}".format(", ".join(fields)))
+        columns = {field: list(values) for field, values in columns.items()}
+        n_new = len(columns[fields[0]])
+        if any(len(values) != n_new for values in columns.values()):
+            raise ValueError("All the columns must have the same length")
+
+        flags = [0] * n_new
+        for field in fields:
+            layout = self._layout[field]
+            values = columns[field]
+            if layout[0] == FLAG:
+                bit = layout[1]
+                flags = [f | bit if value else f for f, value in zip(flags, values)]
+            elif layout[0] == OBJECT:
+                layout[1].extend(values)
+            else:
+                kind_values, ids = layout[2], layout[3]
+                for value in dict.fromkeys(values):
+                    if value in ids:
+                        continue
+                    ids[value] = len(ids)
+                    kind_values.append(value)
+                layout[1].extend(map(ids.__getitem__, values))
+
+        self._flags.extend(flags)
+        self.stamps.extend(next(_stamps) for _ in range(n_new))
+        self.version += 1
+
+    def column(self, field):
+        """
+        Return the values of one field for all rows, without creating the records.
+
+        Parameters
+        ----------
+        field : str
+            The name of the field
+
+        Returns
+        -------
+        iterable
+            The values of the field, in the order of the rows
+        """
+        layout = self._layout[field]
+        if layout[0] == FLAG:
+            bit = layout[1]
+            return [bool(flags & bit) for flags in self._flags]
+        elif layout[0] == OBJECT:
+            return layout[1]
+        else:
+            return map(layout[2].__getitem__, layout[1])
+
+    def codes(self, field):
+        """
+        Return the integer ids stored for a field that is neither a flag nor an object, and the values they refer to.
+
+        Parameters
+        ----------
+        field : str
+            The name of the field
+
+        Returns
+        -------
+        array.array
+            The id of the value of every row
+        list
+            The values, indexed by id, shared by all the fields of the same kind
+        """
+        layout = self._layout[field]
+        if layout[0] in (FLAG, OBJECT):
+            raise ValueError("The {} field is not stored as ids".format(field))
+        return layout[1], layout[2]
+
+    def get(self, i, field):
+        """Return the value of ``field`` in row ``i``, without creating the record."""
+        layout = self._layout[field]
+        if layout[0] == FLAG:
+            return bool(self._flags[i] & layout[1])
+        elif layout[0] == OBJECT:
+            return layout[1][i]
+        else:
+            return layout[2][layout[1][i]]
+
+    def copy(self):
+        """Return a new table with the same records, like ``list.copy``."""
+        return RecordTable(self.record_type, dict(zip(self.record_type._fields, self._kinds)), self)
+
+    def sort(self, key=None, reverse=False):
+        """Sort the records in place, like ``list.sort``. Every row gets a new stamp."""
+        self[:] = sorted(self, key=key, reverse=reverse)
+
+    def __add__(self, other):
+        if isinstance(other, (RecordTable, list)):
+            return list(self) + list(other)
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, list):
+            return other + list(self)
+        return NotImplemented
+
+    def __eq__(self, other):
+        if isinstance(other, (RecordTable, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    # mutable, so unhashable like a list, which defining __eq__ implies but is made explicit here
+    __hash__ = None
+
+    def __repr__(self):
+        return "RecordTable({}, {} records)".format(self.record_type.__name__, len(self))
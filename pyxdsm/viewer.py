@@ -0,0 +1,202 @@
+"""
+Export XDSM diagrams to a single, self-contained HTML file to explore large diagrams in a browser.
+
+The diagram is embedded as compact JSON, and drawn on a canvas by the small script of ``viewer.html``.
+Only the rows and columns in view are drawn, so that diagrams with hundreds of thousands of connections
+stay responsive. The layout, shapes and labels are the ones of the SVG export, see :mod:`pyxdsm.svg`.
+
+The JSON holds flat arrays rather than one object per node, since it is parsed on every load:
+
+    - ``nodes``
+        Four integers per node: its row, its column, its shape and its flags, sorted by row, then column.
+    - ``shapes``
+        Four values per distinct node shape: the style, the label, and the width and height of the node.
+    - ``labels``
+        The distinct labels, as a list of lines, each a flat list of text segments and their positions,
+        see :data:`SCRIPT_CODES`.
+    - ``processes``
+        Per process chain, its arrow and faded flags, followed by the indices of its nodes.
+"""
+
+import json
+import os
+import re
+from html import escape
+
+from pyxdsm import svg
+
+# version of the embedded JSON
+DATA_VERSION = 1
+
+# the flags of a node
+FADED = 1
+STACK = 2
+# the node is linked to the system of its row, or of its column, by a data line
+H_EDGE = 4
+V_EDGE = 8
+H_EDGE_FADED = 16
+V_EDGE_FADED = 32
+
+# the position of a text segment
+SCRIPT_CODES = {"": 0, "sub": 1, "super": 2}
+
+_TEMPLATE_FIELDS_RE = re.compile(r"@(TITLE|DATA)@")
+
+
+def _label_key(label):
+    return tuple(label) if isinstance(label, list) else label
+
+
+def diagram_data(xdsm):
+    """
+    Return the layout of the diagram, as embedded in the HTML file.
+
+    Parameters
+    ----------
+    xdsm : XDSM
+        The diagram
+
+    Returns
+    -------
+    dict
+        The JSON-serializable layout of the diagram
+    """
+    xdsm._check_processes()
+    xdsm._check_system_names()
+    fading = xdsm._fading()
+    size, row_offset, col_offset = xdsm._grid_offsets()
+    index = xdsm._system_index
+
+    # the distinct shapes and labels, with their index
+    shapes = {}
+    labels = {}
+    # (style, label, width, height) of every shape
+    shape_sizes = []
+    col_widths = [0.0] * size
+    row_heights = [0.0] * size
+
+    def shape_id(record):
+        key = (record.style, _label_key(record.label), record.label_width)
+        i_shape = shapes.get(key)
+        if i_shape is None:
+            width, height, lines = svg.node_size(*key)
+            label = tuple(
+                tuple(item for text, position in segments for item in (text, SCRIPT_CODES[position]))
+                for segments in lines
+            )
+            i_label = labels.setdefault(label, len(labels))
+            i_shape = shapes[key] = len(shapes)
+            shape_sizes.append((record.style, i_label, width, height))
+        return i_shape
+
+    # (row, col, shape, flags, node name) of every node
+    nodes = []
+
+    def add_node(row, col, record, flags, name):
+        i_shape = shape_id(record)
+        _, _, width, height = shape_sizes[i_shape]
+        col_widths[col] = max(col_widths[col], width)
+        row_heights[row] = max(row_heights[row], height)
+        nodes.append((row, col, i_shape, flags, name))
+
+    def node_flags(record, faded):
+        return (FADED if faded else 0) | (STACK if record.stack else 0)
+
+    for i, (record, faded) in enumerate(zip(xdsm.systems, fading.systems.tolist())):
+        add_node(i + row_offset, i + col_offset, record, node_flags(record, faded), record.node_name)
+    columns = zip(xdsm.connections, fading.connections.tolist(), fading.h_edges.tolist(), fading.v_edges.tolist())
+    for record, faded, h_faded, v_faded in columns:
+        flags = node_flags(record, faded) | H_EDGE | V_EDGE
+        flags |= (H_EDGE_FADED if h_faded else 0) | (V_EDGE_FADED if v_faded else 0)
+        add_node(index[record.src] + row_offset, index[record.target] + col_offset, record, flags, None)
+    for outs, col, outs_faded in (
+        (xdsm.left_outs, 0, fading.left_outs),
+        (xdsm.right_outs, size - 1, fading.right_outs),
+    ):
+        for comp_name, out in outs.items():
+            faded = outs_faded[comp_name]
+            flags = node_flags(out, faded) | H_EDGE | (H_EDGE_FADED if faded else 0)
+            add_node(index[comp_name] + row_offset, col, out, flags, out.node_name)
+    for comp_name, inp in xdsm.ins.items():
+        faded = fading.inputs[comp_name]
+        flags = node_flags(inp, faded) | V_EDGE | (V_EDGE_FADED if faded else 0)
+        add_node(0, index[comp_name] + col_offset, inp, flags, inp.node_name)
+
+    # sorted by row then column, stable so that the last of several nodes in the same cell is on top
+    nodes.sort(key=lambda node: (node[0], node[1]))
+    node_index = {node[4]: i_node for i_node, node in enumerate(nodes) if node[4] is not None}
+
+    processes = []
+    for proc, faded in zip(xdsm.processes, fading.processes):
+        processes.append([int(proc.arrow), int(faded)] + [node_index[name] for name in proc.systems])
+
+    styles = sorted({style for style, _, _, _ in shape_sizes})
+    style_index = {style: i_style for i_style, style in enumerate(styles)}
+
+    return {
+        "version": DATA_VERSION,
+        "size": size,
+        "offsets": [row_offset, col_offset],
+        "cols": [round(width, 1) for width in col_widths],
+        "rows": [round(height, 1) for height in row_heights],
+        "systems": list(xdsm.systems.column("node_name")),
+        "styles": [_style_data(style) for style in styles],
+        "labels": list(labels),
+        "shapes": [
+            item
+            for style, i_label, width, height in shape_sizes
+            for item in (style_index[style], i_label, round(width, 1), round(height, 1))
+        ],
+        "nodes": [item for node in nodes for item in node[:4]],
+        "processes": processes,
+        "metrics": {
+            "font": round(svg.FONT_SIZE, 2),
+            "line": round(svg.LINE_HEIGHT, 2),
+            "script": svg.SCRIPT_SIZE,
+            "shift": [0.0, round(svg.SCRIPT_SHIFT["sub"], 2), round(svg.SCRIPT_SHIFT["super"], 2)],
+            "rowSep": round(svg.ROW_SEP, 2),
+            "colSep": round(svg.COL_SEP, 2),
+            "margin": round(svg.MARGIN, 2),
+            "slant": round(svg.TRAPEZIUM_SLANT, 4),
+            "chamfer": round(svg.CHAMFER, 2),
+            "stack": round(svg.STACK_SHIFT, 2),
+            "lineWidth": round(svg.LINE_WIDTH, 2),
+            "dataLine": [svg.DATA_LINE[0], svg.FADED_DATA_LINE[0], round(svg.DATA_LINE[1], 2)],
+            "processLine": [svg.PROCESS_LINE[0], svg.FADED_PROCESS_LINE[0], round(svg.PROCESS_LINE[1], 2)],
+            "fadedStroke": svg.FADED_STROKE,
+            "fadedText": svg.FADED_TEXT_OPACITY,
+        },
+    }
+
+
+def _style_data(style_name):
+    """Return the shape, fill color and fill opacity of a node style."""
+    style = svg.STYLES.get(style_name, svg.DEFAULT_STYLE)
+    return [style.shape, style.fill, style.fill_opacity]
+
+
+def _template():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "viewer.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def to_html(xdsm, title="XDSM"):
+    """
+    Render an XDSM diagram to a self-contained HTML page, which works offline.
+
+    Parameters
+    ----------
+    xdsm : XDSM
+        The diagram
+    title : str
+        The title of the page
+
+    Returns
+    -------
+    str
+        The HTML document
+    """
+    # "</" would end the script element that holds the data
+    data = json.dumps(diagram_data(xdsm), separators=(",", ":")).replace("</", "<\\/")
+    fields = {"TITLE": escape(title), "DATA": data}
+    return _TEMPLATE_FIELDS_RE.sub(lambda match: fields[match.group(1)], _template())
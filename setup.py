@@ -25,7 +25,7 @@ setup(
     packages=[
         "pyxdsm",
     ],
-    package_data={"pyxdsm": ["*.tex"]},
+    package_data={"pyxdsm": ["*.tex", "*.html"]},
     install_requires=["numpy>=1.21"],
     python_requires=">=3",
     classifiers=[
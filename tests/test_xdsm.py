@@ -1,9 +1,40 @@
 import unittest
+import asyncio
+import gzip
+import io
+import json
 import os
+import re
+import sys
 import shutil
 import tempfile
+import tracemalloc
 import subprocess
-from pyxdsm.XDSM import XDSM, OPT, FUNC, SOLVER, LEFT, RIGHT
+import xml.etree.ElementTree as ET
+from unittest import mock
+import numpy as np
+from pyxdsm.XDSM import (
+    XDSM,
+    OPT,
+    FUNC,
+    SOLVER,
+    LEFT,
+    RIGHT,
+    Edge,
+    System,
+    Connection,
+    _format_node,
+    _cached_label,
+    label_cache_info,
+    STYLE_FILES,
+    JSON_VERSION,
+)
+from pyxdsm.matrix_eqn import MatrixEquation, TotalJacobian
+import pyxdsm
+from pyxdsm import latex, svg, viewer
+from pyxdsm.latex import BoxCache, BuildCache, CompileResult, run_async
+from pyxdsm.table import RecordTable
+from pyxdsm import build_many, DiagramCollection
 from numpy.distutils.exec_command import find_executable
 
 basedir = os.path.dirname(os.path.abspath(__file__))
@@ -16,6 +47,18 @@ def filter_lines(lns):
     return [ln.strip() for ln in lns if ln.strip() and not ln.strip().startswith("%")]
 
 
+_compile_tex = latex.compile_tex
+
+
+def compile_checking_includes(file_name, outdir=".", **kwargs):
+    """Compile like latex.compile_tex, after checking that the PDFs included by the document can be found."""
+    with open(os.path.join(outdir, file_name + ".tex")) as f:
+        # TeX looks for the included files from the working directory
+        for pdf_path in re.findall(r"\\includegraphics\[page=\d+\]\{(.*?)\}", f.read()):
+            assert os.path.isfile(pdf_path), pdf_path
+    return _compile_tex(file_name, outdir=outdir, **kwargs)
+
+
 class TestXDSM(unittest.TestCase):
     def setUp(self):
         self.tempdir = tempfile.mkdtemp(prefix="testdir-")
@@ -64,6 +107,82 @@ class TestXDSM(unittest.TestCase):
         else:
             self.fail("Expected ValueError")
 
+    def test_duplicate_system(self):
+        x = XDSM()
+        x.add_system("D1", FUNC, "D_1")
+
+        with self.assertRaises(ValueError) as cm:
+            x.add_system("D1", FUNC, "D_2")
+        self.assertEqual(str(cm.exception), 'A system named "D1" already exists.')
+        self.assertEqual(len(x.systems), 1)
+
+    def test_auto_fade_uses_system_index(self):
+        x = XDSM(auto_fade={"inputs": "connected", "outputs": "connected", "connections": "incoming"})
+        x.add_system("D1", FUNC, "D_1")
+        x.add_system("D2", FUNC, "D_2", faded=True)
+
+        x.add_input("D1", "x_1")
+        x.add_input("D2", "x_2")
+        x.add_output("D2", "y_2^*")
+        x.connect("D1", "D2", "y_1")
+        x.connect("D2", "D1", "y_2")
+
+        fading = x._fading()
+        self.assertEqual(fading.inputs, {"D1": False, "D2": True})
+        self.assertEqual(fading.left_outs, {"D2": True})
+        self.assertEqual(fading.connections.tolist(), [True, False])
+        # the records keep the fading that was given
+        self.assertFalse(x.ins["D2"].faded)
+        self.assertFalse(x.connections[0].faded)
+
+    def test_auto_fade_at_render(self):
+        x = XDSM(auto_fade={"inputs": "connected", "connections": "connected", "processes": "connected"})
+        # the connection and the input are added before the systems they fade with
+        x.connect("A", "B", "x")
+        x.add_input("A", "p")
+        x.add_system("A", FUNC, "A", faded=True)
+        x.add_system("B", FUNC, "B", faded=True)
+        x.add_process(["A", "B"])
+
+        fading = x._fading()
+        self.assertEqual(fading.connections.tolist(), [True])
+        self.assertEqual(fading.h_edges.tolist(), [True])
+        self.assertEqual(fading.inputs, {"A": True})
+        self.assertEqual(fading.processes, [True])
+        self.assertIn(r"\node [DataInter,faded] (A-B)", x.to_tikz())
+
+        # unfading a system updates the elements around it
+        x.update_system("B", faded=False)
+        fading = x._fading()
+        self.assertEqual(fading.connections.tolist(), [False])
+        self.assertEqual(fading.h_edges.tolist(), [True])
+        self.assertEqual(fading.v_edges.tolist(), [False])
+        tikz = x.to_tikz()
+        self.assertIn(r"\node [DataInter] (A-B)", tikz)
+        self.assertIn("(A-B) edge [DataLine] (B)", tikz)
+        x.invalidate()
+        self.assertEqual(tikz, x.to_tikz())
+
+    def test_node_grid(self):
+        x = XDSM()
+        x.add_system("D1", FUNC, "D_1")
+        x.add_system("D2", FUNC, "D_2")
+        x.connect("D2", "D1", "y_2")
+        x.add_input("D2", "x_2")
+        x.add_output("D1", "y_1^*", side=RIGHT)
+
+        rows = list(x._iter_node_grid())
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0], "%Row 0\n&\n\\node [DataIO] (output_D2) {$x_2$};&\n&\n" + r"\\" + "\n")
+        self.assertEqual(
+            rows[1],
+            "%Row 1\n\\node [Function] (D1) {$D_1$};&\n&\n&\n\\node [DataIO] (right_output_D1) {$y_1^*$};"
+            + r"\\"
+            + "\n",
+        )
+        self.assertEqual(rows[3], "%Row 3\n&\n&\n&\n" + r"\\" + "\n")
+        self.assertEqual(x._build_node_grid(), "".join(rows))
+
     def test_options(self):
         filename = "xdsm_test_options"
         spec_dir = filename + "_specs"
@@ -304,6 +423,1041 @@ class TestXDSM(unittest.TestCase):
         # To be sure, check the length, otherwise a missing last line could get unnoticed because of using zip
         self.assertEqual(len(new_lines), len(sample_lines))
 
+    def test_write_tikz_stream(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("D1", FUNC, "D_1")
+        x.connect("opt", "D1", "x")
+        x.connect("D1", "opt", "f")
+        x.add_process(["opt", "D1", "opt"])
+        x.write("stream", build=False)
+
+        with open("stream.tikz") as f:
+            tikz = f.read()
+
+        buf = io.StringIO()
+        x.write_tikz(buf)
+        self.assertEqual(buf.getvalue(), tikz)
+
+        with gzip.open("stream.tikz.gz", "wt") as f:
+            x.write_tikz(f)
+        with gzip.open("stream.tikz.gz", "rt") as f:
+            self.assertEqual(f.read(), tikz)
+
+    def test_process_unknown_names(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("D1", FUNC, "D_1")
+        x.add_input("D1", "x_1")
+        x.add_process(["output_D1", "D1", "D2", "opt"])
+        x.add_process(["opt", "D3", "D2", "opt"])
+
+        with self.assertRaises(ValueError) as cm:
+            x.to_tikz()
+        self.assertEqual(
+            str(cm.exception), 'processes include systems named "D2", "D3" but no systems with these names exist.'
+        )
+
+    def test_process_chain(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("D1", FUNC, "D_1")
+        x.add_output("opt", "x^*")
+        x.add_process(["opt", "D1", "left_output_opt"], arrow=False, faded=True)
+
+        self.assertEqual(
+            x._build_process_chain(),
+            "{ [start chain=process]\n \\begin{pgfonlayer}{process} \n"
+            "\\chainin (opt);\n"
+            "\\chainin (D1) [join=by FadedProcessHV];\n"
+            "\\chainin (left_output_opt) [join=by FadedProcessTip];\n"
+            "\\end{pgfonlayer}\n}",
+        )
+
+    def test_edges_faded_partition(self):
+        x = XDSM()
+        x.add_system("faded_sys", FUNC, "A")
+        x.add_system("B", FUNC, "B", faded=True)
+        x.add_system("C", FUNC, "C")
+        x.connect("faded_sys", "B", "x", faded=True)
+        x.connect("faded_sys", "C", "y")
+        x.connect("C", "faded_sys", "z")
+
+        h_edges, v_edges = x._edges()
+        # a node name containing "faded" does not make the edge faded
+        self.assertEqual(
+            h_edges,
+            [
+                Edge("faded_sys", "faded_sys-C", False),
+                Edge("C", "C-faded_sys", False),
+                Edge("faded_sys", "faded_sys-B", True),
+            ],
+        )
+        self.assertEqual([e.faded for e in v_edges], [False, False, True])
+        self.assertIn("(faded_sys) edge [DataLine] (faded_sys-C)", x._build_edges())
+
+    def test_update_rerender(self):
+        x = XDSM()
+        x.add_system("opt", OPT, "Optimizer")
+        x.add_system("A", FUNC, "A")
+        x.add_system("B", FUNC, "B")
+        x.connect("opt", "A", "x")
+        x.connect("A", "B", "y")
+        x.add_input("A", "p")
+        x.add_output("B", "f", side="right")
+        x.add_process(["opt", "A", "B", "opt"])
+        x.to_tikz()
+
+        with mock.patch("pyxdsm.XDSM._format_node", wraps=_format_node) as format_node:
+            x.update_system("A", label=r"\text{Edited}", faded=True)
+            x.update_connection("A", "B", label=("y_1", "y_2"))
+            tikz = x.to_tikz()
+        # only the two updated nodes are rendered again
+        self.assertEqual(format_node.call_count, 2)
+        self.assertIn(r"\node [Function,faded] (A) {$\text{Edited}$};", tikz)
+        self.assertIn(r"(A-B) {$\begin{array}{c}y_1 \\ y_2\end{array}$}", tikz)
+
+        # same as rendering from scratch
+        x.invalidate()
+        self.assertEqual(tikz, x.to_tikz())
+
+        with self.assertRaises(ValueError):
+            x.update_system("C", label="C")
+        with self.assertRaises(ValueError):
+            x.update_connection("B", "A", label="z")
+        # the connections, inputs, outputs and processes refer to the system by name
+        with self.assertRaises(ValueError):
+            x.update_system("A", node_name="Z")
+
+    def test_invalidate(self):
+        x = XDSM()
+        x.add_system("A", FUNC, ["a", "b"])
+        self.assertIn(r"a \\ b", x.to_tikz())
+
+        # changes made in place are only seen after invalidating the previous render
+        x.systems[0].label.append("c")
+        self.assertNotIn(r"b \\ c", x.to_tikz())
+        x.invalidate()
+        self.assertIn(r"a \\ b \\ c", x.to_tikz())
+
+    def test_label_cache(self):
+        x = XDSM()
+        x.add_system("A", FUNC, "".join(["A", "_1"]))
+        x.add_system("B", FUNC, "A_1")
+        for target in ("A", "B"):
+            x.add_input(target, ("u", "v", "w"), label_width=2)
+        x.connect("A", "B", ["x", "y"])
+        x.connect("B", "A", ("x", "y"))
+        # equal labels share a single string
+        self.assertIs(x.systems[0].label, x.systems[1].label)
+
+        _cached_label.cache_clear()
+        tikz = x.to_tikz()
+        # each label is formatted once, list and tuple labels are the same key
+        self.assertEqual(label_cache_info()[:2], (3, 3))
+        self.assertIn(r"\node [DataIO] (output_B) {$\begin{array}{c}u, v \\ w\end{array}$};", tikz)
+        self.assertIn(r"(B-A) {$\begin{array}{c}x \\ y\end{array}$}", tikz)
+
+    def test_record_table(self):
+        x = XDSM()
+        x.add_system("A", FUNC, "A", faded=True)
+        x.add_system("B", FUNC, ("B_1", "B_2"), stack=True)
+        x.connect("A", "B", "x", label_width=2)
+        x.connect("B", "A", ["y"], faded=True)
+
+        self.assertIsInstance(x.connections, RecordTable)
+        self.assertEqual(x.systems[0], System("A", FUNC, "A", False, True, None, "A"))
+        self.assertEqual(x.systems[-1].label, ("B_1", "B_2"))
+        self.assertEqual(list(x.connections), [x.connections[0], x.connections[1]])
+        self.assertEqual(x.connections[1], Connection("B", "A", ["y"], None, "DataInter", False, True, False, False))
+        self.assertEqual(list(x.connections.column("faded")), [False, True])
+        self.assertEqual(list(x.connections.column("src")), ["A", "B"])
+        with self.assertRaises(IndexError):
+            x.connections[2]
+
+        # the records can still be replaced, inserted and deleted like in a list
+        x.connections[0] = x.connections[0]._replace(style="DataIO")
+        self.assertIn(r"\node [DataIO] (A-B)", x.to_tikz())
+        x.connections.insert(0, x.connections.pop())
+        self.assertEqual([c.src for c in x.connections], ["B", "A"])
+        del x.connections[0]
+        self.assertEqual(len(x.connections), 1)
+        with self.assertRaises(TypeError):
+            x.connections.append(("A", "B"))
+
+        # and the other list operations are available
+        x.connect("B", "A", "y")
+        conns = x.connections.copy()
+        self.assertIsInstance(conns, RecordTable)
+        self.assertEqual(conns, x.connections)
+        conns.sort(key=lambda conn: conn.src, reverse=True)
+        self.assertEqual([c.src for c in conns], ["B", "A"])
+        self.assertEqual([c.src for c in x.connections], ["A", "B"])
+        self.assertEqual(x.connections + [conns[0]], list(x.connections) + [conns[0]])
+        self.assertEqual([conns[0]] + x.connections, [conns[0]] + list(x.connections))
+        self.assertEqual(x.connections + conns, list(x.connections) + list(conns))
+        with self.assertRaises(TypeError):
+            hash(x.connections)
+        # the flags are stored as bools
+        x.connections.append(Connection("A", "B", "z", None, "DataInter", 0, 1, 0, 0))
+        self.assertIs(x.connections[-1].faded, True)
+
+        # assigning a list converts it
+        x.connections = [Connection("A", "B", "x", 2, "DataInter", False, False, True, False)]
+        self.assertIsInstance(x.connections, RecordTable)
+        tikz = x.to_tikz()
+        self.assertIn(r"\node [DataInter] (A-B) {$x$};", tikz)
+        self.assertNotIn("B-A", tikz)
+
+    def test_systems_table_changes(self):
+        def diagram(names):
+            x = XDSM()
+            for name in names:
+                x.add_system(name, FUNC, name)
+            x.connect("A", "C", "x")
+            x.add_input("C", "p")
+            x.add_output("A", "f", side=RIGHT)
+            x.add_process(["A", "C"])
+            return x
+
+        def system(name):
+            return System(name, FUNC, name, False, False, None, name)
+
+        x = diagram(["A", "B", "C"])
+        x.to_tikz()
+        del x.systems[1]
+        self.assertEqual(x.to_tikz(), diagram(["A", "C"]).to_tikz())
+        x.systems.insert(1, system("B"))
+        self.assertEqual(x.to_tikz(), diagram(["A", "B", "C"]).to_tikz())
+        x.systems[1:2] = [system("D"), system("E")]
+        self.assertEqual(x.to_tikz(), diagram(["A", "D", "E", "C"]).to_tikz())
+        x.systems[::3] = [system("A"), system("C")]
+        x.update_system("E", faded=True)
+        self.assertIn(r"\node [Function,faded] (E) {$E$};", x.to_tikz())
+
+        x = diagram(["A", "C"])
+        x.to_tikz()
+        x.systems.append(system("B"))
+        x.connect("A", "B", "y")
+        expected = diagram(["A", "C", "B"])
+        expected.connect("A", "B", "y")
+        self.assertEqual(x.to_tikz(), expected.to_tikz())
+
+        # a system that is still referred to by a connection
+        del x.systems[1]
+        with self.assertRaises(ValueError):
+            x.to_tikz()
+
+        # the names must stay unique
+        x = diagram(["A", "C"])
+        with self.assertRaises(ValueError):
+            x.systems = [x.systems[0], x.systems[0]]
+        self.assertEqual(len(x.systems), 2)
+        x.systems.append(x.systems[0])
+        with self.assertRaises(ValueError):
+            x.to_tikz()
+
+    def test_add_systems(self):
+        x = XDSM()
+        x.add_system("opt", OPT, "Optimizer")
+        x.add_systems(["A", "B", "C"], FUNC, ["A", ("B_1", "B_2"), "C"], faded=[False, True, False])
+        y = XDSM()
+        y.add_system("opt", OPT, "Optimizer")
+        y.add_system("A", FUNC, "A")
+        y.add_system("B", FUNC, ("B_1", "B_2"), faded=True)
+        y.add_system("C", FUNC, "C")
+        self.assertEqual(x.systems, y.systems)
+        self.assertEqual(x._system_index, y._system_index)
+
+        with self.assertRaisesRegex(ValueError, 'Systems named "A", "D" already exist.'):
+            x.add_systems(["A", "D", "D"], FUNC, ["A", "D", "D"])
+        with self.assertRaises(ValueError):
+            x.add_systems(["D", "E"], FUNC, ["D"])
+        self.assertEqual(len(x.systems), 4)
+
+    def test_connect_many(self):
+        def model(fade):
+            x = XDSM(auto_fade={"connections": fade})
+            x.add_systems(["opt", "A", "B"], [OPT, FUNC, FUNC], ["O", "A", "B"], faded=[False, True, True])
+            return x
+
+        for fade in ("none", "all", "connected", "incoming", "outgoing"):
+            expected = model(fade)
+            expected.connect("opt", "A", "x")
+            expected.connect("A", "B", "y", faded=True)
+            expected.connect("B", "opt", "z")
+
+            x = model(fade)
+            x.connect_many(["opt", "A", "B"], ["A", "B", "opt"], ["x", "y", "z"], faded=[False, True, False])
+            self.assertEqual(x.connections, expected.connections)
+
+            x = model(fade)
+            x.connect_many(([0, 1, 2], [1, 2, 0], ["x", "y", "z"]), faded=[False, True, False])
+            self.assertEqual(x.connections, expected.connections)
+
+            x = model(fade)
+            matrix = np.zeros((3, 3), dtype=bool)
+            matrix[0, 1] = matrix[1, 2] = matrix[2, 0] = True
+            labels = [[None, "x", None], [None, None, "y"], ["z", None, None]]
+            x.connect_many(matrix, labels=labels, faded=[False, True, False])
+            self.assertEqual(x.connections, expected.connections)
+            self.assertEqual(x.to_tikz(), expected.to_tikz())
+
+        x = model("none")
+        with self.assertRaisesRegex(ValueError, 'components named "C", "D"'):
+            x.connect_many(["A", "C", "D"], ["B", "A", "A"], ["x", "y", "z"])
+        with self.assertRaisesRegex(ValueError, "itself"):
+            x.connect_many([0, 1], [1, 1], ["x", "y"])
+        with self.assertRaises(ValueError):
+            x.connect_many([0, 1], [1, 2], ["x"])
+        with self.assertRaises(ValueError):
+            x.connect_many(np.ones((2, 2), dtype=bool), labels=[["x"] * 2] * 2)
+        self.assertEqual(len(x.connections), 0)
+
+    def test_to_tikz_to_tex(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("D1", FUNC, "D_1")
+        x.connect("opt", "D1", "x")
+        x.write("in_memory", build=False)
+
+        with open("in_memory.tikz") as f:
+            self.assertEqual(x.to_tikz(), f.read())
+        with open("in_memory.tex") as f:
+            self.assertEqual(x.to_tex("in_memory.tikz"), f.read())
+
+        # without a path, the picture is embedded in the document
+        tex = x.to_tex()
+        self.assertNotIn(r"\input{\"in_memory.tikz\"}", tex)
+        self.assertIn(x.to_tikz(), tex)
+        # the optional packages are not accumulated over calls
+        self.assertNotIn("sfmath,sfmath", x.to_tex())
+
+    def test_matrix_eqn_to_tex(self):
+        J = TotalJacobian()
+        J.add_input("a", text=r"$a$")
+        J.add_output("f", text=r"$f$")
+        J.connect("a", "f")
+        self.assertIn(r"\blockmat", J.to_tikz())
+        self.assertTrue(J.to_tex().endswith(r"\end{document}"))
+
+        eqn = MatrixEquation()
+        eqn.add_variable("x", text=r"$x$")
+        eqn.jacobian()
+        eqn.write("eqn", build=False)
+        with open("eqn.tex") as f:
+            self.assertEqual(eqn.to_tex(), f.read())
+
+    def test_write_tikz_memory(self):
+        class CountingSink:
+            size = 0
+
+            def write(self, fragment):
+                self.size += len(fragment)
+
+        x = XDSM()
+        names = ["D{}".format(i) for i in range(2000)]
+        x.add_systems(names, [FUNC] * len(names), names)
+        for i, name in enumerate(names):
+            for k in range(1, 6):
+                x.connect(name, names[(i + k) % len(names)], "y_{{{}}}".format(i))
+        # the nodes are kept between renders, only what the render itself allocates is measured
+        x.to_tikz()
+
+        sink = CountingSink()
+        tracemalloc.start()
+        try:
+            x.write_tikz(sink)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # the rows and data lines are written as they are formatted
+        self.assertLess(peak, sink.size / 10)
+
+    def test_write_tikz_invalid_process(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_process(["opt", "D1"])
+
+        buf = io.StringIO()
+        with self.assertRaises(ValueError):
+            x.write_tikz(buf)
+        # nothing is written for an invalid diagram
+        self.assertEqual(buf.getvalue(), "")
+
+    def test_build_cache(self):
+        def fake_compile(file_name, outdir=".", **kwargs):
+            with open(os.path.join(outdir, file_name + ".pdf"), "w") as f:
+                f.write("pdf")
+
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("D1", FUNC, "D_1")
+        x.connect("opt", "D1", "x")
+
+        shared = BuildCache(os.path.join(self.tempdir, "cache"))
+        with mock.patch("pyxdsm.latex.compile_tex", side_effect=fake_compile) as compile_tex:
+            x.write("cached", cache=shared)
+            self.assertEqual(compile_tex.call_count, 1)
+
+            # unchanged diagram: the existing pdf is reused
+            x.write("cached", cache=True)
+            self.assertEqual(compile_tex.call_count, 1)
+
+            # a different output directory gets the pdf from the shared cache
+            os.mkdir("other")
+            x.write("cached", outdir="other", cache=shared)
+            self.assertEqual(compile_tex.call_count, 1)
+            self.assertTrue(os.path.isfile(os.path.join("other", "cached.pdf")))
+
+            # any change to the diagram triggers a new build
+            x.connect("D1", "opt", "f")
+            x.write("cached", cache=True)
+            self.assertEqual(compile_tex.call_count, 2)
+
+            # no cache: always build
+            x.write("cached")
+            self.assertEqual(compile_tex.call_count, 3)
+
+    def test_build_cache_eviction(self):
+        cache = BuildCache(os.path.join(self.tempdir, "cache"), max_size=10)
+        for i, key in enumerate(["a", "b", "c"]):
+            with open("in.pdf", "w") as f:
+                f.write("1234")
+            cache.put(key, "in.pdf")
+            os.utime(os.path.join(cache.cache_dir, key + ".pdf"), (i, i))
+
+        # "a" is the least recently used entry
+        cache.put("d", "in.pdf")
+        self.assertFalse(cache.get("a", "out.pdf"))
+        self.assertTrue(cache.get("d", "out.pdf"))
+
+    def test_build_many(self):
+        def fake_pdflatex(command, check=True, cwd=None):
+            build_dir = command[3].split("=", 1)[1]
+            base = os.path.join(build_dir, command[-1][: -len(".tex")])
+            for ext in ["aux", "log"]:
+                with open(base + "." + ext, "w") as f:
+                    f.write(ext)
+            if command[-1] == "bad.tex":
+                raise subprocess.CalledProcessError(1, command)
+            with open(base + ".pdf", "w") as f:
+                f.write("pdf")
+
+        diagrams = []
+        for name in ["a", "b", "bad"]:
+            x = XDSM()
+            x.add_system(name, FUNC, name)
+            diagrams.append((x, name))
+
+        os.mkdir("out")
+        with mock.patch("pyxdsm.latex.subprocess.run", side_effect=fake_pdflatex):
+            results = build_many(diagrams, jobs=2, outdir="out")
+
+        self.assertEqual([r.name for r in results], ["a", "b", "bad"])
+        self.assertEqual(results[0].pdf_path, os.path.join("out", "a.pdf"))
+        self.assertIsNone(results[0].error)
+        self.assertIsNone(results[2].pdf_path)
+        self.assertIsInstance(results[2].error, subprocess.CalledProcessError)
+        # only the outputs are left, plus the log of the failed build
+        self.assertEqual(
+            sorted(os.listdir("out")),
+            ["a.pdf", "a.tex", "a.tikz", "b.pdf", "b.tex", "b.tikz", "bad.log", "bad.tex", "bad.tikz"],
+        )
+
+    def test_write_async(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        asyncio.run(x.write_async("async_test", build=False))
+
+        with open("async_test.tikz") as f:
+            self.assertEqual(f.read(), x.to_tikz())
+        self.assertTrue(os.path.isfile("async_test.tex"))
+
+    def test_run_async_timeout_and_cancel(self):
+        sleep = [sys.executable, "-c", "import time; time.sleep(30)"]
+
+        with self.assertRaises(subprocess.TimeoutExpired):
+            asyncio.run(run_async(sleep, timeout=0.1))
+
+        async def cancel():
+            task = asyncio.ensure_future(run_async(sleep))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel())
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            asyncio.run(run_async([sys.executable, "-c", "raise SystemExit(3)"]))
+
+    def test_run_async_semaphore(self):
+        async def burst():
+            semaphore = asyncio.Semaphore(2)
+            command = [sys.executable, "-c", "pass"]
+            await asyncio.gather(*[run_async(command, semaphore=semaphore) for _ in range(6)])
+            # every run released the semaphore
+            self.assertFalse(semaphore.locked())
+
+        asyncio.run(burst())
+
+    def test_render_variants_outdir(self):
+        x = XDSM()
+        x.add_systems(["A", "B"], [FUNC, FUNC], ["A", "B"])
+        x.connect("A", "B", "y")
+        subdir = tempfile.mkdtemp(dir=self.tempdir)
+        outdir = os.path.basename(subdir)
+
+        # without pypdf, the pages are extracted from the document written to outdir
+        with mock.patch.dict(sys.modules, {"pypdf": None}):
+            with mock.patch("pyxdsm.latex.compile_tex", side_effect=compile_checking_includes) as compile_tex:
+                pdfs, _ = x.render_variants({"a": {"A"}, "b": {"B"}}, "variants", quiet=True, outdir=outdir)
+        self.assertEqual(compile_tex.call_count, 3)
+        self.assertEqual(pdfs, {name: os.path.join(outdir, "variants_{}.pdf".format(name)) for name in ("a", "b")})
+        for pdf_path in pdfs.values():
+            self.assertTrue(os.path.isfile(pdf_path))
+        self.assertEqual(os.listdir(self.tempdir), [outdir])
+
+    def test_render_variants(self):
+        x = XDSM(auto_fade={"connections": "connected"})
+        x.add_systems(["opt", "A", "B"], [OPT, FUNC, FUNC], ["O", "A", "B"])
+        x.connect("A", "B", "y")
+        x.add_process(["opt", "A", "B", "opt"])
+        variants = {"step1": {"B"}, "step2": {"A", "B"}}
+
+        with self.assertRaisesRegex(ValueError, '"C"'):
+            x.render_variants({"step1": {"B"}, "bad": {"C"}}, "variants")
+        self.assertEqual(os.listdir("."), [])
+
+        # without pypdf, the pages are extracted with pdflatex
+        with mock.patch.dict(sys.modules, {"pypdf": None}):
+            pdfs, result = x.render_variants(variants, "variants", quiet=True)
+        self.assertEqual(result.engine, "pdflatex")
+        self.assertEqual(
+            pdfs, {"step1": os.path.join(".", "variants_step1.pdf"), "step2": os.path.join(".", "variants_step2.pdf")}
+        )
+        for name in ("variants.pdf", "variants_step1.pdf", "variants_step2.pdf"):
+            self.assertTrue(os.path.isfile(name))
+        self.assertFalse(os.path.exists("variants_step1.tex"))
+
+        with open("variants.tex") as f:
+            tex = f.read()
+        self.assertLess(tex.index('\\input{"variants_step1.tikz"}'), tex.index('\\input{"variants_step2.tikz"}'))
+
+        # each variant only fades its own systems, and auto_fade applies to each of them
+        with open("variants_step1.tikz") as f:
+            step1 = f.read()
+        with open("variants_step2.tikz") as f:
+            step2 = f.read()
+        self.assertIn(r"\node [Function,faded] (B)", step1)
+        self.assertIn(r"\node [Function] (A)", step1)
+        self.assertIn(r"\node [DataInter] (A-B)", step1)
+        self.assertIn(r"\node [DataInter,faded] (A-B)", step2)
+
+    def test_diagram_collection(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        y = XDSM(use_sfmath=False)
+        y.add_system("solver", SOLVER, r"\text{Newton}")
+        J = TotalJacobian()
+        J.add_input("a", "a")
+        J.add_output("f", "f")
+        J.connect("a", "f", "df/da")
+
+        diagrams = DiagramCollection()
+        diagrams.add("x", x)
+        diagrams.add("jac", J)
+        diagrams.add("x2", x)
+        with self.assertRaises(ValueError):
+            diagrams.add("x", y)
+        with self.assertRaises(TypeError):
+            diagrams.add("y", "not a diagram")
+
+        # one document per preamble
+        paths = diagrams.write("all", build=False)
+        self.assertEqual(paths, {"x": "./all_0.tex", "jac": "./all_1.tex", "x2": "./all_0.tex"})
+        with open("all_0.tex") as f:
+            tex = f.read()
+        self.assertEqual(tex.count(r"\begin{tikzpicture}"), 2)
+        self.assertEqual(tex.count(r"\begin{document}"), 1)
+        self.assertTrue(tex.endswith("\\end{document}\n"))
+        with open("all_1.tex") as f:
+            self.assertIn("multi=varwidth", f.read())
+
+        single = DiagramCollection()
+        single.add("x", x)
+        with self.assertRaisesRegex(ValueError, "overwritten"):
+            single.write("x")
+
+        diagrams = DiagramCollection()
+        diagrams.add("x", x)
+        diagrams.add("y", y)
+        with mock.patch.dict(sys.modules, {"pypdf": None}):
+            paths = diagrams.write("all", quiet=True)
+        self.assertEqual(paths, {"x": "./x.pdf", "y": "./y.pdf"})
+        for name in ("all_0.pdf", "all_1.pdf", "x.pdf", "y.pdf"):
+            self.assertTrue(os.path.isfile(name))
+
+    def test_diagram_collection_outdir(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        y = XDSM()
+        y.add_system("A", FUNC, "A")
+        diagrams = DiagramCollection()
+        diagrams.add("x", x)
+        diagrams.add("y", y)
+
+        for abspath in [True, False]:
+            subdir = tempfile.mkdtemp(dir=self.tempdir)
+            outdir = subdir if abspath else os.path.basename(subdir)
+
+            # without pypdf, the pages are extracted from the document written to outdir
+            with mock.patch.dict(sys.modules, {"pypdf": None}):
+                with mock.patch("pyxdsm.latex.compile_tex", side_effect=compile_checking_includes) as compile_tex:
+                    paths = diagrams.write("all", quiet=True, outdir=outdir)
+            self.assertEqual(compile_tex.call_count, 3)
+            self.assertEqual(paths, {"x": os.path.join(outdir, "x.pdf"), "y": os.path.join(outdir, "y.pdf")})
+            for name in ("all.pdf", "x.pdf", "y.pdf"):
+                self.assertTrue(os.path.isfile(os.path.join(subdir, name)))
+
+        # no files outside the subdirs
+        self.assertFalse(any(os.path.isfile(fp) for fp in os.listdir(self.tempdir)))
+
+    def test_box_cache(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("A", FUNC, "A", stack=True)
+        x.add_system("B", FUNC, "A")
+        x.connect("opt", "A", "x")
+        x.add_input("A", "x_0")
+
+        cache = BoxCache("boxes")
+        with mock.patch("pyxdsm.latex.compile_tex", wraps=latex.compile_tex) as compile_tex:
+            x.write("boxes_test", quiet=True, box_cache=cache)
+            # one run for the boxes, one for the diagram
+            self.assertEqual(compile_tex.call_count, 2)
+            self.assertTrue(os.path.isfile("boxes_test.pdf"))
+
+            # the boxes of A and B are the same but for the stack
+            with open("boxes_test.tikz") as f:
+                tikz = f.read()
+            (pdf_name,) = [name for name in os.listdir(cache.cache_dir) if name.endswith(".pdf")]
+            pdf_path = os.path.join(cache.cache_dir, pdf_name).replace("\\", "/")
+            self.assertEqual(tikz.count(r"\node [CachedBox]"), 5)
+            self.assertIn(r"\node [CachedBox] (B) {\includegraphics[page=3]{", tikz)
+            self.assertNotIn(r"\text{Optimizer}", tikz)
+
+            # only the changed box is compiled again
+            x.update_system("B", label="B")
+            x.write("boxes_test", quiet=True, box_cache=cache)
+            self.assertEqual(compile_tex.call_count, 4)
+            self.assertEqual(len([name for name in os.listdir(cache.cache_dir) if name.endswith(".pdf")]), 2)
+            with open("boxes_test.tikz") as f:
+                tikz = f.read()
+            self.assertIn(r"\node [CachedBox] (opt) {\includegraphics[page=1]{" + pdf_path, tikz)
+            self.assertIn(r"\node [CachedBox] (B) {\includegraphics[page=1]{", tikz)
+
+            # unchanged diagrams don't compile any box
+            x.write("boxes_test", build=False, box_cache=cache)
+            self.assertEqual(compile_tex.call_count, 4)
+
+        cache.clear()
+        self.assertEqual(os.listdir(cache.cache_dir), [])
+        # without a box cache, the nodes are typeset as usual
+        x.write("boxes_test", build=False)
+        with open("boxes_test.tikz") as f:
+            self.assertIn(r"\node [Function] (B) {$B$};", f.read())
+
+    def test_box_cache_eviction(self):
+        preamble = "\\documentclass{article}\n\\begin{document}\n"
+        cache = BoxCache("boxes", max_size=0)
+        with mock.patch("pyxdsm.latex.compile_tex", wraps=latex.compile_tex) as compile_tex:
+            pdf_a, _ = cache.render({"a": "a\n\\newpage\n"}, preamble, quiet=True)["a"]
+            # the PDF of the pictures being rendered is kept, however small the cache
+            self.assertTrue(os.path.isfile(pdf_a))
+
+            pdf_b, _ = cache.render({"b": "b\n\\newpage\n"}, preamble, quiet=True)["b"]
+            self.assertFalse(os.path.exists(pdf_a))
+            self.assertTrue(os.path.isfile(pdf_b))
+            self.assertEqual(compile_tex.call_count, 2)
+
+            # the evicted picture is compiled again
+            cache.render({"a": "a\n\\newpage\n"}, preamble, quiet=True)
+            self.assertEqual(compile_tex.call_count, 3)
+
+        # the least recently used PDF is evicted first
+        pdf_c, _ = cache.render({"c": "c\n\\newpage\n"}, preamble, quiet=True)["c"]
+        cache.max_size = 2**20
+        pdf_a, _ = cache.render({"a": "a\n\\newpage\n"}, preamble, quiet=True)["a"]
+        os.utime(pdf_a, (1, 1))
+        os.utime(pdf_c, (2, 2))
+        cache.max_size = os.path.getsize(pdf_c)
+        cache.evict()
+        self.assertFalse(os.path.exists(pdf_a))
+        self.assertTrue(os.path.isfile(pdf_c))
+
+    def test_draft_quality(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("A", FUNC, "A", stack=True)
+        x.connect("opt", "A", "x")
+        x.add_process(["opt", "A", "opt"])
+
+        with self.assertRaisesRegex(ValueError, '"fast"'):
+            x.write("draft", quality="fast")
+        self.assertEqual(os.listdir("."), [])
+
+        x.write("draft", quality="draft", quiet=True)
+        self.assertTrue(os.path.isfile("draft.pdf"))
+        with open("draft.tikz") as f:
+            tikz = f.read()
+        self.assertIn('diagram_styles_draft"}', tikz)
+        # the same nodes, lines and processes as the full diagram
+        self.assertEqual(tikz.replace("diagram_styles_draft", "diagram_styles"), x.to_tikz())
+
+        x.write("draft", build=False, quality="draft", processes=False)
+        with open("draft.tikz") as f:
+            tikz = f.read()
+        self.assertNotIn("chainin", tikz)
+        self.assertIn(r"\node [Function,stack] (A)", tikz)
+
+        def style_file(quality):
+            with open(os.path.join(os.path.dirname(pyxdsm.__file__), STYLE_FILES[quality] + ".tex")) as f:
+                return f.read()
+
+        def style_fills(quality):
+            tex = style_file(quality)
+            # expand the one-line macros of the full styles, e.g. \fillOpacity
+            for name, value in re.findall(r"\\newcommand\{(\\\w+)\}\{(\w+)\}", tex):
+                tex = tex.replace(name, value)
+            return dict(re.findall(r"\\tikzstyle\{(\w+)\} = \[[^]]*fill=([\w!]+)", tex))
+
+        # the draft styles define all the styles of the full ones, with the same fills
+        def style_names(quality):
+            return set(re.findall(r"\\tikzstyle\{(\w+)\}", style_file(quality)))
+
+        self.assertLessEqual(style_names("full"), style_names("draft"))
+        full_fills = style_fills("full")
+        self.assertEqual(full_fills["Function"], "green!80")
+        for style, fill in full_fills.items():
+            self.assertEqual(style_fills("draft")[style], fill, style)
+
+        # the commands of the labels are defined once when both files are loaded
+        for quality in STYLE_FILES:
+            tex = style_file(quality)
+            guard = tex.index("\\ifcsname pyXDSMLabelCommandsLoaded\\endcsname\\else")
+            self.assertLess(guard, tex.index("\\newcommand{\\MultilineComponent}"))
+            self.assertLess(tex.index("\\newcommand{\\MultiColumnComponent}"), tex.rindex("\\fi"))
+
+    def test_precompile_preamble(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+
+        cache_home = os.path.join(self.tempdir, "cache")
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": cache_home, "LOCALAPPDATA": cache_home}):
+            x.write("fmt_test", precompile_preamble=True)
+            self.assertTrue(os.path.isfile("fmt_test.pdf"))
+            fmt = x._preamble_format()
+            self.assertTrue(fmt.startswith(os.path.join(cache_home, "pyxdsm", "formats")))
+            self.assertTrue(os.path.isfile(fmt + ".fmt"))
+
+            # other optional packages need another format
+            self.assertNotEqual(XDSM(use_sfmath=False)._preamble_format(), fmt)
+
+    def test_precompile_preamble_fallback(self):
+        run = subprocess.run
+
+        def no_format(command, **kwargs):
+            if "-ini" in command:
+                raise subprocess.CalledProcessError(1, command)
+            # the document is compiled without a format
+            self.assertFalse(any(arg.startswith("-fmt") for arg in command))
+            return run(command, **kwargs)
+
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        cache_home = os.path.join(self.tempdir, "cache")
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": cache_home, "LOCALAPPDATA": cache_home}):
+            with mock.patch("pyxdsm.latex.subprocess.run", side_effect=no_format):
+                x.write("fmt_test", precompile_preamble=True)
+        self.assertTrue(os.path.isfile("fmt_test.pdf"))
+
+    def test_engine(self):
+        commands = []
+        log_text = ["! TeX capacity exceeded, sorry [main memory size=5000000]."]
+
+        def fake_engine(command, **kwargs):
+            # pdflatex runs out of memory, the other engines succeed
+            commands.append(command[0])
+            (outdir,) = [arg.split("=", 1)[1] for arg in command if arg.startswith("-output-directory=")]
+            base_fp = os.path.join(outdir, command[-1][: -len(".tex")])
+            if command[0] == "pdflatex":
+                with open(base_fp + ".log", "w") as f:
+                    f.write(log_text[0])
+                raise subprocess.CalledProcessError(1, command)
+            with open(base_fp + ".pdf", "w") as f:
+                f.write("%PDF")
+
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        with mock.patch("pyxdsm.latex.subprocess.run", side_effect=fake_engine):
+            with self.assertRaisesRegex(ValueError, '"latex"'):
+                x.write("engine", engine="latex")
+
+            self.assertEqual(x.write("engine", quiet=True), CompileResult("lualatex", True, None))
+            self.assertEqual(commands, ["pdflatex", "lualatex"])
+            self.assertTrue(os.path.isfile("engine.pdf"))
+            self.assertFalse(os.path.exists("engine.log"))
+
+            commands.clear()
+            self.assertEqual(x.write("engine", engine="xelatex"), CompileResult("xelatex", False, None))
+            self.assertEqual(commands, ["xelatex"])
+            self.assertIsNone(x.write("engine", build=False))
+
+            # other errors are not retried
+            commands.clear()
+            log_text[0] = "! Undefined control sequence."
+            with self.assertRaises(subprocess.CalledProcessError):
+                x.write("engine")
+            self.assertEqual(commands, ["pdflatex"])
+
+            J = TotalJacobian()
+            J.add_input("a", "a")
+            J.add_output("f", "f")
+            J.connect("a", "f", "df/da")
+            self.assertEqual(J.write("jac", engine="lualatex"), CompileResult("lualatex", False, None))
+            self.assertTrue(os.path.isfile("jac.pdf"))
+            self.assertFalse(os.path.exists("jac.tex"))
+
+            # the pages of the variants are split with the engine that compiled the document
+            x.add_system("A", FUNC, "A")
+            with mock.patch.dict(sys.modules, {"pypdf": None}):
+                commands.clear()
+                _, result = x.render_variants({"a": {"A"}, "b": set()}, "variants", engine="xelatex")
+                self.assertEqual(result, CompileResult("xelatex", False, None))
+                self.assertEqual(commands, ["xelatex"] * 3)
+
+                log_text[0] = "! TeX capacity exceeded, sorry [main memory size=5000000]."
+                commands.clear()
+                _, result = x.render_variants({"a": {"A"}, "b": set()}, "variants")
+                self.assertEqual(result, CompileResult("lualatex", True, None))
+                self.assertEqual(commands, ["pdflatex", "lualatex", "lualatex", "lualatex"])
+            self.assertTrue(os.path.isfile("variants_b.pdf"))
+
+    def test_build_report(self):
+        x = XDSM()
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("A", FUNC, "A")
+        x.add_system("B", FUNC, "B")
+        x.connect("opt", "A", "x")
+        x.connect("A", "B", "y")
+        x.add_input("A", "x_0")
+        x.add_output("B", "y^*", side=LEFT)
+        x.add_process(["opt", "A", "B", "opt"])
+
+        reports = []
+        result = x.write("report", quiet=True, profile=reports.append)
+        (report,) = reports
+        self.assertEqual(set(report.stages), {"node_grid", "edges", "process", "io", "compile"})
+        self.assertEqual(report.sizes, {ext: os.path.getsize("report" + ext) for ext in (".tikz", ".tex", ".pdf")})
+        self.assertEqual((report.cells, report.edges, report.processes), (7, 6, 1))
+        self.assertIs(report.compile, result)
+        # the log is parsed before it is cleaned up
+        self.assertFalse(os.path.exists("report.log"))
+        self.assertIn("main_memory", result.memory)
+
+        # profiling writes the same files
+        with open("report.tikz") as f:
+            self.assertEqual(f.read(), x.to_tikz())
+
+        x.write("report", build=False, processes=False, profile=reports.append)
+        self.assertNotIn("compile", reports[1].stages)
+        self.assertNotIn(".pdf", reports[1].sizes)
+        self.assertEqual(reports[1].processes, 0)
+
+    def test_parse_tex_memory(self):
+        with open("test.log", "w") as f:
+            f.write(
+                "Here is how much of TeX's memory you used:\n"
+                " 21334 strings out of 478287\n"
+                " 448364 string characters out of 5849352\n"
+                " 1234567 words of memory out of 5000000\n"
+                " 38520 multiletter control sequences out of 15000+600000\n"
+                " 558832 words of font info for 43 fonts, out of 8000000 for 9000\n"
+                " 84i,14n,89p,646b,1151s stack positions out of 10000i,1000n,20000p,200000b,200000s\n"
+            )
+        memory = latex.parse_tex_memory("test.log")
+        self.assertEqual(memory["main_memory"], (1234567, 5000000))
+        self.assertEqual(memory["strings"], (21334, 478287))
+        self.assertEqual(memory["control_sequences"], (38520, 615000))
+        self.assertEqual(memory["save_stack"], (1151, 200000))
+        self.assertEqual(memory["input_stack"], (84, 10000))
+
+        with open("test.log", "w") as f:
+            f.write("! TeX capacity exceeded, sorry [main memory size=5000000].\n")
+        self.assertIsNone(latex.parse_tex_memory("test.log"))
+        self.assertIsNone(latex.parse_tex_memory("missing.log"))
+
+    def test_svg(self):
+        x = XDSM(auto_fade={"connections": "incoming"})
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("A", FUNC, "A", stack=True)
+        x.add_system("B", FUNC, "B", faded=True)
+        x.connect("opt", "A", "x")
+        x.connect("A", "B", r"\mathcal{R}(y_1)")
+        x.add_input("A", "x_0")
+        x.add_output("B", "y^*", side=LEFT)
+        x.add_process(["opt", "A", "B", "opt"], arrow=True)
+
+        x.write_svg("test")
+        # no LaTeX is involved
+        self.assertEqual(sorted(os.listdir(".")), ["test.svg"])
+        with open("test.svg", encoding="utf-8") as f:
+            content = f.read()
+        self.assertEqual(content, x.to_svg())
+
+        ns = {"svg": "http://www.w3.org/2000/svg"}
+        root = ET.fromstring(content)
+        nodes = {g.get("data-node"): g for g in root.iterfind(".//svg:g[@data-node]", ns)}
+        self.assertEqual(set(nodes), {"opt", "A", "B", "opt-A", "A-B", "output_A", "left_output_B"})
+        # the stacked system is drawn three times
+        self.assertEqual(len(nodes["A"]) - len(nodes["B"]), 2)
+        self.assertIn('fill="#8CD17D"', content)
+        self.assertEqual(content.count('marker-end="url(#xdsm-arrow)"'), 3)
+        # the faded system and its incoming connection
+        self.assertEqual(nodes["B"].find("svg:text", ns).get("opacity"), "0.2")
+        self.assertEqual(nodes["A-B"].find("svg:text", ns).get("opacity"), "0.2")
+        self.assertIsNone(nodes["A"].find("svg:text", ns).get("opacity"))
+
+    def test_unknown_system(self):
+        x = XDSM()
+        x.add_systems(["A", "B"], [FUNC, FUNC], ["A", "B"])
+        x.connect("A", "B", "x")
+        del x.systems[1]
+        # the same error as the TikZ output
+        for render in (x.to_tikz, x.to_svg, x.to_html):
+            with self.assertRaisesRegex(ValueError, 'system named "B" but no system'):
+                render()
+
+        x = XDSM()
+        x.add_system("A", FUNC, "A")
+        x.add_output("B", "y", side=RIGHT)
+        for render in (x.to_tikz, x.to_svg, x.to_html):
+            with self.assertRaisesRegex(ValueError, 'system named "B" but no system'):
+                render()
+
+    def test_svg_labels(self):
+        self.assertEqual(svg.label_segments(r"\mathcal{R}(y_1)"), [("R(y", ""), ("1", "sub"), (")", "")])
+        self.assertEqual(svg.label_segments(r"y^*"), [("y", ""), ("*", "super")])
+        self.assertEqual(svg.label_segments(r"\text{Optimizer}"), [("Optimizer", "")])
+        self.assertEqual(svg.label_segments(r"\frac{a}{b}"), [("a/b", "")])
+        self.assertEqual(svg.label_segments(r"\alpha"), [("\u03b1", "")])
+        self.assertEqual(svg.label_lines(["x", "y_2"], None), [[("x", "")], [("y", ""), ("2", "sub")]])
+
+    def test_html(self):
+        x = XDSM(auto_fade={"connections": "incoming"})
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_system("A", FUNC, "A", stack=True)
+        x.add_system("B", FUNC, "B", faded=True)
+        x.connect("opt", "A", "x")
+        x.connect("A", "B", "y</script>")
+        x.add_input("A", "x_0")
+        x.add_output("B", "y^*", side=LEFT)
+        x.add_process(["opt", "A", "B", "opt"])
+
+        x.write_html("test")
+        self.assertEqual(sorted(os.listdir(".")), ["test.html"])
+        with open("test.html", encoding="utf-8") as f:
+            content = f.read()
+        self.assertEqual(content, x.to_html(title="test"))
+        self.assertIn("<title>test</title>", content)
+        # the only closing script tags are the ones of the page
+        self.assertEqual(content.count("</script>"), 2)
+
+        match = re.search(r'<script id="xdsm-data" type="application/json">(.*?)</script>', content)
+        data = json.loads(match.group(1))
+        self.assertEqual(data, json.loads(json.dumps(viewer.diagram_data(x))))
+        self.assertEqual(data["version"], viewer.DATA_VERSION)
+        self.assertEqual(data["systems"], ["opt", "A", "B"])
+        self.assertEqual((data["size"], data["offsets"]), (5, [1, 1]))
+
+        nodes = [tuple(data["nodes"][i : i + 4]) for i in range(0, len(data["nodes"]), 4)]
+        self.assertEqual(len(nodes), 7)
+        # sorted by row, then column
+        self.assertEqual(sorted(nodes), nodes)
+        cells = {(row, col): flags for row, col, _, flags in nodes}
+        self.assertEqual(cells[2, 2], viewer.STACK)
+        self.assertEqual(cells[3, 3], viewer.FADED)
+        self.assertEqual(cells[0, 2], viewer.V_EDGE)
+        self.assertEqual(cells[3, 0], viewer.H_EDGE)
+        self.assertEqual(cells[1, 2], viewer.H_EDGE | viewer.V_EDGE)
+        self.assertEqual(
+            cells[2, 3], viewer.FADED | viewer.H_EDGE | viewer.V_EDGE | viewer.H_EDGE_FADED | viewer.V_EDGE_FADED
+        )
+
+        # the process chain goes through the nodes of the systems
+        (process,) = data["processes"]
+        self.assertEqual(process[:2], [1, 0])
+        self.assertEqual([nodes[i][:2] for i in process[2:]], [(1, 1), (2, 2), (3, 3), (1, 1)])
+
+        # the labels are converted to text segments
+        i_label = data["shapes"][4 * nodes[0][2] + 1]
+        self.assertEqual(data["labels"][i_label], [["x", 0, "0", 1]])
+
+    def test_json(self):
+        x = XDSM(use_sfmath=False, optional_latex_packages=["amsmath"], auto_fade={"connections": "incoming"})
+        x.add_system("opt", OPT, r"\text{Optimizer}")
+        x.add_systems(["A", "B"], FUNC, ["A", ["B", "C"]], stack=[True, False], faded=np.array([False, True]))
+        x.connect("opt", "A", ("x", "z"), label_width=2)
+        x.connect("A", "B", "y")
+        x.update_connection("A", "B", src_faded=True)
+        x.add_input("A", "x_0", faded=True)
+        x.add_output("B", "y^*", side=LEFT)
+        x.add_output("opt", "x^*", side=RIGHT, stack=True)
+        x.add_process(["opt", "A", "B", "opt"], arrow=False)
+
+        json_str = x.to_json()
+        # one record per line
+        self.assertEqual(len(json_str.splitlines()), 1 + 5 * 2 + 3 + 2 + 1 + 2 + 1)
+        data = json.loads(json_str)
+        self.assertEqual((data["format"], data["version"]), ("pyxdsm", JSON_VERSION))
+        self.assertEqual(data["systems"][2], ["B", FUNC, ["B", "C"], 0, 1, None, "B"])
+
+        buf = io.StringIO()
+        x.write_json(buf)
+        self.assertEqual(buf.getvalue(), json_str)
+        buf.seek(0)
+        for y in (XDSM.from_json(json_str), XDSM.read_json(buf)):
+            self.assertEqual(y.to_json(), json_str)
+            self.assertEqual(y.to_tikz(), x.to_tikz())
+            self.assertEqual(y.to_tex(), x.to_tex())
+            self.assertEqual(y.auto_fade, x.auto_fade)
+            self.assertEqual(list(y.connections), list(x.connections))
+            self.assertEqual((y.ins, y.left_outs, y.right_outs), (x.ins, x.left_outs, x.right_outs))
+            # the diagram can still be changed
+            y.connect("B", "A", "z")
+
+        # deterministic, to serve as a cache key
+        self.assertEqual(XDSM.from_json(json_str).to_json(), json_str)
+
+        # another layout of the same JSON is read as a whole
+        pretty = json.dumps(data, indent=2)
+        self.assertEqual(XDSM.read_json(io.StringIO(pretty)).to_json(), json_str)
+
+        with gzip.open("model.json.gz", "wt") as f:
+            x.write_json(f)
+        with gzip.open("model.json.gz", "rt") as f:
+            self.assertEqual(XDSM.read_json(f).to_json(), json_str)
+
+        data["version"] = JSON_VERSION + 1
+        with self.assertRaises(ValueError):
+            XDSM.from_json(json.dumps(data))
+        with self.assertRaises(ValueError):
+            XDSM.read_json(io.StringIO(json_str.replace('"connections"', '"links"')))
+        with self.assertRaises(ValueError):
+            XDSM.read_json(io.StringIO(json_str[: json_str.index('"inputs"')]))
+
     def test_write_outdir(self):
         fname = "test"
 